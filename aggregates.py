@@ -0,0 +1,136 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from rowfilter import RangeCondition, RowsCondition, compileFilter
+
+
+class Aggregates:
+    # the per group statistics a barchart needs. Sums are kept instead of the
+    # means themselves so groups can be combined or extended later
+
+    def __init__(self, categories, count, total, squares):
+        self.categories = categories
+        self.count = count
+        self.total = total
+        self.squares = squares
+
+    def __len__(self):
+        return len(self.categories)
+
+    def mean(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.total / self.count
+
+    def ci(self):
+        # half width of the 95% confidence interval of the mean (normal approximation)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self.total / self.count
+            var = np.maximum(self.squares - self.total * mean, 0) / (self.count - 1)
+            return 1.96 * np.sqrt(var / self.count)
+
+
+def categoryOrder(keys):
+    # the same order as seaborn gives the bars: sorted for numbers, otherwise
+    # in order of appearance
+    categories = pd.unique(keys[pd.notna(keys)])
+    if pd.api.types.is_numeric_dtype(categories):
+        categories = np.sort(categories)
+    return categories
+
+
+def groupAggregates(keys, values):
+    # keys are the x values and values the y values of the rows, every group is
+    # summed in one pass with bincount
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=float)
+    categories = categoryOrder(keys)
+    codes = pd.Categorical(keys, categories=categories).codes
+    valid = (codes >= 0) & ~np.isnan(values)
+    codes = codes[valid]
+    values = values[valid]
+    n = len(categories)
+    return Aggregates(list(categories),
+                      np.bincount(codes, minlength=n).astype(float),
+                      np.bincount(codes, weights=values, minlength=n),
+                      np.bincount(codes, weights=values * values, minlength=n))
+
+
+def combineAggregates(parts):
+    # the aggregates of parts of the rows together, the groups are put in the
+    # order categoryOrder gives for all rows
+    parts = [part for part in parts if len(part) > 0] or parts[:1]
+    if len(parts) == 1:
+        return parts[0]
+    categories = categoryOrder(np.concatenate([np.asarray(part.categories) for part in parts]))
+    index = pd.Index(categories)
+    count = np.zeros(len(categories))
+    total = np.zeros(len(categories))
+    squares = np.zeros(len(categories))
+    for part in parts:
+        at = index.get_indexer(part.categories)
+        count[at] += part.count
+        total[at] += part.total
+        squares[at] += part.squares
+    return Aggregates(list(categories), count, total, squares)
+
+
+def viewAggregates(view, x, y, yRange=None):
+    # the aggregates of the rows of a view with their y value in the range,
+    # summed a block of rows at a time so a mapped dataset is never read at once
+    # when the range keeps few rows they are taken from the sorted index of
+    # the y column, otherwise the rows out of the range are dropped per block
+    if yRange is not None:
+        rowFilter = compileFilter(view.dataset, [RowsCondition(view.rows), RangeCondition(y, *yRange)])
+        if rowFilter.useIndex:
+            view = view.withRows(rowFilter.rows())
+            yRange = None
+    parts = []
+    for _, (keys, values) in view.blocks([x, y]):
+        values = np.asarray(values, dtype=float)
+        if yRange is not None:
+            inRange = (values >= yRange[0]) & (values <= yRange[1])
+            keys = keys[inRange]
+            values = values[inRange]
+        parts.append(groupAggregates(keys, values))
+    if len(parts) == 0:
+        return groupAggregates(np.array([]), np.array([]))
+    return combineAggregates(parts)
+
+
+class AggregateCache:
+    # the aggregates of the latest (x column, y column, filter state) keys
+
+    maxEntries = 32
+
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def get(self, key, compute):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        aggregates = compute()
+        self.put(key, aggregates)
+        return aggregates
+
+    def find(self, key):
+        # the entry of the key, None when it is not in the cache
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, aggregates):
+        self.entries[key] = aggregates
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# shared by all barcharts, so going back to a barchart does not compute them again
+cache = AggregateCache()
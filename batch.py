@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import as_completed
+
+# the vises are Qt widgets, without a display Qt has to draw them off screen
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QEventLoop
+from PyQt5.QtWidgets import QApplication
+
+import workers
+from dataset import Dataset
+from loader import CsvLoader
+from plots import Barchart, Correlogram, CorrelationMatrix, Heatmap
+from redraw import RedrawScheduler
+from rowfilter import ValueCondition, compileFilter
+from selection import SelectionModel
+
+# the vises that can be rendered and the formats they can be written to
+vises = ["Correlogram", "Barchart", "Heatmap", "Correlation"]
+formats = [".png", ".svg", ".pdf"]
+
+# the datasets a worker process has parsed, so the next specs of the same file
+# do not parse it again: path -> ((modification time, size), dataset)
+datasets = {}
+
+
+class BatchHost:
+    # stands in for the Window of main.py: the vises get their data from it and
+    # give it their option widgets, which are not shown here
+
+    def __init__(self, view):
+        self.dataset = view.dataset
+        self.filteredData = view
+        self.scheduler = RedrawScheduler()
+        self.selection = SelectionModel(view.dataset.nrows)
+        self.options = []
+
+    def addOptions(self, options):
+        self.options.extend(options)
+
+    def getDataset(self):
+        return self.dataset
+
+    def setFilteredData(self, view):
+        self.filteredData = view
+
+
+def application():
+    app = QApplication.instance()
+    if app is None:
+        app = QApplication(["batch"])
+    return app
+
+
+def loadDataset(path):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if path in datasets and datasets[path][0] == version:
+        return datasets[path][1]
+    # the loader also uses the cache of parsed files of the gui
+    dataset = Dataset(CsvLoader(path).load())
+    datasets[path] = (version, dataset)
+    return dataset
+
+
+def makeView(dataset, spec):
+    # the rows that have one of the given values in every filtered column, like
+    # selecting values in the list of the table, and only the given columns
+    view = dataset.all()
+    conditions = []
+    for column, values in spec.get("filters", {}).items():
+        if column not in dataset.columns:
+            raise ValueError("Unknown column in filters: %s" % column)
+        index = dataset.valueIndex(column)
+        wanted = set(str(value) for value in values)
+        conditions.append(ValueCondition(column, [value for value in index.values if str(value) in wanted],
+                                         "nan" in wanted))
+    if "filters" in spec:
+        # the most selective filter gives the rows, the others are only checked on those
+        view = view.withRows(compileFilter(dataset, conditions).rows())
+    if "columns" in spec:
+        missing = [column for column in spec["columns"] if column not in dataset.columns]
+        if missing:
+            raise ValueError("Unknown columns: %s" % ", ".join(missing))
+        view = view.withColumns(spec["columns"])
+    return view
+
+
+def chooseOption(comboBox, text, name):
+    if comboBox.findText(text) < 0:
+        raise ValueError("%s can not be %s" % (name, text))
+    comboBox.setCurrentText(text)
+
+
+def setupBarchart(vis, spec):
+    # goes through the same option widgets a user would change
+    if "x" in spec:
+        chooseOption(vis.comboBoxX, spec["x"], "x")
+    if "y" in spec:
+        chooseOption(vis.comboBoxY, spec["y"], "y")
+        vis.minY, vis.maxY = vis.view.columnRange(vis.yAxesValue)
+    if "order" in spec:
+        chooseOption(vis.comboBoxArrangement, spec["order"], "order")
+    if "palette" in spec:
+        vis.cValue = spec["palette"]
+    if "yRange" in spec:
+        vis.minY, vis.maxY = spec["yRange"]
+        vis.changeYRange()
+    else:
+        vis.update()
+
+
+def waitFor(app, vis):
+    # the panels of a correlogram, the averaged rows of a large heatmap and
+    # the correlations come in through the event loop, the file gets the vis from all rows
+    while not vis.complete():
+        app.processEvents(QEventLoop.AllEvents, 50)
+        time.sleep(0.005)
+
+
+def renderSpec(spec):
+    # runs in a worker process: builds the vis of the spec and writes it to its output
+    workers.inProcess = True
+    app = application()
+    view = makeView(loadDataset(spec["file"]), spec)
+    if len(view) == 0:
+        raise ValueError("No rows are left after the filters")
+    host = BatchHost(view)
+    if spec["vis"] == "Correlogram":
+        vis = Correlogram(host, view)
+        waitFor(app, vis)
+    elif spec["vis"] == "Barchart":
+        vis = Barchart(host, view)
+        setupBarchart(vis, spec)
+    elif spec["vis"] == "Heatmap":
+        vis = Heatmap(host, view)
+        if "palette" in spec:
+            vis.setPalette(spec["palette"])
+    else:
+        vis = CorrelationMatrix(host, view)
+        waitFor(app, vis)
+        if "kind" in spec:
+            chooseOption(vis.comboBoxKind, spec["kind"], "kind")
+        if "minCount" in spec:
+            vis.spinBoxMinCount.setValue(spec["minCount"])
+    figure = vis.vis.figure
+    if "size" in spec:
+        figure.set_size_inches(spec["size"])
+    dpi = spec.get("dpi", 100)
+    figure.set_dpi(dpi)
+    # runs the updates the vis left for the next frame, like the heatmap image
+    host.scheduler.flush()
+    if isinstance(vis, Heatmap) and not vis.isEmpty():
+        vis.refine()
+        waitFor(app, vis)
+    os.makedirs(os.path.dirname(os.path.abspath(spec["output"])), exist_ok=True)
+    # the layout is made for the window, the long tick labels can fall outside the figure
+    figure.savefig(spec["output"], dpi=dpi, bbox_inches="tight")
+    vis.deleteLater()
+    return spec["output"]
+
+
+def expandSpecs(specs, files):
+    # specs without a file are made for every csv file given on the command
+    # line, {name} in the output is replaced by the name of the file
+    jobs = []
+    for spec in specs:
+        for path in ([spec["file"]] if "file" in spec else files):
+            job = dict(spec, file=path)
+            name = os.path.splitext(os.path.basename(path))[0]
+            job["output"] = spec["output"].format(name=name, vis=spec["vis"].lower())
+            if job["vis"] not in vises:
+                raise ValueError("Unknown vis %s, use one of %s" % (job["vis"], ", ".join(vises)))
+            if os.path.splitext(job["output"])[1].lower() not in formats:
+                raise ValueError("Unknown format of %s, use one of %s" % (job["output"], ", ".join(formats)))
+            jobs.append(job)
+    # the jobs of a file next to each other, so a worker can reuse the file it parsed
+    jobs.sort(key=lambda job: os.path.abspath(job["file"]))
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the vises to files without a display.")
+    parser.add_argument("specs", help="json file with a list of specs, for example "
+                        '[{"vis": "Barchart", "x": "SARS-Cov-2 exam result", "palette": "muted", '
+                        '"filters": {"Patient age quantile": [10, 11]}, "yRange": [0, 1], '
+                        '"output": "out/{name}-{vis}.png"}]')
+    parser.add_argument("csv", nargs="*", help="csv files for the specs without a file")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    with open(args.specs) as f:
+        specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = [specs]
+    jobs = expandSpecs(specs, args.csv)
+    if args.jobs is not None:
+        workers.workerCount = args.jobs
+    pool = workers.getPool()
+    futures = {pool.submit(renderSpec, job): job for job in jobs}
+    failed = 0
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            print("Wrote", future.result())
+        except Exception as e:
+            failed += 1
+            print("Could not render %s: %s" % (job["output"], e), file=sys.stderr)
+    workers.shutdownPool()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
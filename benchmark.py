@@ -0,0 +1,478 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# the benchmarks run the real vises, Qt draws them off screen
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QEventLoop, QItemSelection, QItemSelectionModel
+from PyQt5.QtWidgets import QApplication
+from matplotlib.backend_bases import MouseEvent
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import loader
+from aggregates import cache as aggregateCache
+from correlation import cache as correlationCache
+from main import Table, Window
+from plots import Barchart, Correlogram, CorrelationMatrix, Heatmap, kdeCache
+from workers import getPool, shutdownPool
+
+# the first columns of dataset.csv, the other columns are made like its lab
+# results (mostly missing numbers) and virus tests (mostly missing text)
+fixedColumns = ["Patient ID", "Patient age quantile", "SARS-Cov-2 exam result",
+                "Patient addmited to regular ward (1=yes, 0=no)",
+                "Patient addmited to semi-intensive unit (1=yes, 0=no)",
+                "Patient addmited to intensive care unit (1=yes, 0=no)"]
+# (kind, fraction of missing values, share of the other columns) like in dataset.csv
+columnKinds = [("number", .99, .45), ("number", .89, .19), ("test", .76, .16), ("test", .99, .20)]
+
+# the timings, in the order they are run
+benchmarks = ["startup", "load", "load cached", "open", "table", "table setOValue", "table select",
+              "barchart", "barchart update", "heatmap", "correlogram", "correlogram onclick",
+              "correlogram onclick again", "brush", "correlation",
+              "correlation filter"]
+
+
+def syntheticFrame(rows, columns, seed=0):
+    rng = np.random.default_rng(seed)
+    data = {
+        fixedColumns[0]: [format(value, "015x") for value in rng.integers(0, 16 ** 15, rows)],
+        fixedColumns[1]: rng.integers(0, 20, rows),
+        fixedColumns[2]: np.where(rng.random(rows) < .1, "positive", "negative"),
+    }
+    for name in fixedColumns[3:]:
+        data[name] = (rng.random(rows) < .02).astype(int)
+    others = max(0, columns - len(fixedColumns))
+    counts = [int(round(share * others)) for kind, missing, share in columnKinds]
+    counts[0] += others - sum(counts)
+    number = 0
+    for (kind, missing, share), count in zip(columnKinds, counts):
+        for i in range(count):
+            number += 1
+            present = rng.random(rows) >= missing
+            if kind == "number":
+                values = np.where(present, rng.standard_normal(rows), np.nan)
+                data["Lab result %d" % number] = values
+            else:
+                values = np.where(rng.random(rows) < .05, "detected", "not_detected").astype(object)
+                values[~present] = None
+                data["Virus test %d" % number] = values
+    return pd.DataFrame(data).iloc[:, :columns]
+
+
+def syntheticCsv(directory, rows, columns):
+    # written like dataset.csv: ; separated, decimal commas and a byte order mark
+    path = os.path.join(directory, "synthetic-%dx%d.csv" % (rows, columns))
+    if not os.path.exists(path):
+        syntheticFrame(rows, columns).to_csv(path, sep=";", decimal=",", index=False, encoding="utf-8-sig")
+    return path
+
+
+# run in a new process by the startup benchmark: imports main and shows an
+# empty window like starting the program does, the heavy modules are left to
+# the prewarm thread that main() starts after the window is shown
+startupScript = """
+import sys
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+import main
+window = main.Window()
+window.show()
+app.processEvents()
+print("shown", flush=True)
+"""
+
+
+def waitUntil(app, condition, timeout=600):
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end:
+            raise TimeoutError("the benchmark did not finish in time")
+        app.processEvents(QEventLoop.AllEvents, 20)
+        time.sleep(0.001)
+
+
+class Bench:
+    # runs the benchmarks of one csv file in a window, like a user would
+
+    def __init__(self, app, window, path, correlogramColumns):
+        self.app = app
+        self.window = window
+        self.path = path
+        self.correlogramColumns = correlogramColumns
+        # the last correlogram is kept for the clicks on it
+        self.lastCorrelogram = None
+
+    def timed(self, function, *args):
+        start = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - start
+
+    def make(self, factory, *args):
+        # the vises are made next to the shown one, their options are removed again by discard
+        shown = list(self.window.visOptions)
+        vis = factory(self.window, *args)
+        vis.benchOptions = [option for option in self.window.visOptions if option not in shown]
+        return vis
+
+    def discard(self, vis):
+        self.window.removeOptions(vis.benchOptions)
+        for option in vis.benchOptions:
+            option.deleteLater()
+        if hasattr(vis, "cancel"):
+            vis.cancel()
+        vis.deleteLater()
+        self.app.processEvents()
+
+    def startup(self):
+        # from starting python until the window is shown, in a process of its own
+        # so the modules this process already imported are imported again
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-c", startupScript], stdout=subprocess.PIPE, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        line = process.stdout.readline()
+        elapsed = time.perf_counter() - start
+        process.wait()
+        if line.strip() != "shown":
+            raise RuntimeError("the window was not shown")
+        return elapsed
+
+    def load(self):
+        shutil.rmtree(loader.cacheDir, ignore_errors=True)
+        return self.timed(lambda: loader.CsvLoader(self.path).load())
+
+    def loadCached(self):
+        loader.CsvLoader(self.path).load()
+        return self.timed(lambda: loader.CsvLoader(self.path).load())
+
+    def open(self):
+        # what openFileNameDialog does after the dialog: load in the background,
+        # then make the dataset and show the table
+        window = self.window
+        start = time.perf_counter()
+        window.loader = loader.CsvLoader(self.path, window)
+        window.loader.loaded.connect(window.setDatabase)
+        dataset = window.dataset
+        window.loader.start()
+        waitUntil(self.app, lambda: window.dataset is not dataset and window.vis is not None)
+        return time.perf_counter() - start
+
+    def construction(self, factory, *args):
+        start = time.perf_counter()
+        vis = self.make(factory, *args)
+        elapsed = time.perf_counter() - start
+        self.discard(vis)
+        return elapsed
+
+    def table(self):
+        return self.construction(Table, self.window.dataset)
+
+    def tableSetOValue(self):
+        # the column with a different value in every row is the slowest to show
+        # the values are listed once their index is made in the worker. The
+        # index of the column was made when the table was shown, it is made
+        # again so every repeat times the same work
+        table = self.window.vis
+        table.comboBox.setCurrentIndex(1)
+        waitUntil(self.app, lambda: table.values.valueIndex is not None)
+        self.window.dataset.valueIndexes.clear()
+        start = time.perf_counter()
+        table.comboBox.setCurrentIndex(0)
+        waitUntil(self.app, lambda: table.values.valueIndex is not None)
+        return time.perf_counter() - start
+
+    def tableSelect(self):
+        # every other row of a block of columns, from the selection to the filtered view
+        table = self.window.vis
+        window = self.window
+        model = table.model
+        selection = QItemSelection()
+        for row in range(0, model.rowCount(), 2):
+            selection.select(model.index(row, 1), model.index(row, min(5, model.columnCount() - 1)))
+        table.vis.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        table.timer.stop()
+        view = window.filteredData
+        start = time.perf_counter()
+        table.select()
+        waitUntil(self.app, lambda: window.filteredData is not view)
+        elapsed = time.perf_counter() - start
+        table.vis.selectionModel().clearSelection()
+        table.timer.stop()
+        window.setFilteredData(window.dataset.all())
+        return elapsed
+
+    def barchart(self):
+        aggregateCache.clear()
+        return self.construction(Barchart, self.window.filteredData)
+
+    def barchartUpdate(self):
+        vis = self.make(Barchart, self.window.filteredData)
+        aggregateCache.clear()
+        elapsed = self.timed(vis.update)
+        self.discard(vis)
+        return elapsed
+
+    def heatmap(self):
+        return self.construction(Heatmap, self.window.filteredData)
+
+    def makeCorrelogram(self):
+        dataset = self.window.dataset
+        numeric = dataset.numericColumns()[:self.correlogramColumns]
+        return self.make(Correlogram, dataset.all().withColumns(numeric))
+
+    def correlogram(self):
+        # until every panel is drawn, the panels are computed in the worker processes.
+        # The kde panels of the repeat before are not taken from the cache
+        kdeCache.clear()
+        start = time.perf_counter()
+        vis = self.makeCorrelogram()
+        waitUntil(self.app, vis.complete)
+        elapsed = time.perf_counter() - start
+        if self.lastCorrelogram is not None:
+            self.discard(self.lastCorrelogram)
+        self.lastCorrelogram = vis
+        return elapsed
+
+    def correlogramOnclick(self, clicks):
+        # the first click makes the point index of the panel, the next ones use it
+        if self.lastCorrelogram is None:
+            self.correlogram()
+        vis = self.lastCorrelogram
+        vis.indexes.clear()
+        kind, x, y, rows, binAbove = vis.tasks[(1, 0)]
+        valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+        ax = vis.figure.axes[1][0]
+        if len(valid):
+            px, py = ax.transData.transform((x[valid[0]], y[valid[0]]))
+        else:
+            # the panel has no points, the click in its middle finds none
+            px, py = (ax.bbox.x0 + ax.bbox.x1) / 2, (ax.bbox.y0 + ax.bbox.y1) / 2
+        event = MouseEvent("button_press_event", vis.vis, px, py, 1)
+        elapsed = 0
+        for i in range(clicks):
+            elapsed = self.timed(vis.onclick, event)
+        return elapsed
+
+    def brush(self):
+        # clicking a bar highlights its rows in every vis that is made, the
+        # correlogram of the clicks above included
+        barchart = self.make(Barchart, self.window.filteredData)
+        heatmap = self.make(Heatmap, self.window.filteredData)
+        self.window.selection.clear()
+        px, py = barchart.ax.transData.transform((0, np.mean(barchart.ax.get_ylim())))
+        elapsed = self.timed(barchart.onclick, MouseEvent("button_press_event", barchart.vis, px, py, 1))
+        if self.window.selection.isEmpty():
+            raise RuntimeError("the click did not select a bar")
+        self.window.selection.clear()
+        self.discard(barchart)
+        self.discard(heatmap)
+        return elapsed
+
+    def completion(self, factory, *args):
+        # until the vis shows all it computes in the worker thread
+        start = time.perf_counter()
+        vis = self.make(factory, *args)
+        waitUntil(self.app, vis.complete)
+        elapsed = time.perf_counter() - start
+        self.discard(vis)
+        return elapsed
+
+    def correlation(self):
+        # every pair of numeric columns from scratch
+        correlationCache.clear()
+        return self.completion(CorrelationMatrix, self.window.filteredData)
+
+    def correlationFilter(self):
+        # after the table filter drops every tenth row only those rows are taken out of the sums
+        correlationCache.clear()
+        view = self.window.filteredData
+        self.completion(CorrelationMatrix, view)
+        rows = view.rowIds()
+        return self.completion(CorrelationMatrix, view.withRows(rows[np.arange(len(rows)) % 10 != 0]))
+
+    def close(self):
+        if self.lastCorrelogram is not None:
+            self.discard(self.lastCorrelogram)
+            self.lastCorrelogram = None
+
+    def run(self, name):
+        if name == "startup":
+            return self.startup()
+        if name == "load":
+            return self.load()
+        if name == "load cached":
+            return self.loadCached()
+        if name == "open":
+            return self.open()
+        if name == "table":
+            return self.table()
+        if name == "table setOValue":
+            return self.tableSetOValue()
+        if name == "table select":
+            return self.tableSelect()
+        if name == "barchart":
+            return self.barchart()
+        if name == "barchart update":
+            return self.barchartUpdate()
+        if name == "heatmap":
+            return self.heatmap()
+        if name == "correlogram":
+            return self.correlogram()
+        if name == "correlogram onclick":
+            return self.correlogramOnclick(1)
+        if name == "correlogram onclick again":
+            return self.correlogramOnclick(2)
+        if name == "brush":
+            return self.brush()
+        if name == "correlation":
+            return self.correlation()
+        if name == "correlation filter":
+            return self.correlationFilter()
+        raise ValueError("Unknown benchmark: %s" % name)
+
+
+def machineInfo():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "numpy": np.__version__, "pandas": pd.__version__,
+            "matplotlib": matplotlib.__version__}
+
+
+def run(args):
+    app = QApplication.instance() or QApplication(["benchmark"])
+    dataDir = args.data_dir or tempfile.mkdtemp(prefix="visualization-benchmark-")
+    os.makedirs(dataDir, exist_ok=True)
+    # the benchmarks use their own cache of parsed files, not the one of the user
+    loader.cacheDir = os.path.join(dataDir, "cache")
+    names = args.only or benchmarks
+    # the worker processes are started before timing, like in a window that is already open
+    getPool().submit(int).result()
+    window = Window()
+    results = []
+    for columns in args.columns:
+        for rows in args.rows:
+            path = syntheticCsv(dataDir, rows, columns)
+            bench = Bench(app, window, path, args.correlogram_columns)
+            bench.open()
+            for name in names:
+                times = [bench.run(name) for i in range(args.repeat)]
+                result = {"name": name, "rows": rows, "columns": columns, "times": times,
+                          "median": float(np.median(times)), "min": float(np.min(times))}
+                results.append(result)
+                print("%-26s %7d rows %4d columns %10.4f s" % (name, rows, columns, result["median"]), flush=True)
+            bench.close()
+    shutdownPool()
+    output = {"machine": machineInfo(),
+              "settings": {"rows": args.rows, "columns": args.columns, "repeat": args.repeat,
+                           "correlogramColumns": args.correlogram_columns},
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=1)
+    print("Saved the results in", args.output)
+    if args.plot:
+        plot(output, args.plot)
+
+
+def resultKey(result):
+    return (result["name"], result["rows"], result["columns"])
+
+
+def compare(args):
+    # the ratio of the median times, above 1 the new run is slower
+    with open(args.base) as f:
+        base = {resultKey(result): result for result in json.load(f)["results"]}
+    with open(args.new) as f:
+        new = json.load(f)["results"]
+    slower = 0
+    print("%-26s %7s %7s %10s %10s %7s" % ("benchmark", "rows", "columns", "base", "new", "ratio"))
+    for result in new:
+        key = resultKey(result)
+        if key not in base:
+            continue
+        ratio = result["median"] / max(base[key]["median"], 1e-9)
+        flag = ""
+        if ratio > args.threshold:
+            flag = "  slower"
+            slower += 1
+        elif ratio < 1 / args.threshold:
+            flag = "  faster"
+        print("%-26s %7d %7d %10.4f %10.4f %7.2f%s" % (key + (base[key]["median"], result["median"], ratio, flag)))
+    return 1 if slower else 0
+
+
+def plot(output, path):
+    # one plot per benchmark with the median time against the number of rows,
+    # one line per number of columns, both axes logarithmic
+    names = [name for name in benchmarks if any(result["name"] == name for result in output["results"])]
+    cols = 3
+    figure = Figure(figsize=(4 * cols, 3 * ((len(names) + cols - 1) // cols)))
+    FigureCanvasAgg(figure)
+    for i, name in enumerate(names):
+        ax = figure.add_subplot((len(names) + cols - 1) // cols, cols, i + 1)
+        results = [result for result in output["results"] if result["name"] == name]
+        for columns in sorted(set(result["columns"] for result in results)):
+            line = sorted((result["rows"], result["median"]) for result in results if result["columns"] == columns)
+            ax.plot(*zip(*line), marker="o", label="%d columns" % columns)
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_title(name)
+        ax.set_xlabel("rows")
+        ax.set_ylabel("seconds")
+        ax.legend(fontsize="small")
+    figure.tight_layout()
+    figure.savefig(path)
+    print("Saved the scaling curves in", path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Times loading, filtering, the vises and their interaction "
+                                                 "on synthetic files shaped like dataset.csv.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runParser = commands.add_parser("run", help="run the benchmarks")
+    runParser.add_argument("--rows", type=int, nargs="+", default=[1000, 5000, 20000])
+    runParser.add_argument("--columns", type=int, nargs="+", default=[20, 111])
+    runParser.add_argument("--repeat", type=int, default=3)
+    runParser.add_argument("--correlogram-columns", type=int, default=4,
+                           help="numeric columns in the correlogram, it has this number squared panels")
+    runParser.add_argument("--only", nargs="+", choices=benchmarks, help="run only these benchmarks")
+    runParser.add_argument("--data-dir", help="where the synthetic files are kept between runs")
+    runParser.add_argument("--output", default="benchmark.json")
+    runParser.add_argument("--plot", help="also save the scaling curves to this image")
+    compareParser = commands.add_parser("compare", help="compare two saved runs")
+    compareParser.add_argument("base")
+    compareParser.add_argument("new")
+    compareParser.add_argument("--threshold", type=float, default=1.2,
+                               help="ratio from which a benchmark counts as slower or faster")
+    plotParser = commands.add_parser("plot", help="save the scaling curves of a saved run")
+    plotParser.add_argument("results")
+    plotParser.add_argument("image")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        return compare(args)
+    else:
+        with open(args.results) as f:
+            plot(json.load(f), args.image)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import pickle
+import time
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+
+from PyQt5.QtGui import QImage, QPainter
+from matplotlib.backend_bases import DrawEvent
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+
+from render import renderFigure
+import tracing
+from tracing import span, traced
+from workers import FutureWatcher, getPool
+
+
+def releaseBuffers(buffers):
+    for memory in buffers:
+        if memory is not None:
+            memory.close()
+            memory.unlink()
+
+
+class OffscreenCanvas(FigureCanvasQTAgg):
+    # a canvas whose figure is drawn by a worker process, so the window keeps
+    # responding while a large figure draws. The worker draws into shared memory
+    # that is shown as a QImage without copying it. The own Agg renderer of the
+    # canvas only holds the overlays of the redraw scheduler, which are drawn on
+    # top of the image. A figure that can not be pickled (or is nested too deep
+    # to pickle) is drawn here as before, and so is a figure that takes longer
+    # to pickle than to draw: pickling happens on the gui thread, for a figure
+    # with many points it would block the window longer than drawing it here
+
+    # pickling for less than this many seconds is not compared to drawing here
+    quickPickle = 0.05
+
+    def __init__(self, figure):
+        super(OffscreenCanvas, self).__init__(figure)
+        # the last image drawn by a worker, None when the figure is drawn here
+        self.image = None
+        # two shared memory blocks, the worker draws into the one that is not shown
+        self.buffers = [None, None]
+        self.front = 0
+        weakref.finalize(self, releaseBuffers, self.buffers)
+        # the render in progress and whether the figure changed since it started
+        self.future = None
+        self.stale = False
+        # how long the last pickle of the figure and the last draw here took
+        self.pickleSeconds = None
+        self.drawSeconds = None
+        self.watcher = FutureWatcher(self)
+        self.watcher.done.connect(self.rendered)
+
+    def backBuffer(self, size):
+        back = 1 - self.front
+        memory = self.buffers[back]
+        if memory is None or memory.size < size:
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+            memory = self.buffers[back] = SharedMemory(create=True, size=size)
+        return back
+
+    def draw(self):
+        # a newer draw replaces the render that did not start yet, one that is
+        # already drawing is finished and then the figure is drawn again.
+        # A hidden canvas (of a cached vis) is drawn when it is shown
+        if not self.isVisible():
+            self.stale = True
+            return
+        if self.future is not None and not self.future.done() and not self.future.cancel():
+            self.stale = True
+            return
+        # the first time pickling takes noticeably long the figure is drawn here
+        # once to know what that costs, then it goes the faster way
+        threshold = self.quickPickle if self.drawSeconds is None else self.drawSeconds
+        if self.pickleSeconds is not None and self.pickleSeconds > threshold:
+            self.drawHere()
+            return
+        start = time.perf_counter()
+        try:
+            with span("pickle figure"):
+                data = pickle.dumps(self.figure)
+        except (pickle.PicklingError, TypeError, AttributeError, RecursionError):
+            self.drawHere()
+            return
+        self.pickleSeconds = time.perf_counter() - start
+        width, height = self.get_width_height(physical=True)
+        back = self.backBuffer(max(1, width * height * 4))
+        self.stale = False
+        self.renderStart = tracing.now()
+        self.future = self.watcher.watch(getPool().submit(renderFigure, data, self.figure.dpi,
+                                                          self.buffers[back].name), back)
+
+    @traced
+    def drawHere(self):
+        self.image = None
+        start = time.perf_counter()
+        super(OffscreenCanvas, self).draw()
+        self.drawSeconds = time.perf_counter() - start
+        self.update()
+
+    @traced
+    def rendered(self, back, future):
+        if future is not self.future:
+            return
+        self.future = None
+        # from asking for the render until it is back on the gui thread
+        tracing.record("render in worker", self.renderStart, tracing.now(), tid=tracing.waitThread)
+        try:
+            width, height = future.result()
+        except Exception:
+            # the worker could not draw it (or the pool is gone)
+            self.drawHere()
+            return
+        self.front = back
+        self.image = QImage(self.buffers[back].buf, width, height, width * 4, QImage.Format_RGBA8888)
+        self.image.setDevicePixelRatio(self.device_pixel_ratio)
+        # the renderer becomes the transparent layer of the overlays, the
+        # draw event lets the redraw scheduler put them on it
+        self.renderer = self.get_renderer()
+        self.renderer.clear()
+        self.callbacks.process("draw_event", DrawEvent("draw_event", self, self.renderer))
+        self.update()
+        if self.stale:
+            self.draw()
+
+    def showEvent(self, event):
+        super(OffscreenCanvas, self).showEvent(event)
+        if self.stale and self.future is None:
+            self.draw()
+
+    @traced
+    def paintEvent(self, event):
+        if self.image is None:
+            super(OffscreenCanvas, self).paintEvent(event)
+            return
+        self._draw_idle()
+        painter = QPainter(self)
+        try:
+            painter.eraseRect(event.rect())
+            painter.drawImage(0, 0, self.image)
+            buffer = self.renderer.buffer_rgba()
+            overlays = QImage(buffer, buffer.shape[1], buffer.shape[0], QImage.Format_RGBA8888)
+            overlays.setDevicePixelRatio(self.device_pixel_ratio)
+            painter.drawImage(0, 0, overlays)
+            self._draw_rect_callback(painter)
+        finally:
+            painter.end()
+
+    def memoryUsage(self):
+        # the pixels of the figure drawn here and of the images the workers draw into
+        width, height = self.get_width_height()
+        return width * height * 4 + sum(memory.size for memory in self.buffers if memory is not None)
+
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+# the parsed columns are stored as small as possible without changing a value:
+# integers in the smallest integer type, floats as float32 when every value fits
+# exactly, text with few distinct values as categoricals (one small code per
+# row instead of a string) and mostly empty numeric columns as sparse arrays
+# that only keep the values that are there
+
+# text columns with at most this many distinct values per row become categoricals
+categoryRatio = 0.5
+# numeric columns with values in less than this part of the rows are stored sparse.
+# A sparse value also needs its row number, so below half it is already smaller,
+# but reading a sparse column makes a dense copy so only really empty ones are worth it
+sparseDensity = 0.25
+
+
+def smallestFloat(values):
+    with np.errstate(over="ignore"):
+        small = values.astype(np.float32)
+    if np.array_equal(small.astype(values.dtype), values, equal_nan=True):
+        return small
+    return values
+
+
+def compactColumn(column):
+    if isinstance(column.dtype, (pd.CategoricalDtype, pd.SparseDtype)) or pd.api.types.is_bool_dtype(column):
+        return column
+    if pd.api.types.is_integer_dtype(column) and isinstance(column.dtype, np.dtype):
+        return pd.to_numeric(column, downcast="integer")
+    if pd.api.types.is_float_dtype(column) and isinstance(column.dtype, np.dtype):
+        values = smallestFloat(column.to_numpy())
+        if len(values) > 0 and column.count() < sparseDensity * len(values):
+            values = pd.arrays.SparseArray(values, fill_value=np.nan)
+        return pd.Series(values, index=column.index, name=column.name)
+    if pd.api.types.is_object_dtype(column) or pd.api.types.is_string_dtype(column):
+        if column.nunique() <= categoryRatio * len(column):
+            return column.astype("category")
+    return column
+
+
+def compactFrame(frame):
+    return pd.DataFrame({col: compactColumn(frame[col]) for col in frame.columns}, index=frame.index)
+
+
+def memoryReport(frame):
+    # the memory of every column, the largest first
+    rows = [(col, str(frame[col].dtype), frame[col].count(), frame[col].memory_usage(index=False, deep=True))
+            for col in frame.columns]
+    report = pd.DataFrame(rows, columns=["column", "type", "values", "bytes"])
+    return report.sort_values("bytes", ascending=False, ignore_index=True)
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+import warnings
+
+import numpy as np
+
+# the rows are summed in blocks of at most this many bytes of values (a block
+# holds the values, their squares and which of them are known), a column is
+# read from the dataset once per block
+blockBytes = 256 * 2 ** 20
+# a column whose sum of squared deviations over the rows of a pair is less than
+# this part of its sum of squares is constant there, what is left is rounding
+constantTolerance = 1e-10
+
+
+class Correlation:
+    # the correlation and covariance of every pair of columns over the rows
+    # where both are known, with the number of those rows
+
+    def __init__(self, columns, corr, cov, count):
+        self.columns = columns
+        self.corr = corr
+        self.cov = cov
+        self.count = count
+
+
+class PairStats:
+    # the sums behind the pairwise complete correlations of some columns of a
+    # dataset. Entry (i, j) of the matrices is summed over the rows where both
+    # column i and column j are known, so no row is dropped because another
+    # column is missing. Sums can be taken away again, so a new filter only
+    # adds and removes the rows that changed. The values are shifted by the
+    # mean of their column first, which keeps the variances exact when the
+    # values are large compared to their spread
+
+    def __init__(self, dataset, columns):
+        self.dataset = dataset
+        self.columns = list(columns)
+        p = len(self.columns)
+        # the mean of the first block of rows is close enough, a mapped dataset
+        # is not read as a whole for it
+        first = slice(0, dataset.blockRows or dataset.nrows)
+        with warnings.catch_warnings():
+            # columns without any value
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.shift = np.nan_to_num(np.array([np.nanmean(np.asarray(dataset.values(col, first), dtype=float))
+                                                 for col in self.columns]))
+        # number of rows where both are known, sum and sum of squares of column
+        # i over those rows and the sum of the products of i and j
+        self.count = np.zeros((p, p))
+        self.sums = np.zeros((p, p))
+        self.squares = np.zeros((p, p))
+        self.products = np.zeros((p, p))
+        # the rows in the sums
+        self.mask = np.zeros(dataset.nrows, dtype=bool)
+
+    def accumulate(self, rows, sign):
+        # adds (sign 1) or takes away (sign -1) the rows, all pairs at once with matrix products
+        p = len(self.columns)
+        block = self.blockSize()
+        for start in range(0, len(rows), block):
+            chunk = rows[start:start + block]
+            values = np.empty((len(chunk), p))
+            for j, col in enumerate(self.columns):
+                values[:, j] = self.dataset.values(col, chunk)
+            values -= self.shift
+            known = ~np.isnan(values)
+            values[~known] = 0
+            known = known.astype(float)
+            sums = np.hstack([known, values, values * values]).T @ known
+            self.count += sign * sums[:p]
+            self.sums += sign * sums[p:2 * p]
+            self.squares += sign * sums[2 * p:]
+            self.products += sign * (values.T @ values)
+
+    def blockSize(self):
+        return max(1, blockBytes // (32 * max(len(self.columns), 1)))
+
+    def update(self, mask):
+        # brings the sums to the rows of the mask, by adding and removing the
+        # rows that changed or, when more rows changed than are left, from scratch.
+        # The row ids are made a block at a time, not for all rows at once
+        changed = np.count_nonzero(mask != self.mask)
+        if changed == 0:
+            return
+        if np.count_nonzero(self.mask & ~mask) > 0 and changed > np.count_nonzero(mask):
+            for matrix in (self.count, self.sums, self.squares, self.products):
+                matrix[:] = 0
+            self.mask[:] = False
+        block = self.blockSize()
+        for start in range(0, len(mask), block):
+            new, old = mask[start:start + block], self.mask[start:start + block]
+            self.accumulate(start + np.flatnonzero(new & ~old), 1)
+            self.accumulate(start + np.flatnonzero(old & ~new), -1)
+        self.mask = mask.copy()
+
+    def result(self):
+        # pairs with less than two rows (or without any spread) have no correlation
+        n = np.round(self.count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # the sums of the deviations from the mean of the rows of the pair
+            products = self.products - self.sums * self.sums.T / n
+            squares = self.squares - self.sums * self.sums / n
+            squares[squares <= constantTolerance * self.squares] = 0
+            cov = products / (n - 1)
+            spread = np.sqrt(squares * squares.T)
+            corr = np.clip(products / spread, -1, 1)
+        cov[n < 2] = np.nan
+        corr[(n < 2) | (spread == 0)] = np.nan
+        return Correlation(self.columns, corr, cov, n.astype(np.int64))
+
+
+class CorrelationCache:
+    # the sums of the latest datasets and column lists. A view of the same
+    # columns, like after a change of the filter of the table, updates them
+    # from the rows that changed
+
+    maxEntries = 4
+
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def get(self, view, columns):
+        key = (view.dataset.token, tuple(columns))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = PairStats(view.dataset, columns)
+            if len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+        stats = self.entries[key]
+        if view.rows is None:
+            mask = np.ones(view.dataset.nrows, dtype=bool)
+        else:
+            mask = np.zeros(view.dataset.nrows, dtype=bool)
+            mask[view.rows] = True
+        stats.update(mask)
+        return stats.result()
+
+    def clear(self):
+        self.entries.clear()
+
+
+# shared by all correlation vises
+cache = CorrelationCache()
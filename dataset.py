@@ -0,0 +1,573 @@
+import contextlib
+import copy
+import hashlib
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from compact import smallestFloat
+from loader import inferColumn
+from tracing import span, traced
+
+
+def copyOnWrite():
+    # with copy on write selecting columns of the dataset shares its memory
+    # until somebody writes to it. pandas 3 always does this, before that it is
+    # only switched on while the dataset takes the loaded frame and a view its
+    # part of it, so importing this module does not change pandas for the rest
+    # of the process
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return contextlib.nullcontext()
+    return pd.option_context("mode.copy_on_write", True)
+
+
+# every dataset gets its own token, so caches can tell datasets apart
+tokens = itertools.count()
+
+
+class Dataset:
+    # the loaded .csv file. All filtering is done with DataViews that only hold
+    # row ids into it. The only change after loading is rows added at the end
+    # by append, the row ids of the rows that are there stay the same
+
+    # the data is in memory, see MappedDataset for files that are too large
+    mapped = False
+    # number of rows read at once when going through all rows, None for all at once
+    blockRows = None
+
+    def __init__(self, frame):
+        # without copy on write this would copy every column of the frame
+        with copyOnWrite():
+            self.frame = frame.reset_index(drop=True)
+        self.nrows = self.frame.shape[0]
+        self.columns = list(self.frame.columns)
+        self.token = next(tokens)
+        # the value and sorted indexes of the columns, made the first time they are needed
+        self.valueIndexes = {}
+        self.sortedIndexes = {}
+        # the columns with room for the rows added to a followed file, made at
+        # the first append, how many rows are written to them and the value
+        # indexes of those rows
+        self.growing = None
+        self.written = self.nrows
+        self.appendedIndexes = {}
+
+    def column(self, name):
+        # the array of a column, for dense numeric columns this is not a copy
+        return self.frame[name].to_numpy()
+
+    def values(self, name, rows):
+        # the values of some rows (row ids or a slice) of a column. The rows
+        # are taken before the values are made plain, so a categorical or
+        # sparse column is not turned into an array of all its rows
+        return np.asarray(self.frame[name].array[rows])
+
+    def numericColumns(self, names=None):
+        frame = self.frame if names is None else self.frame[names]
+        return list(frame.select_dtypes([np.number]).columns)
+
+    def categoryColumns(self):
+        # the columns stored as categories, text with few distinct values
+        return [name for name in self.columns if isinstance(self.frame[name].dtype, pd.CategoricalDtype)]
+
+    def codes(self, name, rows):
+        # the number of the category of some rows of a category column, -1 when missing
+        return self.frame[name].cat.codes.to_numpy()[rows]
+
+    def row(self, rowId):
+        return self.frame.iloc[rowId]
+
+    @traced
+    def prepareAppend(self, text):
+        # runs in the worker thread: writes the rows of a frame of text, as read
+        # from the end of the file, after the rows that are there and gives the
+        # frame and value indexes with them for commitAppend. The rows there
+        # are not changed, so the gui thread can go on reading them meanwhile.
+        # Appends are prepared in the order they are committed
+        if self.growing is None:
+            self.growing = {name: GrowingColumn(self.frame[name]) for name in self.columns}
+        text = text.reset_index(drop=True)
+        start = self.written
+        stop = start + len(text)
+        for name, column in self.growing.items():
+            column.append(text[name], start)
+        frame = pd.DataFrame({name: column.series(stop, name) for name, column in self.growing.items()}, copy=False)
+        # the value indexes of all rows so far get the new rows, of columns
+        # whose type changed they are made again when they are needed
+        indexes = {}
+        for name, index in {**self.valueIndexes, **self.appendedIndexes}.items():
+            if index.nrows == start and not self.growing[name].retyped:
+                indexes[name] = index.extended(frame[name].array[start:stop])
+        self.appendedIndexes = indexes
+        self.written = stop
+        return frame, indexes
+
+    @traced
+    def commitAppend(self, appended):
+        # on the gui thread: shows the rows prepareAppend wrote and gives their
+        # row ids. The dataset gets a new token, so the caches do not give
+        # results without the new rows
+        frame, indexes = appended
+        rows = np.arange(self.nrows, frame.shape[0])
+        self.frame = frame
+        self.nrows = frame.shape[0]
+        self.token = next(tokens)
+        self.valueIndexes = dict(indexes)
+        # the sorted indexes are made again when they are needed
+        self.sortedIndexes = {}
+        return rows
+
+    def append(self, text):
+        # adds the rows of a frame of text and gives their row ids
+        return self.commitAppend(self.prepareAppend(text))
+
+    def all(self):
+        return DataView(self)
+
+    def valueIndex(self, name):
+        # can be made in the worker thread, an index of the rows before an
+        # append is given but not kept
+        if name not in self.valueIndexes:
+            frame = self.frame
+            index = ValueIndex(frame[name])
+            if frame is not self.frame:
+                return index
+            self.valueIndexes[name] = index
+        return self.valueIndexes[name]
+
+    def sortedIndex(self, name):
+        if name not in self.sortedIndexes:
+            with span("SortedIndex", rows=self.nrows):
+                self.sortedIndexes[name] = SortedIndex(self.column(name))
+        return self.sortedIndexes[name]
+
+
+def appendArray(buffer, size, values):
+    # writes values after the first size items of buffer and gives the buffer.
+    # When they do not fit, or need a larger type, a new buffer with room for
+    # as many again is made, so adding items one chunk at a time only copies
+    # every item a few times
+    dtype = np.result_type(buffer, values)
+    if size + len(values) > len(buffer) or dtype != buffer.dtype:
+        grown = np.empty(max(2 * len(buffer), size + len(values)), dtype)
+        grown[:size] = buffer[:size]
+        buffer = grown
+    buffer[size:size + len(values)] = values
+    return buffer
+
+
+def codeType(categories):
+    # the type pandas gives the codes of this many categories, so a categorical
+    # made from the codes does not copy them
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class GrowingColumn:
+    # a column of a followed dataset in a buffer with room for the rows added
+    # later. Only the new rows are parsed and looked at, like inferColumn does
+    # with a whole column: numbers get a larger type when the new ones do not
+    # fit and the column becomes text when they are not numbers, a categorical
+    # gets the new values as categories so the codes of its rows stay the same.
+    # Sparse columns become dense, rows can not be added to a sparse array
+
+    def __init__(self, column):
+        self.categories = None
+        # whether the type changed at the last append
+        self.retyped = False
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            self.kind = "category"
+            self.categories = list(column.cat.categories)
+            self.codes = {value: code for code, value in enumerate(self.categories)}
+            self.buffer = column.cat.codes.to_numpy()
+        elif isinstance(column.dtype, pd.SparseDtype):
+            self.kind = "number"
+            self.buffer = column.sparse.to_dense().to_numpy()
+        elif pd.api.types.is_numeric_dtype(column) and isinstance(column.dtype, np.dtype):
+            self.kind = "number"
+            self.buffer = column.to_numpy()
+        else:
+            self.kind = "text"
+            self.buffer = column.to_numpy(dtype=object, na_value=np.nan)
+
+    def append(self, text, size):
+        # writes the values of the text of the new rows after the first size rows
+        dtype = self.buffer.dtype
+        if self.kind == "number":
+            values = inferColumn(text)
+            if pd.api.types.is_numeric_dtype(values) or values.isna().all():
+                values = pd.to_numeric(values).to_numpy()
+                if values.dtype.kind == "f":
+                    values = smallestFloat(values)
+                else:
+                    values = pd.to_numeric(pd.Series(values), downcast="integer").to_numpy()
+            else:
+                self.kind = "text"
+                self.buffer = self.buffer[:size].astype(object)
+                values = text.to_numpy(dtype=object, na_value=np.nan)
+        elif self.kind == "category":
+            for value in pd.unique(text.dropna()):
+                if value not in self.codes:
+                    self.codes[value] = len(self.categories)
+                    self.categories.append(value)
+            values = np.array([-1 if pd.isna(value) else self.codes[value] for value in text],
+                              dtype=codeType(len(self.categories)))
+        else:
+            values = text.to_numpy(dtype=object, na_value=np.nan)
+        self.buffer = appendArray(self.buffer, size, values)
+        self.retyped = self.kind != "category" and self.buffer.dtype != dtype
+
+    def series(self, size, name):
+        # the first size rows, without copying them
+        values = self.buffer[:size]
+        if self.kind == "category":
+            values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(self.categories), validate=False)
+        return pd.Series(values, name=name, dtype=object if self.kind == "text" else None, copy=False)
+
+
+class MappedDataset:
+    # a .csv file too large for the memory, converted to a file per column by
+    # CsvLoader.convert that is mapped into memory instead of loaded. The same
+    # interface as Dataset without the frame: the vises go through the rows in
+    # blocks of blockRows rows, so only a block of every column is in memory
+    # at a time and the system pages the rest in and out as needed
+
+    mapped = True
+    blockRows = 1 << 16
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.nrows = meta["rows"]
+        self.columns = [info["name"] for info in meta["columns"]]
+        self.kinds = {}
+        # the numbers, the codes of the categories or the offsets of the texts
+        self.arrays = {}
+        self.categories = {}
+        self.texts = {}
+        for i, info in enumerate(meta["columns"]):
+            name = info["name"]
+            self.kinds[name] = info["kind"]
+            self.arrays[name] = np.load(os.path.join(directory, "%d.npy" % i), mmap_mode="r")
+            if info["kind"] == "category":
+                self.categories[name] = np.array(info["categories"] + [np.nan], dtype=object)
+            elif info["kind"] == "text":
+                path = os.path.join(directory, "%d.txt" % i)
+                # an empty file can not be mapped
+                self.texts[name] = (np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) > 0
+                                    else np.zeros(0, dtype=np.uint8))
+        self.token = next(tokens)
+        self.valueIndexes = {}
+
+    def column(self, name):
+        # only a column of numbers is mapped as it is, the others are decoded as a whole
+        if self.kinds[name] == "number":
+            return self.arrays[name]
+        return self.values(name, slice(None))
+
+    def values(self, name, rows):
+        # the values of some rows (row ids or a slice) of a column, read from disk
+        kind = self.kinds[name]
+        if kind == "number":
+            return np.asarray(self.arrays[name][rows])
+        if kind == "category":
+            # code -1 is the nan at the end of the categories
+            return self.categories[name][self.arrays[name][rows]]
+        offsets = self.arrays[name]
+        data = self.texts[name]
+        if isinstance(rows, slice) and rows.indices(self.nrows)[2] == 1:
+            # the bytes of a block of rows are next to each other, they are read
+            # and decoded at once and only split into the rows after that
+            start, stop, _ = rows.indices(self.nrows)
+            bounds = np.asarray(offsets[start:max(start, stop) + 1])
+            text = data[bounds[0]:bounds[-1]].tobytes()
+            if text.isascii():
+                text = text.decode("ascii")
+                return np.array([text[first:last] if last > first else np.nan
+                                 for first, last in zip((bounds[:-1] - bounds[0]).tolist(),
+                                                        (bounds[1:] - bounds[0]).tolist())], dtype=object)
+        if isinstance(rows, slice):
+            rows = np.arange(*rows.indices(self.nrows))
+        rows = np.asarray(rows, dtype=np.intp)
+        return np.array([data[start:stop].tobytes().decode("utf-8") if stop > start else np.nan
+                         for start, stop in zip(offsets[rows].tolist(), offsets[rows + 1].tolist())], dtype=object)
+
+    def numericColumns(self, names=None):
+        return [name for name in (self.columns if names is None else names) if self.kinds[name] == "number"]
+
+    def categoryColumns(self):
+        return [name for name in self.columns if self.kinds[name] == "category"]
+
+    def codes(self, name, rows):
+        return np.asarray(self.arrays[name][rows])
+
+    def row(self, rowId):
+        return pd.Series({name: self.values(name, [rowId])[0] for name in self.columns}, dtype=object)
+
+    def all(self):
+        return DataView(self)
+
+    def valueIndex(self, name):
+        if name not in self.valueIndexes:
+            self.valueIndexes[name] = MappedValueIndex(self, name)
+        return self.valueIndexes[name]
+
+    def sortedIndex(self, name):
+        # sorting a column would need all its rows in memory at once, the
+        # ranges of a mapped dataset are found by going through the blocks
+        return None
+
+
+class ValueIndex:
+    # for every distinct value of a column the sorted row ids that have it, so
+    # filtering on values is a union of those row ids instead of a scan.
+    # Values are numbered by first appearance, missing values get number -1.
+    # Rows added to the dataset are not sorted in, extended gives an index
+    # with their numbers after the sorted rows, so it only looks at the new rows
+
+    def __init__(self, column):
+        codes, values = pd.factorize(column, sort=False)
+        self.values = np.asarray(values)
+        self.nrows = len(codes)
+        # the row ids ordered by value, stable so they stay sorted within a value
+        self.order = np.argsort(codes, kind="stable")
+        # the rows of value c are order[starts[c + 1]:starts[c + 2]]
+        self.starts = np.searchsorted(codes[self.order], np.arange(-1, len(self.values) + 1))
+        self.counts = np.diff(self.starts)[1:]
+        self.missing = self.starts[1]
+        # the number of the value of every row added after the sorted ones, and
+        # the values with room for more. Shared by the extended indexes, every
+        # index only reads its own part of them
+        self.sortedRows = self.nrows
+        self.added = np.empty(0, dtype=np.int32)
+        self.valueBuffer = self.values
+        self.numbers = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def rows(self, code):
+        # the sorted rows with the value
+        if code + 2 >= len(self.starts):
+            return self.order[:0]
+        return self.order[self.starts[code + 1]:self.starts[code + 2]]
+
+    def extended(self, column):
+        # the index of the rows of this one and the values of column after them
+        if self.numbers is None:
+            self.numbers = {value: code for code, value in enumerate(self.values)}
+        column = pd.Series(column)
+        missing = column.isna().to_numpy()
+        new = [value for value in pd.unique(column[~missing]) if value not in self.numbers]
+        for value in new:
+            self.numbers[value] = len(self.numbers)
+        codes = np.full(len(column), -1, dtype=np.int32)
+        codes[~missing] = [self.numbers[value] for value in column[~missing]]
+        index = copy.copy(self)
+        index.valueBuffer = appendArray(self.valueBuffer, len(self.values),
+                                        np.asarray(new, dtype=self.valueBuffer.dtype))
+        index.values = index.valueBuffer[:len(self.values) + len(new)]
+        index.added = appendArray(self.added, self.nrows - self.sortedRows, codes)
+        index.nrows = self.nrows + len(column)
+        index.counts = np.bincount(codes[~missing], minlength=len(index.values))
+        index.counts[:len(self.counts)] += self.counts
+        index.missing = self.missing + int(missing.sum())
+        return index
+
+    def mask(self, codes):
+        # the rows having any of the values, as a boolean mask over the dataset
+        mask = np.zeros(self.nrows, dtype=bool)
+        for code in codes:
+            mask[self.rows(code)] = True
+        if self.nrows > self.sortedRows:
+            mask[self.sortedRows:] = np.isin(self.added[:self.nrows - self.sortedRows], codes)
+        return mask
+
+
+class SortedIndex:
+    # the row ids of a numeric column in the order of their values, without
+    # the missing ones. The rows with a value in a range are then a slice of
+    # the order found with two binary searches, instead of comparing every row
+
+    def __init__(self, column):
+        values = np.asarray(column, dtype=float)
+        known = np.flatnonzero(~np.isnan(values))
+        self.order = known[np.argsort(values[known], kind="stable")]
+        self.values = values[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def span(self, low, high):
+        # where the values from low to high (both included) are in the order
+        return np.searchsorted(self.values, low, "left"), np.searchsorted(self.values, high, "right")
+
+    def rows(self, low, high):
+        # the sorted row ids with a value from low to high
+        start, stop = self.span(low, high)
+        return np.sort(self.order[start:stop])
+
+
+class MappedValueIndex:
+    # the distinct values of a column of a mapped dataset and how often they
+    # occur, counted block by block. Keeping the row ids of every value would
+    # take as much memory as the column, so the rows of values are found by
+    # going through the column again. Only the first maxValues distinct
+    # values are listed, a column of measurements can have a value per row
+
+    maxValues = 1000
+
+    def __init__(self, dataset, name):
+        self.dataset = dataset
+        self.name = name
+        self.nrows = dataset.nrows
+        self.missing = 0
+        counts = {}
+        for start in range(0, dataset.nrows, dataset.blockRows):
+            values = pd.Series(dataset.values(name, slice(start, start + dataset.blockRows)))
+            self.missing += int(values.isna().sum())
+            for value, count in values.value_counts(sort=False).items():
+                if value in counts:
+                    counts[value] += count
+                elif len(counts) < self.maxValues:
+                    counts[value] = count
+        self.values = list(counts)
+        self.counts = np.array(list(counts.values()), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.values)
+
+    def mask(self, codes):
+        # the rows having any of the values, as a boolean mask over the dataset
+        wanted = [self.values[code] for code in codes if code >= 0]
+        mask = np.zeros(self.nrows, dtype=bool)
+        for start in range(0, self.nrows, self.dataset.blockRows):
+            values = self.dataset.values(self.name, slice(start, start + self.dataset.blockRows))
+            part = pd.Series(values).isin(wanted).to_numpy()
+            if -1 in codes:
+                part = part | pd.isna(values)
+            mask[start:start + len(values)] = part
+        return mask
+
+
+class DataView:
+    # a selection of rows and columns of a dataset. Nothing is copied until a
+    # view really needs a frame, and then only the selected part is gathered
+
+    def __init__(self, dataset, rows=None, columns=None):
+        self.dataset = dataset
+        # row ids into the dataset or None for all rows
+        self.rows = None if rows is None else np.asarray(rows, dtype=np.intp)
+        # column names or None for all columns
+        self.columns = None if columns is None else list(columns)
+        self._frame = None
+        self._fingerprint = None
+
+    def __len__(self):
+        if self.rows is None:
+            return self.dataset.nrows
+        return len(self.rows)
+
+    def rowIds(self):
+        # every row id of the view, for a view of all rows this makes an array
+        # of all of them, so use rows or parts where None can be handled
+        if self.rows is None:
+            return np.arange(self.dataset.nrows)
+        return self.rows
+
+    def columnNames(self):
+        if self.columns is None:
+            return self.dataset.columns
+        return self.columns
+
+    def select(self, mask):
+        # keep only the rows of this view where the mask (one value per row of
+        # this view) is true. For a view of all rows the positions are the row
+        # ids, so no array of every row id is made
+        mask = np.asarray(mask, dtype=bool)
+        if self.rows is None:
+            return DataView(self.dataset, np.flatnonzero(mask), self.columns)
+        return DataView(self.dataset, self.rows[mask], self.columns)
+
+    def withRows(self, rows):
+        return DataView(self.dataset, rows, self.columns)
+
+    def withColumns(self, columns):
+        return DataView(self.dataset, self.rows, columns)
+
+    def column(self, name):
+        values = self.dataset.column(name)
+        if self.rows is None:
+            return values
+        return values[self.rows]
+
+    def parts(self):
+        # the rows of the view a block of rows at a time for a mapped dataset
+        # and all at once otherwise: a slice of the dataset when the view has
+        # all rows and the row ids otherwise
+        size = self.dataset.blockRows or max(len(self), 1)
+        for start in range(0, len(self), size):
+            if self.rows is None:
+                yield slice(start, min(start + size, len(self)))
+            else:
+                yield self.rows[start:start + size]
+
+    def blocks(self, names):
+        # the row ids and the values of the columns of the view, a block at a time
+        for part in self.parts():
+            rows = np.arange(part.start, part.stop) if isinstance(part, slice) else part
+            yield rows, [self.dataset.values(name, part) for name in names]
+
+    def columnRange(self, name):
+        # the smallest and largest number of a column, nan when it has none
+        low, high = np.inf, -np.inf
+        for _, (values,) in self.blocks([name]):
+            values = np.asarray(values, dtype=float)
+            if np.isnan(values).all():
+                continue
+            low = min(low, np.nanmin(values))
+            high = max(high, np.nanmax(values))
+        if low > high:
+            return np.nan, np.nan
+        return low, high
+
+    def locate(self, rowIds):
+        # the positions in this view of the given sorted row ids and those row
+        # ids, leaving out the ones that are not in it. The rows of a view are
+        # always sorted, so this is a binary search instead of a mask per row
+        rowIds = np.asarray(rowIds, dtype=np.intp)
+        if self.rows is None:
+            return rowIds, rowIds
+        positions = np.searchsorted(self.rows, rowIds)
+        found = positions < len(self.rows)
+        found[found] = self.rows[positions[found]] == rowIds[found]
+        return positions[found], rowIds[found]
+
+    def fingerprint(self):
+        # identifies the selection, two views with the same fingerprint show the same data
+        if self._fingerprint is None:
+            rows = None
+            if self.rows is not None:
+                rows = hashlib.blake2b(self.rows.tobytes(), digest_size=16).hexdigest()
+            columns = None if self.columns is None else tuple(self.columns)
+            self._fingerprint = (self.dataset.token, rows, columns)
+        return self._fingerprint
+
+    def frame(self):
+        # the selection as a frame, the frame is shared so it should not be changed.
+        # A mapped dataset has no frame, its vises read it in blocks instead
+        if self._frame is None:
+            with span("DataView.frame", rows=len(self)), copyOnWrite():
+                frame = self.dataset.frame
+                if self.columns is not None:
+                    frame = frame[self.columns]
+                if self.rows is not None:
+                    frame = frame.take(self.rows)
+                self._frame = frame
+        return self._frame
@@ -0,0 +1,437 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QThread, QTimer, pyqtSignal
+
+from compact import compactFrame
+from tracing import span, traced
+
+# parsed files are stored here as feather files named after the hash of the csv,
+# so opening the same file again does not have to parse it again
+cacheDir = os.path.join(os.path.expanduser("~"), ".cache", "Visualization")
+# bump this when the parsing below changes so old cache files are not used anymore
+cacheVersion = 1
+# the cache is kept below this many bytes, the files and directories used longest ago are removed first
+cacheBytes = 16 * 2 ** 30
+chunkSize = 20000
+# text columns with more distinct values than this are stored as the text itself
+# when a file is mapped, with fewer as a number per row and the list of values
+maxCategories = 1000
+
+
+def fileHash(fileName, size=None):
+    # hash of the content of the file (or its first size bytes), so a renamed
+    # or touched file still hits the cache
+    digest = hashlib.blake2b(digest_size=16)
+    with open(fileName, "rb") as f:
+        left = os.fstat(f.fileno()).st_size if size is None else size
+        while left > 0:
+            block = f.read(min(1 << 20, left))
+            if not block:
+                break
+            digest.update(block)
+            left -= len(block)
+    return digest.hexdigest()
+
+
+class FilePrefix(io.RawIOBase):
+    # the first size bytes of a file. A file that is written to while it is
+    # loaded is loaded as it was when loading started, the follower reads the rest
+
+    def __init__(self, f, size):
+        self.f = f
+        self.left = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.f.read(min(len(buffer), self.left))
+        buffer[:len(data)] = data
+        self.left -= len(data)
+        return len(data)
+
+
+def completeSize(fileName, size):
+    # the first size bytes of the file up to the end of their last complete line.
+    # An export that is still written can stop in the middle of a line, the
+    # follower reads that line once it is complete
+    with open(fileName, "rb") as f:
+        end = size
+        while end > 0:
+            start = max(0, end - (1 << 16))
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def cachePath(key):
+    return os.path.join(cacheDir, "%s-v%d.feather" % (key, cacheVersion))
+
+
+def mappedPath(key):
+    # a directory with a file per column, see CsvLoader.convert
+    return os.path.join(cacheDir, "%s-v%d.columns" % (key, cacheVersion))
+
+
+def sniffSeparator(fileName):
+    # the raw exports use ; as separator (and decimal commas) the cleaned ones use ,
+    with open(fileName, encoding="utf-8", errors="replace") as f:
+        header = f.readline()
+    if header.count(";") > header.count(","):
+        return ";"
+    return ","
+
+
+def inferColumn(column):
+    # every chunk is read as text so the type of a column is decided once, on
+    # the whole column, instead of per chunk. Decimal commas ("0,23") are
+    # accepted for numbers both in the ; files and quoted in the , files
+    try:
+        return pd.to_numeric(column.str.replace(",", ".", regex=False))
+    except (ValueError, TypeError):
+        return column.infer_objects()
+
+
+def parseNumbers(column):
+    # the numbers of a chunk of a column or None when some value is not a number,
+    # the same rules as inferColumn
+    try:
+        return pd.to_numeric(column.str.replace(",", ".", regex=False)).to_numpy(dtype=float)
+    except (ValueError, TypeError):
+        return None
+
+
+def readCache(key):
+    try:
+        database = pd.read_feather(cachePath(key))
+    except (ImportError, OSError, ValueError):
+        return None
+    touchEntry(cachePath(key))
+    return database
+
+
+def touchEntry(path):
+    # marks a cache entry as used now, trimCache removes the ones used longest ago
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def entrySize(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def trimCache(keep):
+    # removes the parsed files and mapped directories of the cache used longest
+    # ago until it fits in cacheBytes, every new version of a growing export
+    # gets an entry of its own. keep is the entry that is used now, it stays
+    try:
+        entries = []
+        for name in os.listdir(cacheDir):
+            path = os.path.join(cacheDir, name)
+            if name.endswith((".feather", ".columns")) and path != keep:
+                entries.append((os.path.getmtime(path), entrySize(path), path))
+        total = entrySize(keep) + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= cacheBytes:
+                break
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+            total -= size
+    except OSError as e:
+        # another process may be cleaning up at the same time
+        print("Could not clean up the cache:", e)
+
+
+def writeCache(key, database):
+    # the cache is only an optimization, when pyarrow is missing or the frame
+    # cannot be stored the file is simply parsed again the next time. It is
+    # written under a name of its own first, the batch workers can parse and
+    # cache the same file at the same time
+    tmpPath = None
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        handle, tmpPath = tempfile.mkstemp(suffix=".tmp", prefix=key + "-", dir=cacheDir)
+        os.close(handle)
+        database.to_feather(tmpPath)
+        os.replace(tmpPath, cachePath(key))
+    except Exception as e:
+        print("Could not cache the parsed file:", e)
+        if tmpPath is not None and os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        return
+    trimCache(cachePath(key))
+
+
+class CsvLoader(QThread):
+
+    # percentage of the file that has been read
+    progress = pyqtSignal(int)
+    # the loaded database
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    # the number of bytes of the file that are loaded, up to the last complete
+    # line when it is opened. A follower goes on from there
+    size = None
+
+    def __init__(self, fileName, parent=None, mapped=False):
+        super(CsvLoader, self).__init__(parent)
+        self.fileName = fileName
+        # files larger than the memory are not loaded but mapped, see loadMapped
+        self.mapped = mapped
+
+    def run(self):
+        try:
+            database = self.loadMapped() if self.mapped else self.load()
+        except (OSError, ValueError, pd.errors.ParserError) as e:
+            self.failed.emit(str(e))
+            return
+        if database is not None:
+            self.loaded.emit(database)
+
+    @traced
+    def load(self):
+        self.size = completeSize(self.fileName, os.path.getsize(self.fileName))
+        with span("fileHash"):
+            key = fileHash(self.fileName, self.size)
+        with span("readCache"):
+            database = readCache(key)
+        if database is None:
+            database = self.parse(key)
+            if database is None:
+                return None
+        # the cache keeps the plain columns, sparse ones can not be stored in it
+        with span("compactFrame"):
+            database = compactFrame(database)
+        self.progress.emit(100)
+        return database
+
+    def parse(self, key):
+        size = max(self.size, 1)
+        chunks = []
+        with open(self.fileName, "rb") as f, span("read_csv"):
+            reader = pd.read_csv(io.BufferedReader(FilePrefix(f, self.size)), sep=sniffSeparator(self.fileName),
+                                 dtype=object, chunksize=chunkSize, encoding="utf-8")
+            for chunk in reader:
+                if self.isInterruptionRequested():
+                    return None
+                chunks.append(chunk)
+                self.progress.emit(min(99, int(100 * f.tell() / size)))
+        if len(chunks) == 0:
+            raise ValueError("The file contains no data")
+        with span("concat"):
+            database = pd.concat(chunks, ignore_index=True)
+        del chunks
+        with span("inferColumn", columns=len(database.columns)):
+            for col in database.columns:
+                database[col] = inferColumn(database[col])
+
+        with span("writeCache"):
+            writeCache(key, database)
+        return database
+
+    @traced
+    def loadMapped(self):
+        # the columns are written once to files next to the cache that are
+        # mapped into memory, only the parts that are read are loaded and the
+        # system can drop them again. Gives a MappedDataset instead of a frame
+        from dataset import MappedDataset
+        with span("fileHash"):
+            key = fileHash(self.fileName)
+        directory = mappedPath(key)
+        if os.path.isdir(directory):
+            touchEntry(directory)
+        else:
+            if not self.convert(directory):
+                return None
+            trimCache(directory)
+        self.progress.emit(100)
+        return MappedDataset(directory)
+
+    def chunks(self):
+        # the file as chunks of text, with how far the file has been read after each
+        with open(self.fileName, "rb") as f:
+            reader = pd.read_csv(f, sep=sniffSeparator(self.fileName), dtype=object,
+                                 chunksize=chunkSize, encoding="utf-8")
+            for chunk in reader:
+                yield chunk, f.tell()
+
+    @traced
+    def convert(self, directory):
+        # reads the file twice, one chunk at a time so it never is in memory as a
+        # whole. The first pass decides the type of every column like inferColumn
+        # does and collects the values of the text columns, the second writes
+        # the columns: numbers as float64, text with few values as int32 codes
+        # into the list of values (-1 when missing) and other text as utf-8
+        # bytes with the offset of every row
+        size = max(os.path.getsize(self.fileName), 1)
+        columns = None
+        nrows = 0
+        with span("scan"):
+            for chunk, position in self.chunks():
+                if self.isInterruptionRequested():
+                    return False
+                if columns is None:
+                    columns = list(chunk.columns)
+                    numeric = dict.fromkeys(columns, True)
+                    categories = {col: {} for col in columns}
+                nrows += len(chunk)
+                for col in columns:
+                    if numeric[col] and parseNumbers(chunk[col]) is None:
+                        numeric[col] = False
+                    if categories[col] is not None:
+                        for value in chunk[col].dropna().unique():
+                            categories[col].setdefault(value, len(categories[col]))
+                        if len(categories[col]) > maxCategories:
+                            categories[col] = None
+                self.progress.emit(min(49, int(50 * position / size)))
+        if columns is None:
+            raise ValueError("The file contains no data")
+
+        os.makedirs(cacheDir, exist_ok=True)
+        # a directory of its own, another process can convert the same file at the same time
+        tmpDirectory = tempfile.mkdtemp(suffix=".tmp", prefix=os.path.basename(directory) + "-", dir=cacheDir)
+        meta = []
+        arrays = []
+        texts = {}
+        for i, col in enumerate(columns):
+            if numeric[col]:
+                kind = "number"
+                arrays.append(np.lib.format.open_memmap(os.path.join(tmpDirectory, "%d.npy" % i), "w+",
+                                                        np.float64, (nrows,)))
+            elif categories[col] is not None:
+                kind = "category"
+                arrays.append(np.lib.format.open_memmap(os.path.join(tmpDirectory, "%d.npy" % i), "w+",
+                                                        np.int32, (nrows,)))
+                categories[col] = pd.Index(list(categories[col]), dtype=object)
+            else:
+                kind = "text"
+                # row r is the bytes offsets[r]:offsets[r + 1], missing values are empty
+                offsets = np.lib.format.open_memmap(os.path.join(tmpDirectory, "%d.npy" % i), "w+",
+                                                    np.int64, (nrows + 1,))
+                offsets[0] = 0
+                arrays.append(offsets)
+                texts[col] = open(os.path.join(tmpDirectory, "%d.txt" % i), "wb")
+            meta.append({"name": col, "kind": kind,
+                         "categories": list(categories[col]) if kind == "category" else None})
+
+        try:
+            with span("write columns", rows=nrows, columns=len(columns)):
+                start = 0
+                for chunk, position in self.chunks():
+                    if self.isInterruptionRequested():
+                        shutil.rmtree(tmpDirectory, ignore_errors=True)
+                        return False
+                    stop = start + len(chunk)
+                    for col, array, info in zip(columns, arrays, meta):
+                        if info["kind"] == "number":
+                            array[start:stop] = parseNumbers(chunk[col])
+                        elif info["kind"] == "category":
+                            array[start:stop] = categories[col].get_indexer(chunk[col])
+                        else:
+                            encoded = [value.encode("utf-8") if isinstance(value, str) else b""
+                                       for value in chunk[col]]
+                            lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+                            array[start + 1:stop + 1] = array[start] + np.cumsum(lengths)
+                            texts[col].write(b"".join(encoded))
+                    start = stop
+                    self.progress.emit(min(99, 50 + int(50 * position / size)))
+        finally:
+            for f in texts.values():
+                f.close()
+        for array in arrays:
+            array.flush()
+        del arrays
+        with open(os.path.join(tmpDirectory, "meta.json"), "w") as f:
+            json.dump({"rows": nrows, "columns": meta}, f)
+        # only a complete directory gets the name that is looked for, when
+        # another process was first its columns are used
+        try:
+            os.replace(tmpDirectory, directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+            shutil.rmtree(tmpDirectory, ignore_errors=True)
+        return True
+
+
+class CsvFollower(QObject):
+    # watches a loaded file and parses the rows written to its end, for
+    # exports that grow while they are open. Only the bytes after the ones
+    # that are loaded are read, up to the last complete line
+
+    # a frame of text with the new rows, in the columns of the file
+    appended = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    # milliseconds to wait after a change, an export writes in many small parts
+    delay = 1000
+
+    def __init__(self, fileName, offset, parent=None):
+        super(CsvFollower, self).__init__(parent)
+        self.fileName = fileName
+        self.offset = offset
+        self.separator = sniffSeparator(fileName)
+        with open(fileName, "rb") as f:
+            self.header = f.readline()
+        self.columns = list(pd.read_csv(io.BytesIO(self.header), sep=self.separator, nrows=0).columns)
+        self.watcher = QFileSystemWatcher([fileName], self)
+        self.watcher.fileChanged.connect(self.changed)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.read)
+
+    def changed(self, path):
+        # a file that is replaced instead of written to is not watched anymore
+        if path not in self.watcher.files() and os.path.exists(path):
+            self.watcher.addPath(path)
+        self.timer.start(self.delay)
+
+    def stop(self):
+        self.timer.stop()
+        self.watcher.removePaths(self.watcher.files())
+
+    @traced
+    def read(self):
+        try:
+            size = os.path.getsize(self.fileName)
+            if size < self.offset:
+                self.stop()
+                self.failed.emit("the file got shorter, open it again to see it")
+                return
+            with open(self.fileName, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+            # the last line may still be written, it is read with the next change
+            end = data.rfind(b"\n") + 1
+            if end == 0:
+                return
+            frame = pd.read_csv(io.BytesIO(self.header + data[:end]), sep=self.separator, dtype=object,
+                                encoding="utf-8")
+        except (OSError, ValueError, pd.errors.ParserError) as e:
+            self.stop()
+            self.failed.emit(str(e))
+            return
+        if list(frame.columns) != self.columns:
+            self.stop()
+            self.failed.emit("the columns of the file changed, open it again to see it")
+            return
+        self.offset += end
+        if len(frame) > 0:
+            self.appended.emit(frame)
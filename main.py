@@ -1,304 +1,218 @@
-from threading import Timer
-
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
-import pandas as pd
+from collections import OrderedDict
+import importlib
+import os
 import sys
-import matplotlib
-matplotlib.use('Qt5Agg')
-
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import seaborn as sns
+import threading
 import numpy as np
 
-class Correlogram(QWidget):
-
-    # the annotation window when a point is selected
-    annot = None
-
-    def __init__(self, parent, database):
-        super(Correlogram, self).__init__()
-        self.parent = parent
-        self.database = database
-
-        # the Visualization itself with scatterplot as the lower section and
-        # kernal density plots as the uper section
-        self.figure = sns.PairGrid(self.database, dropna=True)
-        self.figure.map_upper(sns.kdeplot)
-        self.figure.map_diag(sns.histplot)
-        self.figure.map_lower(sns.scatterplot)
-
-        # put the vis on a canvas in order for it to be shown
-        self.vis = FigureCanvas(self.figure.fig)
-        # on click select a point
-        self.vis.mpl_connect('button_press_event', self.onclick)
-
-        self.layout = QVBoxLayout()
-        self.layout.addWidget(self.vis)
-        self.setLayout(self.layout)
-
-    # on click select a point
-    def onclick(self, event):
-        for y in range(len(self.figure.axes)):
-            for x in range(len(self.figure.axes[y])):
-                # first select the correct plot
-                if self.figure.axes[y][x] == event.inaxes:
-                    # get all data on that axes
-                    data = self.database[[self.figure.axes[len(self.figure.axes)-1][x].get_xlabel(),
-                                          self.figure.axes[y][0].get_ylabel()]].values
-                    # get the point closesed to the click point
-                    idx = np.nanargmin(((data - (event.xdata, event.ydata))**2).sum(axis = -1))
-                    point = data[idx]
-                    eDatabase = self.parent.getDatabase()
-                    fDatabase = eDatabase[ eDatabase[self.figure.axes[len(self.figure.axes)-1][x].get_xlabel()] == point[0] ]
-                    fDatabase = fDatabase[ fDatabase[self.figure.axes[y][0].get_ylabel()] == point[1] ]
-                    if len(fDatabase) > 0:
-                        # get the data of the point
-                        dataPoint = fDatabase.iloc[0,:].dropna()
-                        # give the parent the highlighted point in order for the connection interaction to work
-                        self.parent.setHighlight(dataPoint)
-                        dstring = ""
-                        # put all the data into a string
-                        for col in dataPoint.index:
-                            dstring += col + ": " + str(dataPoint[[col]]) + "\n"
-
-                        # make the annotation
-                        if self.annot is not None:
-                            self.annot.set_visible(False)
-                        self.annot = self.figure.axes[y][x].annotate(dstring,xy=point, ha = 'right',
-                            xytext = (-20, 20), textcoords = 'offset points', va = 'bottom',
-                            bbox = dict(boxstyle = 'round,pad=0.5', fc = 'yellow', alpha = 0.5),
-                            arrowprops = dict(arrowstyle = '->', connectionstyle = 'arc3,rad=0')
-                            )
-                        self.annot.set_visible(True)
-                        # redraw the vis
-                        self.vis.draw()
-
-class Barchart(QWidget):
-    highlight = None
-    xAxesValue = None
-    yAxesValue = None
-    minY = 0
-    maxY = 0
-    cValue = "deep"
-    numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
-    colorSchemes = ["deep", "muted", "bright", "pastel", "dark", "colorblind"]
-
-    def __init__(self, parent, database, highlight):
-        super(Barchart, self).__init__()
-        self.parent = parent
-        self.database = database
-
-        # get all possible attributes for the x axis
-        rowList = []
-        for col in database.columns:
-            rowList.append(col)
-
-        # get all possible attributes for the y axis
-        newdf = database.select_dtypes(include=self.numerics)
-        colList = []
-        for col in newdf.columns:
-            colList.append(col)
-
-        # get min and max value of the y axis
-        self.minY = self.database[colList[0]].min()
-        self.maxY = self.database[colList[0]].max()
-
-        self.minYLabel = QLabel("Set the minimum Y value")
-
-        self.minYslider = QSlider(Qt.Horizontal)
-        self.minYslider.valueChanged[int].connect(self.setMinYValue)
-        self.minYslider.sliderReleased.connect(self.changeYRange)
-        self.minYslider.setMinimum(int(self.minY))
-        self.minYslider.setMaximum(int(self.maxY))
-        self.minYslider.setValue(self.minY)
-
-        self.maxYLabel = QLabel("Set the maximum Y value")
-
-        self.maxYslider = QSlider(Qt.Horizontal)
-        self.maxYslider.valueChanged[int].connect(self.setMaxYValue)
-        self.maxYslider.sliderReleased.connect(self.changeYRange)
-        self.maxYslider.setMinimum(self.minY)
-        self.maxYslider.setMaximum(self.maxY)
-        self.maxYslider.setValue(self.maxY)
-
-        self.orderLabel = QLabel("Change the order of the bars.")
-
-        self.comboBoxArrangement = QComboBox()
-        self.comboBoxArrangement.addItems(["default","ascending","descending"])
-        self.comboBoxArrangement.currentIndexChanged.connect(self.setOValue)
-
-        self.colorEncodingLabel = QLabel("Change the color encoding.")
-
-        self.comboBoxColor = QComboBox()
-        self.comboBoxColor.addItems(self.colorSchemes)
-        self.comboBoxColor.currentIndexChanged.connect(self.setCValue)
-
-        self.boxLabelX = QLabel("Change the x-Axis.")
-
-        self.comboBoxX = QComboBox()
-        self.comboBoxX.addItems(rowList)
-        self.comboBoxX.currentIndexChanged.connect(self.setXValue)
-
-        self.boxLabelY = QLabel("Change the y-Axis.")
-
-        self.comboBoxY = QComboBox()
-        self.comboBoxY.addItems(colList)
-        self.comboBoxY.currentIndexChanged.connect(self.setYValue)
-
-        # setup all vis that should go on the blue screen
-        self.parent.addOptions([self.minYLabel, self.minYslider,
-                                self.maxYLabel, self.maxYslider,
-                                self.orderLabel, self.comboBoxArrangement,
-                                self.colorEncodingLabel, self.comboBoxColor,
-                                self.boxLabelX, self.comboBoxX,
-                                self.boxLabelY, self.comboBoxY])
-
-        self.xAxesValue = self.comboBoxX.currentText()
-        self.yAxesValue = self.comboBoxY.currentText()
-
-        # if something is highlighted take it over
-        if not highlight is None:
-            self.highlight = highlight[self.xAxesValue]
-
-        self.fig = Figure(figsize=(5, 4), dpi=100)
-        self.ax = self.fig.add_subplot(1,1,1)
-        # the rotation of the labels came from https://stackabuse.com/rotate-axis-labels-in-matplotlib/
-        for tick in self.ax.get_xticklabels():
-            tick.set_rotation(90)
-        # make the vis
-        try:
-            sns.barplot(data=self.database, x=self.xAxesValue, y=self.yAxesValue, palette=self.cValue, ax=self.ax)
-        except ValueError:
-            print("Contains no valid data")
-        self.vis = FigureCanvas(self.fig)
-        self.vis.mpl_connect('button_press_event', self.onclick)
-
-        self.layout = QVBoxLayout()
-        self.layout.addWidget(self.vis)
-        self.setLayout(self.layout)
-        self.update()
-
-    def setMinYValue(self, value):
-        self.minY = value
-        if self.minY > self.maxY:
-            self.minY = self.maxY
-            self.minYslider.setValue(self.minY)
-
-    def setMaxYValue(self, value):
-        self.maxY = value
-        if self.minY > self.maxY:
-            self.maxY = self.minY
-            self.maxYslider.setValue(self.maxY)
-
-    def changeYRange(self):
-        # updates the vis based on the new y range
-        self.database = self.parent.getFilteredDatabase()
-        self.database = self.database[self.database[self.yAxesValue] >= self.minY]
-        self.database = self.database[self.database[self.yAxesValue] <= self.maxY]
-        self.update()
-
-    def setOValue(self, state=None):
-        # change the arrangement of the data
-        oValue = self.comboBoxArrangement.currentText()
-        if oValue == "default":
-            self.database = self.parent.getFilteredDatabase()
-        elif oValue == "ascending":
-            self.database.sort_values(by=self.yAxesValue, inplace=True)
-        elif oValue == "descending":
-            self.database.sort_values(by=self.yAxesValue, ascending=False,inplace=True)
-        self.update()
-
-    def setCValue(self, state=None):
-        # set the color palette
-        self.cValue = self.comboBoxColor.currentText()
-        self.update()
-
-    def setXValue(self, state=None):
-        self.xAxesValue = self.comboBoxX.currentText()
-        self.update()
-
-    def setYValue(self, state=None):
-        self.yAxesValue = self.comboBoxY.currentText()
-        self.update()
-
-    def update(self):
-        self.ax.clear()
-        self.ax.set_ylim(self.minY, self.maxY)
-        color_map = ['grey' if value != self.highlight else 'red' for index, value in self.database[self.xAxesValue].items()]
-        try:
-            if self.highlight is None:
-                sns.barplot(data=self.database, x=self.xAxesValue, y=self.yAxesValue, palette=self.cValue, ax=self.ax)
-            else:
-                sns.barplot(data=self.database, x=self.xAxesValue, y=self.yAxesValue, palette=color_map,ax=self.ax)
-        except ValueError:
-            print("Contains no valid data")
-        for tick in self.ax.get_xticklabels():
-            tick.set_rotation(90)
-        self.vis.draw()
-
-    def onclick(self, event):
-        if event is not None:
-            idx = round(event.xdata)
-            hl = self.database[self.xAxesValue].dropna().unique()
-            if not hl is None:
-                hl = hl[idx]
-                if self.highlight == hl:
-                    self.highlight = None
-                else:
-                    self.highlight = hl
-                    self.parent.setHighlight(self.highlight)
-                self.update()
-
-class Heatmap(QWidget):
-
-    def __init__(self, parent, database, highlight=None):
-        super(Heatmap, self).__init__()
-        self.parent = parent
-        self.database = database.select_dtypes([np.number])
-        self.fig = Figure(figsize=(5, 4), dpi=100)
-        self.ax = self.fig.add_subplot(1,1,1)
-        # the rotation of the labels came from https://stackabuse.com/rotate-axis-labels-in-matplotlib/
-        for tick in self.ax.get_xticklabels():
-            tick.set_rotation(90)
-        sns.heatmap(data=self.database, ax=self.ax, annot=True)
-        for lab, annot in zip(self.ax.get_yticklabels(), self.ax.texts):
-            text =  lab.get_text()
-            if highlight is not None and text in highlight: # lets highlight row 2
-                # set the properties of the ticklabel
-                lab.set_weight('bold')
-                lab.set_size(20)
-                lab.set_color('purple')
-                # set the properties of the heatmap annot
-                annot.set_weight('bold')
-                annot.set_color('purple')
-                annot.set_size(20)
-        self.vis = FigureCanvas(self.fig)
-        self.layout = QVBoxLayout()
-        self.layout.addWidget(self.vis)
-        self.setLayout(self.layout)
+from redraw import RedrawScheduler
+from selection import SelectionModel
+import tracing
+from tracing import traced
+from viewcache import ViewCache
+from workers import FutureWatcher, getThreadPool, shutdownPool
+
+# pandas, matplotlib and seaborn take seconds to import, so the modules using
+# them are imported in the background once the window is shown (or when they
+# are needed before that)
+heavyModules = ["dataset", "loader", "plots"]
+
+
+def prewarm():
+    for name in heavyModules:
+        importlib.import_module(name)
+
+class DataFrameModel(QAbstractTableModel):
+
+    def __init__(self, database, parent=None):
+        super(DataFrameModel, self).__init__(parent)
+        self.setDatabase(database)
+
+    def setDatabase(self, database):
+        self.beginResetModel()
+        self.columns = list(database.columns)
+        # keep the column arrays themselves, a cell is only looked up and turned
+        # into a string when the view asks for it (so only for the visible cells)
+        self.arrays = [database[col].array for col in self.columns]
+        self.rows = database.shape[0]
+        self.endResetModel()
+
+    def appendRows(self, database):
+        # the rows added at the end are inserted, the view keeps its scroll position and selection
+        if database.shape[0] > self.rows:
+            self.beginInsertRows(QModelIndex(), self.rows, database.shape[0] - 1)
+            self.arrays = [database[col].array for col in self.columns]
+            self.rows = database.shape[0]
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return str(self.arrays[index.column()][index.row()])
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return str(self.columns[section])
+        return str(section + 1)
+
+class PagedModel(DataFrameModel):
+    # the cells of a mapped dataset, read from its files a page of rows at a
+    # time when the view asks for them. Only the latest pages are kept
+
+    pageRows = 1000
+    maxPages = 20
+
+    def setDatabase(self, dataset):
+        self.beginResetModel()
+        self.dataset = dataset
+        self.columns = list(dataset.columns)
+        self.rows = dataset.nrows
+        self.pages = OrderedDict()
+        self.endResetModel()
+
+    def page(self, number):
+        if number in self.pages:
+            self.pages.move_to_end(number)
+        else:
+            rows = slice(number * self.pageRows, (number + 1) * self.pageRows)
+            self.pages[number] = [self.dataset.values(col, rows) for col in self.columns]
+            if len(self.pages) > self.maxPages:
+                self.pages.popitem(last=False)
+        return self.pages[number]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return str(self.page(index.row() // self.pageRows)[index.column()][index.row() % self.pageRows])
+        return None
+
+class ValueListModel(QAbstractListModel):
+    # the distinct values of a column with how often they occur, read from its
+    # value index when the list shows them. The missing values come first when
+    # there are any. None is an empty list
+
+    def __init__(self, index=None, parent=None):
+        super(ValueListModel, self).__init__(parent)
+        self.setIndex(index)
+
+    def setIndex(self, index):
+        self.beginResetModel()
+        self.valueIndex = index
+        self.missing = index is not None and index.missing > 0
+        self.shown = 0 if index is None else len(index)
+        self.endResetModel()
+
+    def grow(self, index):
+        # rows were added: values keep their number, a first missing value and
+        # new values are inserted so the selected values stay selected
+        if index.missing > 0 and not self.missing:
+            self.beginInsertRows(QModelIndex(), 0, 0)
+            self.missing = True
+            self.endInsertRows()
+        shown = len(index)
+        if shown > self.shown:
+            first = self.rowCount()
+            self.beginInsertRows(QModelIndex(), first, first + shown - self.shown - 1)
+            self.valueIndex = index
+            self.shown = shown
+            self.endInsertRows()
+        self.valueIndex = index
+        if self.rowCount() > 0:
+            self.dataChanged.emit(self.createIndex(0, 0), self.createIndex(self.rowCount() - 1, 0))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.shown + self.missing
+
+    def code(self, row):
+        # the number of the value in the value index, -1 for the missing values
+        return row - self.missing
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            code = self.code(index.row())
+            if code < 0:
+                return "nan (" + str(self.valueIndex.missing) + ")"
+            return str(self.valueIndex.values[code]) + " (" + str(self.valueIndex.counts[code]) + ")"
+        return None
+
+def rangeIds(firsts, lasts):
+    # the sorted ids in any of the ranges (first and last included). Sorted by
+    # their first id, a range starts a new merged range when it begins after
+    # the last id of all ranges before it. The ids are then made in one pass:
+    # a cumulative sum of steps of one, with a jump at the start of every
+    # merged range. A selection of many rows is never gone through in python
+    firsts = np.asarray(firsts, dtype=np.intp)
+    lasts = np.asarray(lasts, dtype=np.intp)
+    if len(firsts) == 0:
+        return np.array([], dtype=np.intp)
+    order = np.argsort(firsts, kind="stable")
+    firsts = firsts[order]
+    ends = np.maximum.accumulate(lasts[order])
+    starts = np.flatnonzero(np.concatenate([[True], firsts[1:] > ends[:-1] + 1]))
+    mergedFirsts = firsts[starts]
+    mergedLasts = ends[np.append(starts[1:] - 1, len(firsts) - 1)]
+    lengths = mergedLasts - mergedFirsts + 1
+    steps = np.ones(lengths.sum(), dtype=np.intp)
+    steps[np.cumsum(lengths)[:-1]] = mergedFirsts[1:] - mergedLasts[:-1]
+    steps[0] = mergedFirsts[0]
+    return np.cumsum(steps)
+
+@traced
+def selectionFilter(dataset, rows, columns):
+    # runs in the worker thread, the filtered view with its fingerprint ready for the caches
+    view = dataset.all().withRows(rows).withColumns(columns)
+    view.fingerprint()
+    return view
 
 class Table(QWidget):
 
-    timer = None
     prevSelected = None
-
-    def __init__(self, parent, database):
+    # number of the latest selection, results of older selections are dropped
+    selectionNumber = 0
+    # milliseconds to wait after the last selection change
+    selectionDelay = 500
+    # number of values the list lays out at a time
+    valueBatch = 1000
+
+    @traced
+    def __init__(self, parent, dataset):
         super(Table, self).__init__()
         self.parent = parent
-        self.database = database
-        # setup vis
-        self.vis = QTableWidget(self)
-        self.vis.setRowCount(self.database.shape[0])
-        self.vis.setColumnCount(self.database.shape[1])
-        for x in range(self.database.shape[0]):
-            for y in range(self.database.shape[1]):
-                column_name = self.database.columns[y]
-                self.vis.setItem(x,y, QTableWidgetItem(str(self.database.loc[x,column_name])))
-        self.vis.setHorizontalHeaderLabels(self.database.columns)
-        self.vis.itemSelectionChanged.connect(lambda: self.on_table_click())
+        self.dataset = dataset
+        # setup vis, the model reads the cells straight from the frame of the
+        # dataset or a page at a time from the files of a mapped one
+        if dataset.mapped:
+            self.model = PagedModel(self.dataset, self)
+        else:
+            self.model = DataFrameModel(self.dataset.frame, self)
+        self.vis = QTableView(self)
+        self.vis.setModel(self.model)
+        self.vis.selectionModel().selectionChanged.connect(lambda: self.on_table_click())
+        # selecting is debounced on the gui thread and the filter is made in a worker
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.select)
+        self.watcher = FutureWatcher(self)
+        self.watcher.done.connect(self.selectionDone)
+        # the value index of the chosen attribute is made in the worker as well
+        self.valuesWatcher = FutureWatcher(self)
+        self.valuesWatcher.done.connect(self.valuesDone)
 
         # the data will be filtered everytime you select something so this resets
         # everything
@@ -308,21 +222,29 @@ class Table(QWidget):
         # the thing to select which attribute to filter
         self.comboBox = QComboBox()
         self.comboBox.setStyleSheet("QListWidget {background : white}")
-        self.comboBox.currentIndexChanged.connect(self.setOValue)
 
         # the widget that contains all possible values on which you can filter out
         # these values are the unique values of the selected attribute
-        self.listwidget = QListWidget()
-        for attr in self.database.columns:
+        self.listwidget = QListView()
+        for attr in self.dataset.columns:
             if self.prevSelected is None:
                 self.prevSelected = attr
             self.comboBox.addItem(attr)
+        self.comboBox.currentIndexChanged.connect(self.setOValue)
 
         # code from https://stackoverflow.com/questions/54119933/pyqt5-list-widget-programmatically-select-all-items helped with the multiple selection
-        self.listwidget.setStyleSheet("QListWidget {background : white}")
+        self.listwidget.setStyleSheet("QListView {background : white}")
         self.listwidget.setSelectionMode(QAbstractItemView.MultiSelection)
-        for uni in self.database[self.prevSelected].unique():
-            self.listwidget.addItem(str(uni))
+        # all items have the same height, so the list does not measure every
+        # item, and they are laid out a batch at a time while the window keeps
+        # responding: a column with a value per row has as many items as rows
+        self.listwidget.setUniformItemSizes(True)
+        self.listwidget.setLayoutMode(QListView.Batched)
+        self.listwidget.setBatchSize(self.valueBatch)
+        self.values = ValueListModel(None, self)
+        self.listwidget.setModel(self.values)
+        self.listwidget.selectionModel().selectionChanged.connect(lambda: self.filterValues())
+        self.fillValues()
 
         # update blue screen
         self.parent.addOptions([self.resetBtn, self.comboBox, self.listwidget])
@@ -332,56 +254,138 @@ class Table(QWidget):
         self.setLayout(self.layout)
 
     def on_table_click(self):
-        if self.timer:
-            self.timer.cancel()
-        self.timer = Timer(0.5, self.select, [])
-        self.timer.start()
+        # (re)starts the wait, only the last selection change is used
+        self.timer.start(self.selectionDelay)
 
+    @traced
     def select(self):
-        selectedRows = []
-        selectedColumns=[]
-        for index in self.vis.selectedIndexes():
-            if not index.row() in selectedRows:
-                selectedRows.append(index.row())
-            if not index.column() in selectedColumns:
-                selectedColumns.append(index.column())
+        # the selected rows and columns from the selection ranges
+        ranges = self.vis.selectionModel().selection()
+        rows = rangeIds([r.top() for r in ranges], [r.bottom() for r in ranges])
+        cols = rangeIds([r.left() for r in ranges], [r.right() for r in ranges])
         self.reset()
-        self.parent.setFilteredData(self.database.iloc[selectedRows, selectedColumns])
-
+        # the table shows the entire dataset so the rows of the table are row ids
+        columns = [self.dataset.columns[col] for col in cols]
+        self.selectionNumber += 1
+        future = getThreadPool().submit(selectionFilter, self.parent.getDataset(), rows, columns)
+        self.watcher.watch(future, self.selectionNumber)
+
+    @traced
+    def selectionDone(self, number, future):
+        # back on the gui thread, only the latest selection is used
+        if number == self.selectionNumber:
+            self.parent.setFilteredData(future.result())
+
+    @traced
     def setOValue(self, state=None):
-        #filters based on selection
-        selectedList = []
-        for item in self.listwidget.selectedItems():
-            selectedList.append(item.text())
-        database = self.database[self.database[self.prevSelected].isin(selectedList)].dropna()
-        database = database[database[self.prevSelected].notna()]
-        #self.parent.setFilteredData(self.database)
-        self.listwidget.clear()
-        database = self.parent.getDatabase()
-        for uni in database[self.comboBox.currentText()].unique():
-            self.listwidget.addItem(str(uni))
+        # show the values of the newly chosen attribute
         self.prevSelected = self.comboBox.currentText()
+        self.fillValues()
+
+    def fillValues(self):
+        # the list is empty until the value index of the attribute is made
+        self.setValueIndex(None)
+        future = getThreadPool().submit(self.parent.getDataset().valueIndex, self.prevSelected)
+        self.valuesWatcher.watch(future, self.prevSelected)
+
+    def valuesDone(self, name, future):
+        # an index of an attribute that is not shown anymore or of the rows before an append is dropped
+        try:
+            index = future.result()
+        except Exception as e:
+            print("Could not list the values of %s: %s" % (name, e))
+            return
+        if name == self.prevSelected and index.nrows == self.parent.getDataset().nrows:
+            self.setValueIndex(index)
+
+    def setValueIndex(self, index):
+        # the values of another attribute, the filter of the values shown before stays
+        selection = self.listwidget.selectionModel()
+        selection.blockSignals(True)
+        self.values.setIndex(index)
+        selection.blockSignals(False)
+
+    @traced
+    def appendRows(self, view, rows):
+        # rows were added to the dataset: the model inserts them and the list
+        # gets the new counts. The values are numbered by first appearance, so
+        # the values there were keep their number and stay selected
+        self.model.appendRows(self.dataset.frame)
+        if self.values.valueIndex is None or self.prevSelected not in self.dataset.valueIndexes:
+            # the index was not made yet or not extended with the new rows (the
+            # type of the column changed), it is made again for all rows
+            self.fillValues()
+            return
+        selection = self.listwidget.selectionModel()
+        selection.blockSignals(True)
+        self.values.grow(self.dataset.valueIndex(self.prevSelected))
+        selection.blockSignals(False)
+
+    @traced
+    def filterValues(self):
+        #filters based on selection, the rows of all selected values together
+        codes = [self.values.code(item.row()) for item in self.listwidget.selectionModel().selectedRows()]
+        dataset = self.parent.getDataset()
+        if len(codes) == 0:
+            self.parent.setFilteredData(dataset.all())
+            return
+        from rowfilter import ValueCondition
+        index = self.values.valueIndex
+        # rows added to a followed file are kept when they have one of the values too
+        rowFilter = ValueCondition(self.prevSelected, [index.values[code] for code in codes if code >= 0], -1 in codes)
+        self.parent.setFilteredData(dataset.all().withRows(rowFilter.rows(dataset)), rowFilter)
+
+    def memoryUsage(self):
+        # the table only keeps references to the columns of the dataset
+        return 0
 
     def reset(self, state=None):
-        self.database = self.parent.getDatabase()
+        self.dataset = self.parent.getDataset()
 
 class Window(QMainWindow):
 
     # current displayed vis
     vis = None
 
-    # entire loaded database
-    database = None
+    # entire loaded dataset, it is shared by all vises
+    dataset = None
 
-    # database filtered by the selection of table vis
+    # view on the dataset filtered by the selection of table vis, and which
+    # rows added to a followed file it keeps (None for none of them)
     filteredData = None
+    rowFilter = None
+
+    # the thread that is loading a .csv file
+    loader = None
+
+    # the loaded file and how many bytes of it are loaded, and the follower
+    # that adds the rows written to it after that
+    fileName = None
+    fileSize = None
+    follower = None
+
+    # the cache key of the shown vis and the option widgets it added
+    currentKey = None
+    visOptions = []
 
-    # highlighted point
-    highlightedIdxs = None
+    # while tracing, spans shorter than this many seconds are not shown in the status bar
+    spanMessageTime = 0.01
+
+    # files larger than this many bytes are mapped from disk instead of loaded into memory
+    mappedSize = 2 ** 30
 
     def __init__(self):
         super(Window, self).__init__()
         self.setWindowTitle("Hello")
+        # all vises redraw through this
+        self.scheduler = RedrawScheduler(self)
+        # the highlighted rows, all vises show them
+        self.selection = SelectionModel(parent=self)
+        # the vises that are not shown
+        self.viewCache = ViewCache()
+        # the rows added to a followed file are written to the dataset in the worker thread
+        self.appendWatcher = FutureWatcher(self)
+        self.appendWatcher.done.connect(self.rowsAppended)
         self.showFullScreen();
 
         self.UiComponents()
@@ -411,6 +415,14 @@ class Window(QMainWindow):
         openAction.setShortcut('Ctrl+O')
         openAction.triggered.connect(self.openFileNameDialog)
 
+        openLargeAction = QAction('Open &large file...', self)
+        openLargeAction.setStatusTip('Read the file from disk while it is shown instead of loading it')
+        openLargeAction.triggered.connect(lambda: self.openFileNameDialog(mapped=True))
+
+        self.followAction = QAction('&Follow file', self, checkable=True)
+        self.followAction.setStatusTip('Add the rows written to the end of the file while it is open')
+        self.followAction.toggled.connect(self.setFollow)
+
         exitAction = QAction('&Exit', self)
         exitAction.setShortcut('Ctrl+Q')
         exitAction.setStatusTip('Exit application')
@@ -428,11 +440,20 @@ class Window(QMainWindow):
         vis4Action = QAction('Table', self)
         vis4Action.triggered.connect(lambda: self.setWidget("Table"))
 
+        vis5Action = QAction('Correlation', self)
+        vis5Action.triggered.connect(lambda: self.setWidget("Correlation"))
+
         self.statusBar()
+        self.progressBar = QProgressBar()
+        self.progressBar.setMaximumWidth(200)
+        self.progressBar.hide()
+        self.statusBar().addPermanentWidget(self.progressBar)
 
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('&File')
         fileMenu.addAction(openAction)
+        fileMenu.addAction(openLargeAction)
+        fileMenu.addAction(self.followAction)
         fileMenu.addAction(exitAction)
 
         visMenu = menubar.addMenu('&Visualization')
@@ -440,6 +461,26 @@ class Window(QMainWindow):
         visMenu.addAction(vis2Action)
         visMenu.addAction(vis3Action)
         visMenu.addAction(vis4Action)
+        visMenu.addAction(vis5Action)
+
+        # timings of the phases of the vises, shown in the status bar and saved as a trace
+        self.traceAction = QAction('Record timings', self, checkable=True)
+        self.traceAction.toggled.connect(self.setTracing)
+        self.traceMemoryAction = QAction('Record memory too (slower)', self, checkable=True)
+        self.traceMemoryAction.toggled.connect(self.setTracing)
+        exportTraceAction = QAction('Export trace...', self)
+        exportTraceAction.triggered.connect(self.exportTrace)
+        clearTraceAction = QAction('Clear trace', self)
+        clearTraceAction.triggered.connect(tracing.clear)
+        memoryAction = QAction('Memory usage', self)
+        memoryAction.triggered.connect(self.showMemoryReport)
+
+        traceMenu = menubar.addMenu('&Tracing')
+        traceMenu.addAction(self.traceAction)
+        traceMenu.addAction(self.traceMemoryAction)
+        traceMenu.addAction(exportTraceAction)
+        traceMenu.addAction(clearTraceAction)
+        traceMenu.addAction(memoryAction)
 
         layout = QHBoxLayout()
         layout.addWidget(self.leftWidget)
@@ -448,59 +489,192 @@ class Window(QMainWindow):
         main.setLayout(layout)
         self.setCentralWidget(main)
 
+    def visKey(self, widget):
+        # the table always shows the whole dataset, the other vises the filtered view
+        if widget == "Table":
+            return (widget, self.dataset.token, None)
+        return (widget, self.dataset.token, self.filteredData.fingerprint())
+
+    @traced
     def setWidget(self, widget):
         # here you can change between vis
-        # for every vis first remove the old vis then add the new
-        if self.database is not None:
-            if widget == "Correlogram":
-                self.removeOptions()
-                if self.vis:
-                    self.rightWidget.layout().removeWidget(self.vis)
-                    self.vis.deleteLater()
-                self.vis = Correlogram(self, self.filteredData.copy())
-                self.rightWidget.layout().addWidget(self.vis)
-            elif widget == "Barchart":
-                self.removeOptions()
-                if self.vis:
-                    self.rightWidget.layout().removeWidget(self.vis)
-                    self.vis.deleteLater()
-                self.vis = Barchart(self, self.filteredData.copy(), self.highlightedIdxs)
-                self.rightWidget.layout().addWidget(self.vis)
-            elif widget == "Heatmap":
-                self.removeOptions()
-                if self.vis:
-                    self.rightWidget.layout().removeWidget(self.vis)
-                    self.vis.deleteLater()
-                self.vis = Heatmap(self, self.filteredData.copy())
-                self.rightWidget.layout().addWidget(self.vis)
+        # for every vis first remove the old vis then add the new, vises that
+        # look the same as before are taken from the cache instead of built again
+        if self.dataset is not None:
+            key = self.visKey(widget)
+            if self.vis is not None and key == self.currentKey:
+                return
+            self.removeVis()
+            cached = self.viewCache.take(key)
+            if cached is not None:
+                self.vis, options = cached
+                self.addOptions(options)
+                for option in options:
+                    option.show()
+                self.vis.show()
             elif widget == "Table":
+                self.vis = Table(self, self.dataset)
+            else:
+                # waits for the background import if it is not done yet
+                from plots import Barchart, Correlogram, CorrelationMatrix, Heatmap
+                if widget == "Correlogram":
+                    self.vis = Correlogram(self, self.filteredData)
+                elif widget == "Barchart":
+                    self.vis = Barchart(self, self.filteredData)
+                elif widget == "Heatmap":
+                    self.vis = Heatmap(self, self.filteredData)
+                elif widget == "Correlation":
+                    self.vis = CorrelationMatrix(self, self.filteredData)
+            self.currentKey = key
+            self.rightWidget.layout().addWidget(self.vis)
+
+    @traced
+    def removeVis(self):
+        # the shown vis goes into the cache if it still shows the current data
+        if self.vis:
+            self.rightWidget.layout().removeWidget(self.vis)
+            if self.currentKey == self.visKey(self.currentKey[0]):
+                options = self.visOptions
+                self.removeOptions(options)
+                self.vis.hide()
+                self.viewCache.put(self.currentKey, self.vis, options, self.vis.memoryUsage())
+            else:
                 self.removeOptions()
-                if self.vis:
-                    self.rightWidget.layout().removeWidget(self.vis)
-                    self.vis.deleteLater()
-                self.vis = Table(self, self.database.copy())
-                self.rightWidget.layout().addWidget(self.vis)
-
-    def openFileNameDialog(self):
-        # opens and loads the .csv file
+                if hasattr(self.vis, "cancel"):
+                    # no need to finish the computations of a vis that is not shown anymore
+                    self.vis.cancel()
+                self.vis.deleteLater()
+            self.vis = None
+            self.currentKey = None
+
+    def openFileNameDialog(self, state=None, mapped=None):
+        # opens and loads the .csv file, large files (or all with mapped) are
+        # converted to files that are read while they are shown
         options = QFileDialog.Options()
         options |= QFileDialog.DontUseNativeDialog
         fileName, _ = QFileDialog.getOpenFileName(self,"QFileDialog.getOpenFileName()", "","CSV Files (*.csv)", options=options)
         if fileName:
-            self.database = pd.read_csv(fileName, sep=",")
-            for col in self.database.columns:
-                self.database[col] = self.database[col].replace(float('nan'), np.nan)
-            self.filteredData = self.database.copy()
-            self.setWidget("Table")
-
-    def setFilteredData(self, database):
-        # used by vises to filter the database
-        self.filteredData = database
+            # the file is parsed in the background, a progress bar is shown meanwhile
+            from loader import CsvLoader
+            if self.loader is not None:
+                self.loader.requestInterruption()
+            if mapped is None:
+                mapped = os.path.getsize(fileName) > self.mappedSize
+            self.loader = CsvLoader(fileName, self, mapped)
+            self.loader.progress.connect(self.progressBar.setValue)
+            self.loader.loaded.connect(self.setDatabase)
+            self.loader.failed.connect(self.loadFailed)
+            self.loader.finished.connect(self.progressBar.hide)
+            self.progressBar.setValue(0)
+            self.progressBar.show()
+            self.statusBar().showMessage("Loading " + fileName)
+            self.loader.start()
+
+    @traced
+    def setDatabase(self, database):
+        # called when the loader is done
+        if self.sender() is not self.loader:
+            return
+        self.statusBar().clearMessage()
+        self.removeVis()
+        self.viewCache.clear()
+        from dataset import Dataset, MappedDataset
+        if isinstance(database, MappedDataset):
+            self.dataset = database
+        else:
+            self.dataset = Dataset(database)
+        self.fileName = self.loader.fileName
+        self.fileSize = self.loader.size
+        self.selection.reset(self.dataset.nrows)
+        self.filteredData = self.dataset.all()
+        self.rowFilter = None
+        self.setWidget("Table")
+        self.setFollow()
+
+    def loadFailed(self, message):
+        if self.sender() is self.loader:
+            self.statusBar().showMessage("Could not load the file: " + message)
+
+    def setFollow(self, state=None):
+        # follows the loaded file while the action is checked, a new file is followed from where it is loaded
+        from loader import CsvFollower
+        if self.follower is not None:
+            self.follower.stop()
+            self.follower.deleteLater()
+            self.follower = None
+        if not self.followAction.isChecked() or self.dataset is None:
+            return
+        if self.dataset.mapped:
+            self.statusBar().showMessage("Only files loaded into memory can be followed")
+            return
+        self.follower = CsvFollower(self.fileName, self.fileSize, self)
+        self.follower.appended.connect(self.appendRows)
+        self.follower.failed.connect(self.followFailed)
+
+    def followFailed(self, message):
+        self.statusBar().showMessage("Stopped following the file: " + message)
+        self.followAction.setChecked(False)
+
+    def appendRows(self, text):
+        # called by the follower with the rows written to the file, they are
+        # written to the columns in the worker thread
+        if self.sender() is not self.follower:
+            return
+        future = getThreadPool().submit(self.dataset.prepareAppend, text)
+        self.appendWatcher.watch(future, self.dataset)
+
+    @traced
+    def rowsAppended(self, dataset, future):
+        # back on the gui thread the dataset shows the new rows. The shown vis
+        # adds them to what it shows, only vises that can not (or whose columns
+        # changed type) are made again. Rows of a file that is not shown anymore are dropped
+        if dataset is not self.dataset:
+            return
+        try:
+            appended = future.result()
+        except Exception as e:
+            self.followFailed(str(e))
+            return
+        numeric = self.dataset.numericColumns()
+        rows = self.dataset.commitAppend(appended)
+        self.selection.grow(self.dataset.nrows)
+        view = self.filteredData
+        if view.rows is None:
+            added = rows
+            view = self.dataset.all().withColumns(view.columns)
+        else:
+            added = rows[self.rowFilter.mask(self.dataset, rows)] if self.rowFilter is not None else rows[:0]
+            view = view.withRows(np.concatenate([view.rows, added]))
+        self.filteredData = view
+        # the cached vises show the rows before, they are not used again
+        self.viewCache.clear()
+        if self.vis is not None:
+            widget = self.currentKey[0]
+            if hasattr(self.vis, "appendRows") and self.dataset.numericColumns() == numeric:
+                self.vis.appendRows(view, added)
+                self.currentKey = self.visKey(widget)
+            else:
+                self.removeVis()
+                self.setWidget(widget)
+        self.statusBar().showMessage("Added %d rows from the file" % len(rows))
+
+    @traced
+    def setFilteredData(self, view, rowFilter=None):
+        # used by vises to filter the database, gets a DataView on the dataset.
+        # rowFilter is the condition of the rows, it tells which rows added to a followed file the view keeps
+        self.filteredData = view
+        self.rowFilter = rowFilter
+        # the cached vises of the other filters stay, going back to a filter takes them
+        # from the cache and the least recently used ones are evicted. Only the vises of
+        # an older version of the dataset are out of date
+        token = self.dataset.token
+        self.viewCache.invalidate(lambda key: key[1] != token or (key[2] is not None and key[2][0] != token))
 
     def addOptions(self, options):
         # used by vises to add their filter settings on the bluescreen
         for option in options:
             self.leftWidget.layout().addWidget(option)
+        self.visOptions = self.visOptions + list(options)
 
     def removeOptions(self, options=None):
         # removes all bluescreen filter settings or only the selected ones
@@ -512,29 +686,76 @@ class Window(QMainWindow):
                 # remove it from the gui
                 widgetToRemove.setParent( None )
                 widgetToRemove.deleteLater()
+            self.visOptions = []
         else:
             for option in options:
                 option.hide()
                 self.leftWidget.layout().removeWidget(option)
+            self.visOptions = [option for option in self.visOptions if option not in options]
 
-    def getDatabase(self):
-        # sometimes the vis need all data back not the filtered
-        return self.database.copy()
-
-    def getFilteredDatabase(self):
-        # when a vis filtered their own database to much
-        return self.filteredData.copy()
-
-    def setHighlight(self, highlight):
-        # used to propegate highlight
-        self.highlightedIdxs = highlight
-
-    def getHighlight(self):
-        # used to propegate highlight
-        return self.highlightedIdxs
+    def setTracing(self, state=None):
+        tracing.stop()
+        if self.traceAction.isChecked():
+            tracing.listener = self.showSpan
+            tracing.start(self.traceMemoryAction.isChecked())
+        else:
+            tracing.listener = None
+
+    def showSpan(self, name, seconds, args):
+        # only the slow phases, painting and small updates would hide them right away
+        if seconds < self.spanMessageTime:
+            return
+        message = "%s took %.1f ms" % (name, seconds * 1000)
+        if "peak bytes" in args:
+            message += ", allocated %.1f MB (peak %.1f MB)" % (args["allocated bytes"] / 1e6, args["peak bytes"] / 1e6)
+        self.statusBar().showMessage(message)
+
+    def exportTrace(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        fileName, _ = QFileDialog.getSaveFileName(self, "Export trace", "trace.json", "Chrome trace (*.json)",
+                                                  options=options)
+        if fileName:
+            tracing.export(fileName)
+            self.statusBar().showMessage("Saved %d spans, open them in ui.perfetto.dev or chrome://tracing"
+                                         % len(tracing.events))
+
+    def showMemoryReport(self):
+        # the memory of every column of the loaded dataset, with the type it is stored as
+        if self.dataset is None:
+            self.statusBar().showMessage("Open a file first")
+            return
+        if self.dataset.mapped:
+            self.statusBar().showMessage("The columns are read from disk when they are needed, they are not kept in memory")
+            return
+        from compact import memoryReport
+        report = memoryReport(self.dataset.frame)
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Memory usage: %.2f MB" % (report["bytes"].sum() / 1e6))
+        table = QTableView()
+        table.setModel(DataFrameModel(report, table))
+        table.resizeColumnsToContents()
+        layout = QVBoxLayout()
+        layout.addWidget(table)
+        dialog.setLayout(layout)
+        dialog.resize(700, 600)
+        dialog.show()
+
+    def getDataset(self):
+        return self.dataset
+
+def main():
+    app = QApplication(sys.argv)
+    app.setStyle('Fusion')
+    app.aboutToQuit.connect(shutdownPool)
+    window = Window()
+    window.show()
+    # the plotting libraries are imported while the window is already there
+    prewarmThread = threading.Thread(target=prewarm, name="prewarm", daemon=True)
+    QTimer.singleShot(0, lambda: prewarmThread.start())
+    return app.exec_()
+
+# the guard is needed because the worker processes import this module again
+if __name__ == "__main__":
+    sys.exit(main())
 
-app = QApplication([])
-app.setStyle('Fusion')
-window = Window()
-window.show()
-app.exec_()
@@ -0,0 +1,274 @@
+import numpy as np
+
+# the statistics behind the panels of the correlogram. These functions run in
+# the worker processes so they only use numpy and get plain arrays, except
+# mappedPanel which reads the columns of a mapped dataset itself.
+# The defaults are the same as the ones of seaborn's kdeplot and histplot
+gridSize = 200
+cut = 3
+kdeLevels = 10
+kdeThresh = 0.05
+# number of data points evaluated at once against the whole kde grid
+kdeChunk = 64
+# number of bins along each axis when a scatter panel is drawn as a density image
+densityBins = 200
+# number of pairs whose binned kde is convolved in one batch of ffts
+kdeBatch = 16
+
+
+def pairValues(x, y, rows):
+    # only the rows where both attributes are known
+    keep = ~(np.isnan(x) | np.isnan(y))
+    return x[keep], y[keep], rows[keep]
+
+
+def kernelCovariance(x, y):
+    # gaussian kernel with scott's rule, the same as scipy's gaussian_kde
+    factor = len(x) ** (-1.0 / 6)
+    return np.cov(np.vstack([x, y])) * factor ** 2
+
+
+def kdeSupport(values, bandwidth):
+    return np.linspace(values.min() - bandwidth * cut, values.max() + bandwidth * cut, gridSize)
+
+
+def quantileToLevel(density, quantiles):
+    # the density values that enclose the given proportion of the mass, so the
+    # contours are drawn at the same iso proportions as seaborn does
+    values = np.sort(density.ravel())[::-1]
+    normalized = np.cumsum(values) / values.sum()
+    idx = np.searchsorted(normalized, 1 - np.asarray(quantiles))
+    return np.take(values, idx, mode="clip")
+
+
+def kdeGrid(x, y):
+    # the kernel covariance and the grid the kde is evaluated on, None when
+    # there is no 2d density
+    if len(x) < 2:
+        return None
+    cov = kernelCovariance(x, y)
+    det = np.linalg.det(cov)
+    if not np.isfinite(det) or det <= 0:
+        # all points on one line, a 2d density does not exist
+        return None
+    return cov, kdeSupport(x, np.sqrt(cov[0, 0])), kdeSupport(y, np.sqrt(cov[1, 1]))
+
+
+def kdeStats(x, y):
+    grid = kdeGrid(x, y)
+    if grid is None:
+        return None
+    cov, gridX, gridY = grid
+    det = np.linalg.det(cov)
+
+    # whiten the grid and the data so the kernel becomes a standard normal
+    whiten = np.linalg.cholesky(np.linalg.inv(cov))
+    xx, yy = np.meshgrid(gridX, gridY)
+    grid = np.column_stack([xx.ravel(), yy.ravel()]) @ whiten
+    data = np.column_stack([x, y]) @ whiten
+    gridNorm = (grid ** 2).sum(axis=1)
+
+    density = np.zeros(len(grid))
+    for start in range(0, len(data), kdeChunk):
+        chunk = data[start:start + kdeChunk]
+        dist = gridNorm[:, None] + (chunk ** 2).sum(axis=1)[None, :] - 2 * grid @ chunk.T
+        density += np.exp(-0.5 * np.maximum(dist, 0)).sum(axis=1)
+    density /= 2 * np.pi * np.sqrt(det) * len(x)
+    density = density.reshape(gridSize, gridSize)
+
+    levels = quantileToLevel(density, np.linspace(kdeThresh, 1, kdeLevels))
+    return {"x": gridX, "y": gridY, "density": density, "levels": levels}
+
+
+def histStats(x):
+    x = x[~np.isnan(x)]
+    if len(x) == 0:
+        return None
+    counts, edges = np.histogram(x, bins=np.histogram_bin_edges(x, "auto"))
+    return {"counts": counts, "edges": edges}
+
+
+def widened(low, high):
+    # a range without width would give no bins
+    return (low, high) if high > low else (low - 0.5, low + 0.5)
+
+
+def densityStats(x, y, xrange=None, yrange=None):
+    # the number of points in every bin of a densityBins x densityBins grid over
+    # the given range (default all points), counts[i, j] is x bin i and y bin j
+    if xrange is None:
+        xrange = (x.min(), x.max()) if len(x) else (0, 1)
+    if yrange is None:
+        yrange = (y.min(), y.max()) if len(y) else (0, 1)
+    xrange = widened(*xrange)
+    yrange = widened(*yrange)
+    counts, xedges, yedges = np.histogram2d(x, y, bins=densityBins, range=[xrange, yrange])
+    return {"counts": counts, "extent": (xedges[0], xedges[-1], yedges[0], yedges[-1])}
+
+
+def scatterStats(x, y, rows, binAbove=None):
+    # above binAbove points the panel is drawn as a density image instead of
+    # markers, then only the bins are sent back and not the points
+    x, y, rows = pairValues(x, y, rows)
+    if binAbove is not None and len(x) > binAbove:
+        return {"density": densityStats(x, y)}
+    return {"x": x, "y": y}
+
+
+def computePanel(kind, x, y, rows, binAbove=None):
+    # kind is "upper" (kde), "diag" (histogram) or "lower" (scatter)
+    if kind == "diag":
+        return histStats(x)
+    if kind == "upper":
+        x, y, rows = pairValues(x, y, rows)
+        return kdeStats(x, y)
+    return scatterStats(x, y, rows, binAbove)
+
+
+def fastSize(size):
+    # the smallest length from size on that has no prime factors above 5, the fft is fastest for those
+    while True:
+        rest = size
+        for factor in (2, 3, 5):
+            while rest % factor == 0:
+                rest //= factor
+        if rest == 1:
+            return size
+        size += 1
+
+
+def binnedKde(counts, gridX, gridY, cov, n):
+    # the gaussian kde from the number of points at every grid point instead of
+    # the points themselves: the counts convolved (through the fft) with the
+    # kernel at every offset between two grid points. counts[..., i, j] is
+    # gridX[..., i], gridY[..., j], leading axes are several pairs at once.
+    # The convolution wraps around, but with 2 * size - 1 points the wrapped
+    # part never reaches the grid points that are kept
+    sizeX, sizeY = counts.shape[-2:]
+    ox = np.arange(-(sizeX - 1), sizeX)[:, None] * (gridX[..., 1] - gridX[..., 0])[..., None, None]
+    oy = np.arange(-(sizeY - 1), sizeY)[None, :] * (gridY[..., 1] - gridY[..., 0])[..., None, None]
+    inverse = np.linalg.inv(cov)
+    kernel = np.exp(-0.5 * (inverse[..., 0, 0, None, None] * ox * ox + 2 * inverse[..., 0, 1, None, None] * ox * oy
+                            + inverse[..., 1, 1, None, None] * oy * oy))
+    kernel /= (2 * np.pi * np.sqrt(np.linalg.det(cov)))[..., None, None]
+    shape = (fastSize(2 * sizeX - 1), fastSize(2 * sizeY - 1))
+    full = np.fft.irfft2(np.fft.rfft2(counts, shape) * np.fft.rfft2(kernel, shape), shape)
+    density = np.maximum(full[..., sizeX - 1:2 * sizeX - 1, sizeY - 1:2 * sizeY - 1], 0)
+    return density / np.asarray(n, dtype=float)[..., None, None]
+
+
+def linearBins(x, y, gridX, gridY):
+    # every point split over the four grid points around it by how close it is
+    # to each, the binned kde is then much closer to the exact one than when
+    # the points count for the closest grid point only. Gives the flat indexes
+    # into a gridSize x gridSize grid and their weights
+    fx = (x - gridX[0]) / (gridX[1] - gridX[0])
+    fy = (y - gridY[0]) / (gridY[1] - gridY[0])
+    ix = np.clip(np.floor(fx).astype(np.intp), 0, gridSize - 2)
+    iy = np.clip(np.floor(fy).astype(np.intp), 0, gridSize - 2)
+    fx -= ix
+    fy -= iy
+    index = ix * gridSize + iy
+    indexes = [index, index + 1, index + gridSize, index + gridSize + 1]
+    weights = [(1 - fx) * (1 - fy), (1 - fx) * fy, fx * (1 - fy), fx * fy]
+    return np.concatenate(indexes), np.concatenate(weights)
+
+
+def kdePanels(pairs):
+    # the kde panels of many (x, y) pairs at once from the points binned on
+    # their grids. All pairs are binned with one bincount and convolved kdeBatch
+    # at a time, instead of evaluating every kernel at every grid point
+    results = [None] * len(pairs)
+    batch = []
+    for k, (x, y) in enumerate(pairs):
+        keep = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[keep], y[keep]
+        grid = kdeGrid(x, y)
+        if grid is not None:
+            batch.append((k, len(x), grid, linearBins(x, y, grid[1], grid[2])))
+    for start in range(0, len(batch), kdeBatch):
+        part = batch[start:start + kdeBatch]
+        cells = gridSize * gridSize
+        indexes = np.concatenate([bins[0] + i * cells for i, (_, _, _, bins) in enumerate(part)])
+        weights = np.concatenate([bins[1] for _, _, _, bins in part])
+        counts = np.bincount(indexes, weights, minlength=len(part) * cells).reshape(len(part), gridSize, gridSize)
+        densities = binnedKde(counts, np.array([grid[1] for _, _, grid, _ in part]),
+                              np.array([grid[2] for _, _, grid, _ in part]),
+                              np.array([grid[0] for _, _, grid, _ in part]), [n for _, n, _, _ in part])
+        for (k, _, (_, gridX, gridY), _), density in zip(part, densities):
+            density = density.T
+            levels = quantileToLevel(density, np.linspace(kdeThresh, 1, kdeLevels))
+            # float32 is precise enough for the contours, the correlogram keeps many of these in its cache
+            results[k] = {"x": gridX, "y": gridY, "density": density.astype(np.float32), "levels": levels}
+    return results
+
+
+def mappedPanel(kind, directory, xName, yName, rowsPath=None):
+    # the statistics of a panel of a mapped dataset (see MappedDataset), the
+    # worker reads the columns itself a block at a time so they are never in
+    # memory as a whole. A first pass finds the range (and the covariance for
+    # the kde), the second bins the points: the histogram has sturges' number
+    # of bins, scatter panels are always a density image and the kde is made
+    # from the points binned on its grid
+    from dataset import DataView, MappedDataset
+    rows = None if rowsPath is None else np.load(rowsPath, mmap_mode="r")
+    view = DataView(MappedDataset(directory), rows)
+    names = [xName] if kind == "diag" else [xName, yName]
+
+    def points():
+        for _, values in view.blocks(names):
+            values = np.column_stack([np.asarray(v, dtype=float) for v in values])
+            yield values[~np.isnan(values).any(axis=1)]
+
+    # count, mean and sum of the products of the deviations, combined block by block
+    n = 0
+    mean = np.zeros(len(names))
+    comoment = np.zeros((len(names), len(names)))
+    low = np.full(len(names), np.inf)
+    high = np.full(len(names), -np.inf)
+    for block in points():
+        if len(block) == 0:
+            continue
+        blockMean = block.mean(axis=0)
+        deviations = block - blockMean
+        delta = blockMean - mean
+        comoment += deviations.T @ deviations + np.outer(delta, delta) * n * len(block) / (n + len(block))
+        mean += delta * len(block) / (n + len(block))
+        n += len(block)
+        low = np.minimum(low, block.min(axis=0))
+        high = np.maximum(high, block.max(axis=0))
+
+    if kind == "diag":
+        if n == 0:
+            return None
+        edges = np.histogram_bin_edges([], int(np.ceil(np.log2(n))) + 1, range=widened(low[0], high[0]))
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        for block in points():
+            counts += np.histogram(block[:, 0], bins=edges)[0]
+        return {"counts": counts, "edges": edges}
+
+    if kind == "lower":
+        xrange = widened(low[0], high[0]) if n else (0, 1)
+        yrange = widened(low[1], high[1]) if n else (0, 1)
+        counts = np.zeros((densityBins, densityBins))
+        for block in points():
+            counts += np.histogram2d(block[:, 0], block[:, 1], bins=densityBins, range=[xrange, yrange])[0]
+        return {"density": {"counts": counts, "extent": (xrange[0], xrange[1], yrange[0], yrange[1])}}
+
+    if n < 2:
+        return None
+    cov = comoment / (n - 1) * n ** (-2.0 / 6)
+    det = np.linalg.det(cov)
+    if not np.isfinite(det) or det <= 0:
+        return None
+    grids = [np.linspace(low[k] - np.sqrt(cov[k, k]) * cut, high[k] + np.sqrt(cov[k, k]) * cut, gridSize)
+             for k in range(2)]
+    # every point counts for the closest grid point
+    edges = [np.concatenate([grid - (grid[1] - grid[0]) / 2, [grid[-1] + (grid[1] - grid[0]) / 2]])
+             for grid in grids]
+    counts = np.zeros((gridSize, gridSize))
+    for block in points():
+        counts += np.histogram2d(block[:, 0], block[:, 1], bins=edges)[0]
+    density = binnedKde(counts, grids[0], grids[1], cov, n).T
+    levels = quantileToLevel(density, np.linspace(kdeThresh, 1, kdeLevels))
+    return {"x": grids[0], "y": grids[1], "density": density, "levels": levels}
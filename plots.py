@@ -0,0 +1,1391 @@
+from PyQt5.QtWidgets import *
+from PyQt5.QtCore import *
+from concurrent.futures import Future
+import os
+import tempfile
+import weakref
+import matplotlib
+matplotlib.use('Qt5Agg')
+import matplotlib.collections
+import matplotlib.pyplot as plt
+
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.colors import LogNorm
+from matplotlib.ticker import FixedFormatter, FixedLocator, MaxNLocator
+from matplotlib.figure import Figure
+from matplotlib.image import AxesImage
+import pandas as pd
+import seaborn as sns
+from seaborn.external import husl
+import numpy as np
+
+from aggregates import AggregateCache, cache as aggregateCache, combineAggregates, viewAggregates
+from canvas import OffscreenCanvas
+from correlation import cache as correlationCache
+from panels import computePanel, densityStats, kdeBatch, kdePanels, mappedPanel, pairValues, widened
+from render import IndexFormatter
+from sampling import stratifiedSample
+from spatial import GridIndex, binnedPoints
+import tracing
+from tracing import span, traced
+from workers import FutureWatcher, getPool, getThreadPool
+
+# the vises that plot with matplotlib and seaborn, these libraries take a few
+# seconds to import so this module is only imported when a plot is needed
+
+# the binned kde panels of all rows by (x column, y column, rows of the view),
+# a correlogram of other columns or made again for the same filter takes them from here
+kdeCache = AggregateCache()
+kdeCache.maxEntries = 200
+
+def removeFiles(paths):
+    # removes the files and forgets them, files that are gone already are skipped
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    paths.clear()
+
+
+def artistBytes(artist):
+    # estimate of the memory of what a panel shows: the pixels of an image, the
+    # points of a scatter and the lines of a contour
+    if isinstance(artist, AxesImage):
+        return artist.get_array().nbytes + np.ma.getmaskarray(artist.get_array()).nbytes
+    total = 0
+    if hasattr(artist, "get_offsets"):
+        total += np.asarray(artist.get_offsets()).nbytes
+    if hasattr(artist, "get_paths"):
+        total += sum(path.vertices.nbytes for path in artist.get_paths())
+    return total
+
+
+def kdeColormap(color):
+    # the same colormap seaborn's kdeplot makes from a single color for its contours
+    r, g, b, _ = matplotlib.colors.to_rgba(color)
+    h, s, _ = husl.rgb_to_husl(r, g, b)
+    xx = np.linspace(-1, 1, int(1.15 * 256))[:256]
+    ramp = np.zeros((256, 3))
+    ramp[:, 0] = h
+    ramp[:, 1] = s * np.cos(xx)
+    ramp[:, 2] = np.linspace(35, 80, 256)
+    colors = np.clip([husl.husl_to_rgb(*hsl) for hsl in ramp], 0, 1)
+    return matplotlib.colors.ListedColormap(colors[::-1])
+
+def stratifyOptions(vis):
+    # the label and box to choose the column the sample of a vis is drawn by.
+    # The column of the vis is left out when the dataset does not have it
+    categories = vis.view.dataset.categoryColumns()
+    if vis.stratifyColumn not in categories:
+        vis.stratifyColumn = None
+    comboBox = QComboBox()
+    comboBox.addItems(["(random rows)"] + categories)
+    if vis.stratifyColumn is not None:
+        comboBox.setCurrentText(vis.stratifyColumn)
+    return QLabel("Draw the sample by"), comboBox
+
+def chosenColumn(comboBox):
+    return None if comboBox.currentIndex() == 0 else comboBox.currentText()
+
+def mappedPointIndex(view, xName, yName, bins):
+    # runs in the worker thread: the index of the points of a panel of a mapped
+    # dataset, over one point of every bin of a bins x bins grid so it stays
+    # small however large the file is. None when the panel has no points
+    xrange, yrange = view.columnRange(xName), view.columnRange(yName)
+    if np.isnan(xrange + yrange).any():
+        return None
+    blocks = ((rows, x, y) for rows, (x, y) in view.blocks([xName, yName]))
+    rows, x, y = binnedPoints(blocks, widened(*xrange), widened(*yrange), bins)
+    if len(rows) == 0:
+        return None
+    return GridIndex(x, y, rows)
+
+class Correlogram(QWidget):
+
+    # the annotation window when a point is selected
+    annot = None
+    # the last click on a panel of a mapped dataset whose index is still made
+    pendingClick = None
+    # a click on a panel of a mapped dataset finds the closest of one point per
+    # bin of an indexBins x indexBins grid over the panel
+    indexBins = 500
+
+    # scatter panels with more points than this are drawn as a density image,
+    # None always draws the points
+    densityThreshold = 100000
+
+    # the panels of views with more rows than exactRows are drawn from a
+    # sample of about sampleRows rows first and then again from all rows. On
+    # smaller views the sample would only add to the time until all are drawn
+    exactRows = 8000
+    sampleRows = 2000
+    # the sample has every value of this column, None for a plain random sample
+    stratifyColumn = "SARS-Cov-2 exam result"
+    # how the kde of the upper panels is computed: "binned" convolves the points
+    # binned on the grid with the kernel through the fft, kdeBatch pairs at
+    # once, "exact" evaluates the kernel of every point at every grid point.
+    # The panels of a mapped dataset are always binned
+    kdeBackends = ["binned", "exact"]
+    kdeBackend = "binned"
+
+    @traced
+    def __init__(self, parent, view):
+        super(Correlogram, self).__init__()
+        self.parent = parent
+        self.view = view
+        if view.dataset.mapped:
+            # the grid only needs the columns, it gets the first block of rows.
+            # The panels are computed from the files by the workers
+            columns = view.dataset.numericColumns(view.columnNames())
+            _, values = next(view.blocks(columns), (None, [[]] * len(columns)))
+            self.database = pd.DataFrame(dict(zip(columns, values)))
+            self.panelFunction = mappedPanel
+        else:
+            self.database = view.frame()
+            self.panelFunction = computePanel
+
+        # the Visualization itself with scatterplot as the lower section and
+        # kernal density plots as the uper section
+        # the grid only makes the axes, the statistics of every panel are computed
+        # in the worker processes and only the drawing happens here
+        with span("PairGrid"):
+            self.figure = sns.PairGrid(self.database, dropna=True)
+        # the grid makes its figure with pyplot, which would keep it until it is closed
+        plt.close(self.figure.fig)
+        self.columns = list(self.figure.x_vars)
+        self.diagAxes = []
+        for i, ax in enumerate(np.diag(self.figure.axes)):
+            diagAx = ax.twinx()
+            diagAx.set_axis_off()
+            if i > 0:
+                diagAx.sharey(self.diagAxes[0])
+            self.diagAxes.append(diagAx)
+        self.kdeCmap = kdeColormap("C0")
+        self.densityCmap = sns.light_palette("C0", as_cmap=True)
+
+        # put the vis on a canvas in order for it to be shown, it is drawn by a worker
+        self.vis = OffscreenCanvas(self.figure.fig)
+
+        self.futures = []
+        # the panels drawn from all rows, and since when they are computed
+        self.fullPanels = set()
+        self.started = tracing.now()
+        # the panels drawn from a sample are numbered by the sample they are
+        # from, so a panel of an older sample is not drawn over a newer one
+        self.sampleNumber = 0
+        self.sampleTasks = {}
+        self.fullFutures = {}
+        # what is drawn in every panel, removed again when the panel is drawn from all rows
+        self.panelArtists = {}
+        self.diagTops = {}
+        self.zoomPanels = set()
+        # which panel an axes shows, and the point index of every clicked panel
+        self.axesPanels = {}
+        for i in range(len(self.columns)):
+            for j in range(len(self.columns)):
+                if i != j:
+                    self.axesPanels[self.figure.axes[i][j]] = (i, j)
+        self.indexes = {}
+        self.indexFutures = {}
+        self.indexWatcher = FutureWatcher(self)
+        self.indexWatcher.done.connect(self.indexReady)
+        # the density images of the binned scatter panels, with the task they
+        # are computed from and the range they are binned for
+        self.densityImages = {}
+        self.watcher = FutureWatcher(self)
+        self.watcher.done.connect(self.drawPanel)
+        # the files with the rows of the view and the samples for the workers
+        # of a mapped dataset, removed with the vis
+        self.rowsFiles = []
+        weakref.finalize(self, removeFiles, self.rowsFiles)
+        self.tasks = self.makeTasks(None)
+
+        self.stratifyLabel, self.comboBoxStratify = stratifyOptions(self)
+        self.comboBoxStratify.currentIndexChanged.connect(self.setStratifyColumn)
+        self.parent.addOptions([self.stratifyLabel, self.comboBoxStratify])
+        if not view.dataset.mapped:
+            self.comboBoxKde = QComboBox()
+            self.comboBoxKde.addItems(self.kdeBackends)
+            self.comboBoxKde.setCurrentText(self.kdeBackend)
+            self.comboBoxKde.currentIndexChanged.connect(self.setKdeBackend)
+            self.parent.addOptions([QLabel("Density of the upper panels"), self.comboBoxKde])
+
+        # how many panels are drawn from all rows, hidden once all are
+        self.progress = QProgressBar()
+        self.progress.setRange(0, len(self.tasks))
+        self.progress.setFormat("%v of %m panels use all rows")
+        self.updateProgress()
+
+        self.computeSample(list(self.tasks))
+        self.computePanels(list(self.tasks))
+        # the selected rows are drawn over the scatter panels, the clicked one gets the annotation
+        self.selectedPositions = np.array([], dtype=np.intp)
+        self.selectedPoints = {}
+        for (i, j), task in self.tasks.items():
+            if task[0] == "lower":
+                self.selectedPoints[(i, j)] = self.figure.axes[i][j].scatter([], [], s=36, color="red",
+                                                                             edgecolor="white", linewidth=0.75)
+        self.annotRow = None
+        self.parent.selection.changed.connect(self.onSelection)
+        self.onSelection()
+        # on click select a point
+        self.vis.mpl_connect('button_press_event', self.onclick)
+        # the toolbar is used to zoom into the panels
+        self.toolbar = NavigationToolbar(self.vis, self)
+
+        self.layout = QVBoxLayout()
+        self.layout.addWidget(self.toolbar)
+        self.layout.addWidget(self.progress)
+        self.layout.addWidget(self.vis)
+        self.setLayout(self.layout)
+
+    def makeTasks(self, positions):
+        # the arguments of the panel function for every panel, for the rows at
+        # the given positions of the view or for all rows
+        if self.view.dataset.mapped:
+            # the workers get the names of the files instead of the values
+            directory = self.view.dataset.directory
+            if positions is None:
+                rowsPath = None if self.view.rows is None else self.rowsFile(self.view.rows)
+            else:
+                rowsPath = self.rowsFile(positions if self.view.rows is None else self.view.rows[positions])
+        else:
+            # the index of the frame holds the row ids of the dataset. The panels
+            # only draw the values, float32 is precise enough for that and keeps
+            # the dense copies of the compact (often sparse) columns small
+            rows = self.database.index.to_numpy()
+            columns = [self.database[col].to_numpy(dtype=np.float32, na_value=np.nan) for col in self.columns]
+            if positions is not None:
+                rows = rows[positions]
+                columns = [column[positions] for column in columns]
+        tasks = {}
+        for i in range(len(self.columns)):
+            for j in range(len(self.columns)):
+                if i == j:
+                    kind = "diag"
+                elif i < j:
+                    kind = "upper"
+                else:
+                    kind = "lower"
+                # the x of panel (i, j) is column j and the y is column i
+                if self.view.dataset.mapped:
+                    tasks[(i, j)] = (kind, directory, self.columns[j], self.columns[i], rowsPath)
+                else:
+                    tasks[(i, j)] = (kind, columns[j], columns[i], rows, self.densityThreshold)
+        return tasks
+
+    @traced
+    def computeSample(self, panels):
+        # large views are drawn from a sample first, it is computed before the
+        # panels from all rows because the pool starts the tasks in order
+        if len(self.view) <= self.exactRows:
+            return
+        self.sampleNumber += 1
+        with span("stratifiedSample", rows=len(self.view)):
+            positions = stratifiedSample(self.view, self.stratifyColumn, self.sampleRows)
+        self.sampleTasks = self.makeTasks(positions)
+        self.submit(self.sampleTasks, panels, self.sampleNumber)
+
+    @traced
+    def computePanels(self, panels):
+        for group, future in self.submit(self.tasks, panels, None):
+            for panel in group:
+                self.fullFutures[panel] = future
+
+    def batchedKde(self, kind, backend):
+        return kind == "upper" and backend == "binned" and not self.view.dataset.mapped
+
+    def kdeKey(self, panel):
+        # the x of panel (i, j) is column j and the y is column i, the columns of the view do not matter
+        return (self.columns[panel[1]], self.columns[panel[0]], self.view.fingerprint()[:2])
+
+    def submit(self, tasks, panels, sample):
+        # a task for every panel, except the binned kde panels that are computed
+        # kdeBatch at a time. Those of all rows that are in the cache are done
+        # right away. Gives the panels of every task with its future
+        pool = getPool()
+        groups = []
+        batched = []
+        for panel in panels:
+            if not self.batchedKde(tasks[panel][0], self.kdeBackend):
+                future = pool.submit(self.panelFunction, *tasks[panel])
+            elif sample is None and kdeCache.find(self.kdeKey(panel)) is not None:
+                future = Future()
+                future.set_result([kdeCache.find(self.kdeKey(panel))])
+            else:
+                batched.append(panel)
+                continue
+            groups.append(((panel,), future))
+        for start in range(0, len(batched), kdeBatch):
+            group = tuple(batched[start:start + kdeBatch])
+            future = pool.submit(kdePanels, [(tasks[panel][1], tasks[panel][2]) for panel in group])
+            groups.append((group, future))
+        for group, future in groups:
+            self.futures.append(self.watcher.watch(future, (sample, group, self.kdeBackend)))
+        return groups
+
+    def setStratifyColumn(self, state=None):
+        # the panels that do not use all rows yet are drawn again from a sample
+        # by the new column. The computations that have not started are
+        # outdated, they are cancelled and the ones from all rows come again
+        # after the new sample
+        self.stratifyColumn = chosenColumn(self.comboBoxStratify)
+        if len(self.view) <= self.exactRows or self.complete():
+            return
+        for future in self.futures:
+            future.cancel()
+        self.futures = [future for future in self.futures if not future.done()]
+        self.computeSample([panel for panel in self.tasks if panel not in self.fullPanels])
+        self.computePanels([panel for panel, future in self.fullFutures.items() if future.cancelled()])
+
+    def setKdeBackend(self, state=None):
+        # the upper panels are computed again from all rows, what they show now
+        # stays until the new ones are drawn
+        self.kdeBackend = self.comboBoxKde.currentText()
+        upper = [panel for panel, task in self.tasks.items() if task[0] == "upper"]
+        for panel in upper:
+            self.fullFutures[panel].cancel()
+        self.fullPanels.difference_update(upper)
+        self.updateProgress()
+        self.computePanels(upper)
+
+    def rowsFile(self, rows):
+        # the rows of a filtered view or a sample of a mapped dataset are saved
+        # next to its columns, so they are not sent to the workers with every
+        # panel. Every file has a name of its own, views can write theirs at the same time
+        handle, path = tempfile.mkstemp(suffix=".npy", prefix="rows-", dir=self.view.dataset.directory)
+        with os.fdopen(handle, "wb") as f:
+            np.save(f, np.asarray(rows, dtype=np.intp))
+        self.rowsFiles.append(path)
+        return path
+
+    def complete(self):
+        return len(self.fullPanels) == len(self.tasks)
+
+    def updateProgress(self):
+        self.progress.setValue(len(self.fullPanels))
+        self.progress.setVisible(not self.complete())
+
+    def memoryUsage(self):
+        # estimate for the view cache: the figure images, the column values,
+        # what the panels show and the point indexes of clicked panels. The
+        # panels of a row or a column share their columns and all share the
+        # rows, so every array is counted once
+        arrays = {}
+        for tasks in (self.tasks, self.sampleTasks):
+            for task in tasks.values():
+                for value in task[1:4]:
+                    if isinstance(value, np.ndarray):
+                        arrays[id(value)] = value.nbytes
+        for index in self.indexes.values():
+            for value in vars(index).values() if index is not None else ():
+                if isinstance(value, np.ndarray):
+                    arrays[id(value)] = value.nbytes
+        shown = sum(artistBytes(artist) for artists in self.panelArtists.values() for artist in artists)
+        return self.vis.memoryUsage() + sum(arrays.values()) + shown
+
+    def cancel(self):
+        # stops the computations that have not started yet, the vis is not
+        # shown anymore so its rows files are not needed either
+        for future in self.futures + list(self.indexFutures.values()):
+            future.cancel()
+        self.vis.cancel()
+        removeFiles(self.rowsFiles)
+
+    @traced
+    def drawPanel(self, tag, future):
+        # tag is the number of the sample the panels are computed from (None for
+        # all rows), the panels and the kde backend they are computed with
+        sample, group, backend = tag
+        if sample is not None and sample != self.sampleNumber:
+            return
+        tasks = self.tasks if sample is None else self.sampleTasks
+        batched = self.batchedKde(tasks[group[0]][0], backend)
+        try:
+            results = future.result()
+        except Exception as e:
+            if sample is not None:
+                return
+            # the worker died, compute the panels here instead
+            print("Computing panel in the worker failed:", e)
+            if batched:
+                results = kdePanels([(tasks[panel][1], tasks[panel][2]) for panel in group])
+            else:
+                results = self.panelFunction(*tasks[group[0]])
+        if not batched:
+            results = [results]
+        for panel, stats in zip(group, results):
+            if batched and sample is None:
+                kdeCache.put(self.kdeKey(panel), stats)
+            self.showPanel(panel, tasks[panel][0], stats, sample, backend)
+
+    def showPanel(self, panel, kind, stats, sample, backend):
+        if panel in self.fullPanels or (kind == "upper" and backend != self.kdeBackend):
+            # the panel is already drawn from all rows, or with the kde that was chosen before
+            return
+        # what was drawn from a sample before is replaced
+        for artist in self.panelArtists.pop(panel, []):
+            artist.remove()
+        self.densityImages.pop(panel, None)
+        self.diagTops.pop(panel, None)
+        if sample is None:
+            self.fullPanels.add(panel)
+            self.updateProgress()
+            if self.complete():
+                tracing.record("Correlogram panels", self.started, tracing.now(), {"panels": len(self.tasks)},
+                               tracing.waitThread)
+        if stats is not None:
+            i, j = panel
+            if kind == "diag":
+                artist = self.diagAxes[i].bar(stats["edges"][:-1], stats["counts"], width=np.diff(stats["edges"]),
+                                              align="edge", color="C0", alpha=0.75, edgecolor="white", linewidth=0.5)
+                self.diagTops[panel] = max(stats["counts"].max(initial=0), 1)
+            elif kind == "upper":
+                artist = self.figure.axes[i][j].contour(stats["x"], stats["y"], stats["density"],
+                                                        levels=np.unique(stats["levels"]), cmap=self.kdeCmap)
+            elif "density" in stats:
+                artist = self.drawDensity(panel, stats, (self.tasks if sample is None else self.sampleTasks)[panel])
+            else:
+                artist = self.figure.axes[i][j].scatter(stats["x"], stats["y"], s=36, color="C0",
+                                                        edgecolor="white", linewidth=0.75)
+            self.panelArtists[panel] = [artist]
+        if kind == "diag":
+            # the histograms share their y axis, it fits the highest bar that is drawn
+            self.diagAxes[0].set_ylim(0, max(self.diagTops.values(), default=1) * 1.05)
+        # panels that come in during the same frame are drawn together
+        self.parent.scheduler.invalidate(self.vis)
+
+    def drawDensity(self, panel, stats, task):
+        # too many points to draw one by one, show how many points fall in every
+        # bin. A zoom bins the points again from the columns of the task the
+        # panel is computed from, the bins are all that is kept of them
+        ax = self.figure.axes[panel[0]][panel[1]]
+        density = stats["density"]
+        image = ax.imshow(np.ma.masked_equal(density["counts"].T, 0), extent=density["extent"],
+                          origin="lower", aspect="auto", interpolation="nearest",
+                          cmap=self.densityCmap, norm=LogNorm())
+        self.densityImages[panel] = {"image": image, "task": task, "range": None}
+        # the axes of a row and a column are shared so zooming in any panel can
+        # change these. A panel drawn from a sample first is only connected once
+        if panel not in self.zoomPanels:
+            self.zoomPanels.add(panel)
+            ax.callbacks.connect("xlim_changed", self.onZoom)
+            ax.callbacks.connect("ylim_changed", self.onZoom)
+        return image
+
+    def onZoom(self, ax):
+        # x and y limits change together, bin only once after both, right before the redraw
+        self.parent.scheduler.invalidate(self.vis, self.rebin)
+
+    @traced
+    def rebin(self):
+        # recomputes the bins of the density images for the part that is visible
+        for panel, density in self.densityImages.items():
+            ax = self.figure.axes[panel[0]][panel[1]]
+            limits = (tuple(sorted(ax.get_xlim())), tuple(sorted(ax.get_ylim())))
+            if limits == density["range"] or self.view.dataset.mapped:
+                # the columns of a mapped dataset are not in memory to bin them again
+                continue
+            density["range"] = limits
+            x, y, _ = pairValues(*density["task"][1:4])
+            stats = densityStats(x, y, limits[0], limits[1])
+            density["image"].set_data(np.ma.masked_equal(stats["counts"].T, 0))
+            density["image"].set_extent(stats["extent"])
+
+    def pointIndex(self, panel):
+        # the index of the points of a panel is made on the first click on it,
+        # None when no row has both columns
+        if panel not in self.indexes:
+            x, y, rows = pairValues(self.tasks[panel][1], self.tasks[panel][2], self.tasks[panel][3])
+            self.indexes[panel] = GridIndex(x, y, rows) if len(rows) > 0 else None
+        return self.indexes[panel]
+
+    def nearestPoint(self, panel, x, y):
+        # the point of the panel closest to (x, y), None when the panel has no points
+        index = self.pointIndex(panel)
+        if index is None:
+            return None
+        return index.nearest(x, y)
+
+    # on click select a point
+    @traced
+    def onclick(self, event):
+        # first select the correct plot
+        panel = self.axesPanels.get(event.inaxes)
+        if panel is None or event.xdata is None:
+            return
+        if self.view.dataset.mapped and panel not in self.indexes:
+            # the index of a panel of a mapped dataset goes through all blocks
+            # of its columns, it is made in the worker thread and the last click
+            # is answered once it is there
+            self.pendingClick = (panel, event.xdata, event.ydata)
+            if panel not in self.indexFutures:
+                i, j = panel
+                future = getThreadPool().submit(mappedPointIndex, self.view, self.columns[j], self.columns[i],
+                                                self.indexBins)
+                self.indexFutures[panel] = self.indexWatcher.watch(future, panel)
+            return
+        self.showPoint(panel, event.xdata, event.ydata)
+
+    def indexReady(self, panel, future):
+        try:
+            self.indexes[panel] = future.result()
+        except Exception as e:
+            print("Indexing the points of the panel failed:", e)
+            self.indexFutures.pop(panel, None)
+            return
+        if self.pendingClick is not None and self.pendingClick[0] == panel:
+            click, self.pendingClick = self.pendingClick, None
+            self.showPoint(*click)
+
+    def showPoint(self, panel, x, y):
+        # get the point closesed to the click point
+        nearest = self.nearestPoint(panel, x, y)
+        if nearest is None:
+            return
+        rowId, px, py = nearest
+        # get the data of the point, the row id points straight into the dataset
+        dataPoint = self.parent.getDataset().row(rowId).dropna()
+        dstring = ""
+        # put all the data into a string
+        for col in dataPoint.index:
+            dstring += col + ": " + str(dataPoint[[col]]) + "\n"
+
+        # make the annotation
+        if self.annot is not None:
+            self.annot.remove()
+        ax = self.figure.axes[panel[0]][panel[1]]
+        self.annot = ax.annotate(dstring,xy=(px, py), ha = 'right',
+            xytext = (-20, 20), textcoords = 'offset points', va = 'bottom',
+            bbox = dict(boxstyle = 'round,pad=0.5', fc = 'yellow', alpha = 0.5),
+            arrowprops = dict(arrowstyle = '->', connectionstyle = 'arc3,rad=0')
+            )
+        self.annotRow = rowId
+        # the other vises highlight the row of the point too
+        self.parent.selection.setRows([rowId])
+        self.updateOverlays()
+
+    @traced
+    def onSelection(self, changed=None):
+        # only the points move, and only when rows of this vis changed
+        positions, rows = self.view.locate(self.parent.selection.rows())
+        if changed is not None and np.array_equal(positions, self.selectedPositions):
+            return
+        self.selectedPositions = positions
+        for (i, j), points in self.selectedPoints.items():
+            if self.view.dataset.mapped:
+                x, y = self.view.dataset.values(self.columns[j], rows), self.view.dataset.values(self.columns[i], rows)
+            else:
+                x, y = self.tasks[(i, j)][1][positions], self.tasks[(i, j)][2][positions]
+            x, y, _ = pairValues(x, y, positions)
+            points.set_offsets(np.column_stack([x, y]))
+        if self.annot is not None and not self.parent.selection.contains([self.annotRow])[0]:
+            # another vis selected other rows, the annotated point is not one of them
+            self.annot.remove()
+            self.annot = None
+        self.updateOverlays()
+
+    def updateOverlays(self):
+        # only the selected points and the annotation are redrawn, on top of the rest of the vis
+        overlays = list(self.selectedPoints.values())
+        if self.annot is not None:
+            overlays.append(self.annot)
+        self.parent.scheduler.setOverlays(self.vis, overlays)
+        self.parent.scheduler.invalidateOverlay(self.vis)
+
+class Barchart(QWidget):
+    # for every bar whether it has selected rows, those are red
+    highlightedBars = None
+    # the palette and number of bars the colors are made for, and the colors
+    paletteColors = None
+    xAxesValue = None
+    yAxesValue = None
+    minY = 0
+    maxY = 0
+    cValue = "deep"
+    colorSchemes = ["deep", "muted", "bright", "pastel", "dark", "colorblind"]
+
+    # the bars and error lines that are drawn, with the categories in the order of the aggregates
+    bars = None
+    errorLines = None
+    # only the rows with a y value in this range are used, None for all rows
+    yRange = None
+    barCategories = None
+    aggregates = None
+
+    @traced
+    def __init__(self, parent, view):
+        super(Barchart, self).__init__()
+        self.parent = parent
+        # the filtered view on the dataset, only the columns on the axes are read from it
+        self.view = view
+
+        # get all possible attributes for the x axis
+        rowList = list(view.columnNames())
+
+        # get all possible attributes for the y axis
+        colList = view.dataset.numericColumns(rowList)
+
+        # get min and max value of the y axis
+        self.minY, self.maxY = view.columnRange(colList[0])
+
+        self.minYLabel = QLabel("Set the minimum Y value")
+
+        self.minYslider = QSlider(Qt.Horizontal)
+        self.minYslider.setMinimum(int(self.minY))
+        self.minYslider.setMaximum(int(self.maxY))
+        self.minYslider.setValue(int(self.minY))
+        self.minYslider.valueChanged[int].connect(self.setMinYValue)
+
+        self.maxYLabel = QLabel("Set the maximum Y value")
+
+        self.maxYslider = QSlider(Qt.Horizontal)
+        self.maxYslider.setMinimum(int(self.minY))
+        self.maxYslider.setMaximum(int(self.maxY))
+        self.maxYslider.setValue(int(self.maxY))
+        self.maxYslider.valueChanged[int].connect(self.setMaxYValue)
+
+        self.orderLabel = QLabel("Change the order of the bars.")
+
+        self.comboBoxArrangement = QComboBox()
+        self.comboBoxArrangement.addItems(["default","ascending","descending"])
+        self.comboBoxArrangement.currentIndexChanged.connect(self.setOValue)
+
+        self.colorEncodingLabel = QLabel("Change the color encoding.")
+
+        self.comboBoxColor = QComboBox()
+        self.comboBoxColor.addItems(self.colorSchemes)
+        self.comboBoxColor.currentIndexChanged.connect(self.setCValue)
+
+        self.boxLabelX = QLabel("Change the x-Axis.")
+
+        self.comboBoxX = QComboBox()
+        self.comboBoxX.addItems(rowList)
+        self.comboBoxX.currentIndexChanged.connect(self.setXValue)
+
+        self.boxLabelY = QLabel("Change the y-Axis.")
+
+        self.comboBoxY = QComboBox()
+        self.comboBoxY.addItems(colList)
+        self.comboBoxY.currentIndexChanged.connect(self.setYValue)
+
+        # setup all vis that should go on the blue screen
+        self.parent.addOptions([self.minYLabel, self.minYslider,
+                                self.maxYLabel, self.maxYslider,
+                                self.orderLabel, self.comboBoxArrangement,
+                                self.colorEncodingLabel, self.comboBoxColor,
+                                self.boxLabelX, self.comboBoxX,
+                                self.boxLabelY, self.comboBoxY])
+
+        self.xAxesValue = self.comboBoxX.currentText()
+        self.yAxesValue = self.comboBoxY.currentText()
+
+        self.fig = Figure(figsize=(5, 4), dpi=100)
+        self.ax = self.fig.add_subplot(1,1,1)
+        self.vis = OffscreenCanvas(self.fig)
+        self.vis.mpl_connect('button_press_event', self.onclick)
+
+        self.layout = QVBoxLayout()
+        self.layout.addWidget(self.vis)
+        self.setLayout(self.layout)
+        self.update()
+        self.parent.selection.changed.connect(self.onSelection)
+
+    def selectedBars(self):
+        # the bars of the x values of the selected rows in this view
+        selection = self.parent.selection
+        if selection.isEmpty():
+            return np.zeros(len(self.barCategories), dtype=bool)
+        _, rows = self.view.locate(selection.rows())
+        return pd.Index(self.barCategories).isin(self.view.dataset.values(self.xAxesValue, rows))
+
+    @traced
+    def onSelection(self, changed):
+        # only recolored when other bars are highlighted than before
+        highlighted = self.selectedBars()
+        if np.array_equal(highlighted, self.highlightedBars):
+            return
+        self.highlightedBars = highlighted
+        self.updateColors()
+        self.parent.scheduler.invalidateOverlay(self.vis)
+
+    def memoryUsage(self):
+        # estimate for the view cache: the figure pixels and the bars
+        width, height = self.vis.get_width_height()
+        return width * height * 4 + len(self.barCategories) * 100
+
+    def cancel(self):
+        # stops the drawing of the figure if it has not started yet
+        self.vis.cancel()
+
+    def setMinYValue(self, value):
+        self.minY = value
+        if self.minY > self.maxY:
+            self.minY = self.maxY
+            self.minYslider.setValue(self.minY)
+        # while dragging this is called for every step, the range is only applied once a frame
+        self.parent.scheduler.invalidate(self.vis, self.changeYRange)
+
+    def setMaxYValue(self, value):
+        self.maxY = value
+        if self.minY > self.maxY:
+            self.maxY = self.minY
+            self.maxYslider.setValue(self.maxY)
+        self.parent.scheduler.invalidate(self.vis, self.changeYRange)
+
+    def changeYRange(self):
+        # updates the vis based on the new y range
+        self.yRange = (self.minY, self.maxY)
+        self.update()
+
+    def setOValue(self, state=None):
+        # change the arrangement of the bars, only moves the existing bars
+        self.updateOrder()
+        self.parent.scheduler.invalidate(self.vis)
+
+    def setCValue(self, state=None):
+        # set the color palette, only recolors the existing bars
+        self.cValue = self.comboBoxColor.currentText()
+        self.updateColors()
+        self.parent.scheduler.invalidateOverlay(self.vis)
+
+    def setXValue(self, state=None):
+        self.xAxesValue = self.comboBoxX.currentText()
+        self.update()
+
+    def setYValue(self, state=None):
+        self.yAxesValue = self.comboBoxY.currentText()
+        self.update()
+
+    def getAggregates(self):
+        # the means per x value of the rows in the y range, computed once per
+        # (x, y, filter) and then taken from the cache
+        key = (self.xAxesValue, self.yAxesValue, self.view.fingerprint(), self.yRange)
+        def compute():
+            with span("viewAggregates", rows=len(self.view)):
+                return viewAggregates(self.view, self.xAxesValue, self.yAxesValue, self.yRange)
+        return aggregateCache.get(key, compute)
+
+    @traced
+    def update(self):
+        self.aggregates = self.getAggregates()
+        self.showAggregates()
+
+    @traced
+    def appendRows(self, view, rows):
+        # only the new rows of the view are aggregated, and added to the
+        # aggregates of the rows that were there
+        self.view = view
+        added = view.withRows(rows)
+        with span("viewAggregates", rows=len(rows)):
+            self.aggregates = combineAggregates([self.aggregates, viewAggregates(added, self.xAxesValue,
+                                                                                 self.yAxesValue, self.yRange)])
+        aggregateCache.put((self.xAxesValue, self.yAxesValue, view.fingerprint(), self.yRange), self.aggregates)
+        # the sliders reach the new values, the shown range only grows when it is not chosen
+        low, high = added.columnRange(self.yAxesValue)
+        if not np.isnan(low):
+            if self.yRange is None:
+                self.minY, self.maxY = min(self.minY, low), max(self.maxY, high)
+            for slider, value in ((self.minYslider, self.minY), (self.maxYslider, self.maxY)):
+                slider.blockSignals(True)
+                slider.setRange(min(slider.minimum(), int(low)), max(slider.maximum(), int(high)))
+                slider.setValue(int(value))
+                slider.blockSignals(False)
+        self.showAggregates()
+
+    def showAggregates(self):
+        if self.aggregates.count.sum() == 0:
+            print("Contains no valid data")
+        if self.barCategories != self.aggregates.categories:
+            # other bars than before, make them again
+            self.makeBars()
+        else:
+            # the same bars, only their heights change
+            self.heights = np.nan_to_num(self.aggregates.mean())
+        self.ax.set_ylim(self.minY, self.maxY)
+        self.updateOrder()
+        self.highlightedBars = self.selectedBars()
+        self.updateColors()
+        self.parent.scheduler.invalidate(self.vis)
+
+    @traced
+    def makeBars(self):
+        self.ax.clear()
+        self.barCategories = self.aggregates.categories
+        self.heights = np.nan_to_num(self.aggregates.mean())
+        # all bars are one collection, so moving or recoloring them is one call
+        self.bars = matplotlib.collections.PolyCollection([])
+        self.ax.add_collection(self.bars)
+        # the colors of the bars change often, those changes are blitted
+        self.parent.scheduler.setOverlays(self.vis, [self.bars])
+        self.errorLines = matplotlib.collections.LineCollection([], colors=".26",
+                                                                linewidths=matplotlib.rcParams["lines.linewidth"] * 1.8)
+        self.ax.add_collection(self.errorLines)
+        self.ax.set_xlim(-0.5, len(self.heights) - 0.5)
+        # with many bars only some of them get a label, the labels follow the order of the bars
+        self.ax.xaxis.set_major_locator(MaxNLocator(nbins=50, integer=True))
+        self.tickLabels = IndexFormatter()
+        self.ax.xaxis.set_major_formatter(self.tickLabels)
+        # the rotation of the labels came from https://stackabuse.com/rotate-axis-labels-in-matplotlib/
+        self.ax.tick_params(axis="x", labelrotation=90)
+        self.ax.set_xlabel(self.xAxesValue)
+        self.ax.set_ylabel(self.yAxesValue)
+
+    @traced
+    def updateOrder(self):
+        # moves the bars, their ticks and error lines to the chosen order
+        mean = self.aggregates.mean()
+        oValue = self.comboBoxArrangement.currentText()
+        order = np.arange(len(mean))
+        if oValue == "ascending":
+            order = np.argsort(mean, kind="stable")
+        elif oValue == "descending":
+            order = np.argsort(-mean, kind="stable")
+        # categories without a mean (nan) stay at the end
+        order = np.concatenate([order[~np.isnan(mean[order])], order[np.isnan(mean[order])]])
+        self.order = order
+        positions = np.empty(len(order))
+        positions[order] = np.arange(len(order))
+        # the four corners of every bar
+        verts = np.empty((len(order), 4, 2))
+        verts[:, [0, 1], 0] = (positions - 0.4)[:, None]
+        verts[:, [2, 3], 0] = (positions + 0.4)[:, None]
+        verts[:, [0, 3], 1] = 0
+        verts[:, [1, 2], 1] = self.heights[:, None]
+        self.bars.set_verts(verts)
+        ci = self.aggregates.ci()
+        self.errorLines.set_segments([[(p, m - c), (p, m + c)] for p, m, c in zip(positions, mean, ci)
+                                      if not np.isnan(c)])
+        # only the labels of the ticks change, the ticks themselves stay as they are
+        self.tickLabels.labels = [self.barCategories[i] for i in order]
+        self.ax.xaxis.stale = True
+
+    @traced
+    def updateColors(self):
+        # the palette colors stay with their category when the order changes
+        if not self.highlightedBars.any():
+            # a plain list, so drawing the figure in a worker does not need seaborn.
+            # It is kept for when the highlight goes away again
+            key = (self.cValue, len(self.barCategories))
+            if self.paletteColors is None or self.paletteColors[0] != key:
+                self.paletteColors = (key, list(sns.color_palette(self.cValue, len(self.barCategories))))
+            colors = self.paletteColors[1]
+        else:
+            colors = np.where(self.highlightedBars[:, None], matplotlib.colors.to_rgba("red"),
+                              matplotlib.colors.to_rgba("grey"))
+        self.bars.set_facecolor(colors)
+
+    @traced
+    def onclick(self, event):
+        if event is not None and event.xdata is not None:
+            idx = round(event.xdata)
+            if 0 <= idx < len(self.order):
+                bar = self.order[idx]
+                # clicking the only highlighted bar again removes the highlight,
+                # the colors change when the selection tells about it
+                if self.highlightedBars[bar] and self.highlightedBars.sum() == 1:
+                    self.parent.selection.clear()
+                else:
+                    category = self.barCategories[bar]
+                    self.parent.selection.setRows(np.concatenate(
+                        [rows[keys == category] for rows, (keys,) in self.view.blocks([self.xAxesValue])]))
+
+class Heatmap(QWidget):
+
+    # cells are only annotated with their value when they are at least this many
+    # pixels high and wide and there are not more than maxAnnotations visible
+    annotHeight = 12
+    annotWidth = 30
+    maxAnnotations = 3000
+    # the colormap of the cells, the same as seaborn's heatmap
+    palette = "rocket"
+    # when more rows than this are visible the image is made from a sample of
+    # about sampleRows rows first, and then averaged over all rows in chunks
+    # of about chunkRows rows in the background
+    exactRows = 100000
+    sampleRows = 20000
+    chunkRows = 1 << 17
+    stratifyColumn = "SARS-Cov-2 exam result"
+
+    @traced
+    def __init__(self, parent, view):
+        super(Heatmap, self).__init__()
+        self.parent = parent
+        self.view = view
+        self.columns = view.dataset.numericColumns(view.columnNames())
+        # the rows are read from the columns of the dataset when they are shown,
+        # a matrix of all rows would take more memory than the compact columns
+        self.shape = (len(view), len(self.columns))
+        # the positions of the selected rows in the heatmap
+        self.selectedPositions, _ = view.locate(parent.selection.rows())
+        parent.selection.changed.connect(self.onSelection)
+        # the part (first row, last row, pixel height) the image is made for
+        self.drawn = None
+        self.annots = []
+        # the sorted positions of the sampled rows, drawn when they are first needed
+        self.samplePositions = None
+        # the image that is averaged in the background, refinements are
+        # numbered so the chunks of an outdated one are not used
+        self.refinement = None
+        self.refineNumber = 0
+        self.watcher = FutureWatcher(self)
+        self.watcher.done.connect(self.refined)
+
+        self.stratifyLabel, self.comboBoxStratify = stratifyOptions(self)
+        self.comboBoxStratify.currentIndexChanged.connect(self.setStratifyColumn)
+        self.parent.addOptions([self.stratifyLabel, self.comboBoxStratify])
+        # how many of the visible rows are averaged, hidden when all are
+        self.progress = QProgressBar()
+        self.progress.setFormat("%p% of the rows averaged, the rest is a sample")
+        self.progress.hide()
+
+        self.fig = Figure(figsize=(5, 4), dpi=100)
+        self.ax = self.fig.add_subplot(1,1,1)
+        self.vis = OffscreenCanvas(self.fig)
+        # the toolbar is used to zoom into the rows
+        self.toolbar = NavigationToolbar(self.vis, self)
+
+        if self.isEmpty():
+            print("Contains no valid data")
+        else:
+            self.makeImage()
+
+        self.layout = QVBoxLayout()
+        self.layout.addWidget(self.toolbar)
+        self.layout.addWidget(self.progress)
+        self.layout.addWidget(self.vis)
+        self.setLayout(self.layout)
+
+    @traced
+    def makeImage(self):
+        # the image itself is filled in by refine
+        rows, cols = self.shape
+        self.cmap = sns.color_palette(self.palette, as_cmap=True)
+        self.norm = matplotlib.colors.Normalize(*self.valueRange())
+        self.image = self.ax.imshow(np.ma.masked_invalid(self.readRows(slice(0, 1))), cmap=self.cmap, norm=self.norm,
+                                    aspect="auto", interpolation="nearest")
+        self.fig.colorbar(self.image, ax=self.ax)
+        self.ax.set_xlim(-0.5, cols - 0.5)
+        self.ax.set_ylim(rows - 0.5, -0.5)
+        self.ax.set_autoscale_on(False)
+        self.ax.set_xticks(np.arange(cols))
+        # the rotation of the labels came from https://stackabuse.com/rotate-axis-labels-in-matplotlib/
+        self.ax.set_xticklabels(self.columns, rotation=90)
+        # the rows are labeled with their row id, only as many as fit. The ticks
+        # are placed by refine, so the figure only carries the labels it shows
+        self.rowLocator = MaxNLocator(nbins="auto", integer=True)
+        self.rowLocator.set_axis(self.ax.yaxis)
+
+        # the highlighted rows get a purple border, which is blitted when it changes
+        self.highlightBoxes = matplotlib.collections.PolyCollection([], facecolors="none",
+                                                                    edgecolors="purple", linewidths=2)
+        self.ax.add_collection(self.highlightBoxes)
+        self.parent.scheduler.setOverlays(self.vis, [self.highlightBoxes])
+
+        self.ax.callbacks.connect("xlim_changed", self.onZoom)
+        self.ax.callbacks.connect("ylim_changed", self.onZoom)
+        self.vis.mpl_connect("resize_event", self.onZoom)
+        self.refine()
+
+    def onZoom(self, event=None):
+        self.parent.scheduler.invalidate(self.vis, self.refine)
+
+    def isEmpty(self):
+        return self.shape[0] * self.shape[1] == 0
+
+    def readRows(self, positions):
+        # the rows at the positions (a slice or sorted positions) of the view
+        # as a matrix, read from the columns of the dataset (or its files)
+        part = positions if self.view.rows is None else self.view.rows[positions]
+        count = len(range(self.shape[0])[positions]) if isinstance(positions, slice) else len(positions)
+        rows = np.empty((count, self.shape[1]))
+        for j, col in enumerate(self.columns):
+            rows[:, j] = self.view.dataset.values(col, part)
+        return rows
+
+    def addToBins(self, sums, counts, rows, bins):
+        # adds the known values of the rows to the sums and counts of their (sorted) bins
+        if len(rows) == 0:
+            return
+        known = ~np.isnan(rows)
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        sums[bins[starts]] += np.add.reduceat(np.where(known, rows, 0), starts, axis=0)
+        counts[bins[starts]] += np.add.reduceat(known, starts, axis=0)
+
+    def rowMeans(self, first, last, block):
+        # the mean of every block rows from first to last, summed a block of
+        # rows of the dataset at a time so the rows are never read at once
+        sums = np.zeros((-(-(last - first) // block), self.shape[1]))
+        counts = np.zeros(sums.shape)
+        step = self.view.dataset.blockRows or self.chunkRows
+        for start in range(first, last, step):
+            rows = self.readRows(slice(start, min(start + step, last)))
+            self.addToBins(sums, counts, rows, (np.arange(start, start + len(rows)) - first) // block)
+        # blocks with only missing values stay missing
+        with np.errstate(invalid="ignore"):
+            return sums / counts
+
+    def sampleMeans(self, first, last, block):
+        # the same means over only the sampled rows, blocks without one stay
+        # missing until the means over all rows come in
+        if self.samplePositions is None:
+            with span("stratifiedSample", rows=self.shape[0]):
+                self.samplePositions = stratifiedSample(self.view, self.stratifyColumn, self.sampleRows)
+        positions = self.samplePositions[np.searchsorted(self.samplePositions, first):
+                                         np.searchsorted(self.samplePositions, last)]
+        sums = np.zeros((-(-(last - first) // block), self.shape[1]))
+        counts = np.zeros(sums.shape)
+        self.addToBins(sums, counts, self.readRows(positions), (positions - first) // block)
+        with np.errstate(invalid="ignore"):
+            return sums / counts
+
+    def valueRange(self):
+        # the smallest and largest value, the colormap goes from one to the other
+        ranges = np.array([self.view.columnRange(col) for col in self.columns])
+        if np.isnan(ranges).all():
+            return 0, 1
+        return np.nanmin(ranges[:, 0]), np.nanmax(ranges[:, 1])
+
+    def setPalette(self, palette):
+        # the annotations get their text color from the colormap, so they are made again
+        self.palette = palette
+        if not self.isEmpty():
+            self.cmap = sns.color_palette(palette, as_cmap=True)
+            self.image.set_cmap(self.cmap)
+            if self.annots:
+                self.drawn = None
+            self.parent.scheduler.invalidate(self.vis, self.refine)
+
+    def setStratifyColumn(self, state=None):
+        # the sample is drawn again, the visible rows are too when they are not averaged yet
+        self.stratifyColumn = chosenColumn(self.comboBoxStratify)
+        self.samplePositions = None
+        if self.refinement is not None:
+            self.drawn = None
+            self.parent.scheduler.invalidate(self.vis, self.refine)
+
+    def visible(self, limits, count):
+        # the first and last (exclusive) row or column inside the limits
+        first = max(0, int(np.floor(min(limits) + 0.5)))
+        last = min(count, int(np.ceil(max(limits) + 0.5)))
+        return first, max(first + 1, last)
+
+    @traced
+    def refine(self):
+        # makes the image for the visible rows with at most one image row per
+        # pixel, when there are more rows than pixels rows are averaged together
+        first, last = self.visible(self.ax.get_ylim(), self.shape[0])
+        firstCol, lastCol = self.visible(self.ax.get_xlim(), self.shape[1])
+        pixels = max(1, int(self.ax.bbox.height))
+        if self.drawn == (first, last, firstCol, lastCol, pixels):
+            return
+        self.drawn = (first, last, firstCol, lastCol, pixels)
+        # the rows that are still averaged for the part shown before are not needed anymore
+        self.refineNumber += 1
+        self.refinement = None
+        block = int(np.ceil((last - first) / pixels))
+        if block > 1 and last - first > self.exactRows:
+            # too many rows to average them now, the sample is shown until they are
+            rows = self.sampleMeans(first, last, block)
+            self.refinement = {"first": first, "last": last, "block": block, "rows": rows, "done": first}
+            self.refineNext()
+        elif block > 1:
+            rows = self.rowMeans(first, last, block)
+        else:
+            rows = self.readRows(slice(first, last))
+        self.updateProgress()
+        self.image.set_data(np.ma.masked_invalid(rows))
+        self.image.set_extent((-0.5, self.shape[1] - 0.5, last - 0.5, first - 0.5))
+        ticks = self.rowLocator.tick_values(first, last - 1).astype(np.intp)
+        ticks = ticks[(ticks >= first) & (ticks < last)]
+        self.ax.yaxis.set_major_locator(FixedLocator(ticks))
+        rowIds = ticks if self.view.rows is None else self.view.rows[ticks]
+        self.ax.yaxis.set_major_formatter(FixedFormatter([str(rowId) for rowId in rowIds]))
+        self.updateAnnotations(first, last, firstCol, lastCol, pixels)
+        self.updateHighlight()
+
+    @traced
+    def updateAnnotations(self, first, last, firstCol, lastCol, pixels):
+        # only the visible cells get a text, and only when they are large enough to read it
+        for annot in self.annots:
+            annot.remove()
+        self.annots = []
+        cellHeight = pixels / (last - first)
+        cellWidth = self.ax.bbox.width / (lastCol - firstCol)
+        if (cellHeight < self.annotHeight or cellWidth < self.annotWidth
+                or (last - first) * (lastCol - firstCol) > self.maxAnnotations):
+            return
+        values = self.readRows(slice(first, last))[:, firstCol:lastCol]
+        # dark text on light cells and light text on dark cells, like seaborn
+        colors = self.cmap(self.norm(values))
+        luminance = (colors[..., :3] * [0.2126, 0.7152, 0.0722]).sum(axis=-1)
+        selected = np.isin(np.arange(first, last), self.selectedPositions)
+        for i, j in zip(*np.nonzero(~np.isnan(values))):
+            row = first + i
+            if selected[i]:
+                annot = self.ax.text(firstCol + j, row, format(values[i, j], ".2g"), ha="center", va="center", clip_on=True,
+                                     color="purple", weight="bold")
+            else:
+                annot = self.ax.text(firstCol + j, row, format(values[i, j], ".2g"), ha="center", va="center", clip_on=True,
+                                     color="w" if luminance[i, j] < .408 else ".15")
+            self.annots.append(annot)
+
+    @traced
+    def onSelection(self, changed):
+        # only the borders move, and only when rows of this vis changed
+        positions, _ = self.view.locate(self.parent.selection.rows())
+        if np.array_equal(positions, self.selectedPositions):
+            return
+        self.selectedPositions = positions
+        if not self.isEmpty():
+            self.updateHighlight()
+            if self.annots:
+                # the texts of the selected rows are purple, they are made again
+                self.drawn = None
+                self.parent.scheduler.invalidate(self.vis, self.refine)
+            else:
+                self.parent.scheduler.invalidateOverlay(self.vis)
+
+    @traced
+    def appendRows(self, view, rows):
+        # the new rows of the view go below the others. The image is only made
+        # again when the last rows are shown, then it shows the new ones too
+        count = self.shape[0]
+        shownToEnd = self.drawn is not None and self.drawn[1] == count
+        self.view = view
+        self.shape = (len(view), len(self.columns))
+        self.samplePositions = None
+        if count * self.shape[1] == 0:
+            if not self.isEmpty():
+                self.makeImage()
+            return
+        added = self.readRows(slice(count, self.shape[0]))
+        if np.isfinite(added).any():
+            # the colors only change when the new values are outside the colormap
+            low, high = min(self.norm.vmin, np.nanmin(added)), max(self.norm.vmax, np.nanmax(added))
+            if (low, high) != (self.norm.vmin, self.norm.vmax):
+                self.norm.vmin, self.norm.vmax = low, high
+                self.drawn = None
+        if shownToEnd:
+            self.ax.set_ylim(self.shape[0] - 0.5, self.ax.get_ylim()[1])
+        self.parent.scheduler.invalidate(self.vis, self.refine)
+
+    def refineNext(self):
+        # averages the next chunk of rows on the thread of the pool, the
+        # chunks start at a block so they fill whole rows of the image
+        refinement = self.refinement
+        block = refinement["block"]
+        start = refinement["done"]
+        stop = min(refinement["last"], start + block * max(1, self.chunkRows // block))
+        future = getThreadPool().submit(self.rowMeans, start, stop, block)
+        self.watcher.watch(future, (self.refineNumber, start, stop))
+
+    def refined(self, tag, future):
+        number, start, stop = tag
+        if number != self.refineNumber:
+            # zoomed, panned or resized since, these rows are not shown anymore
+            return
+        refinement = self.refinement
+        try:
+            means = future.result()
+        except Exception as e:
+            # the sample stays shown for the rows that are not averaged yet
+            print("Averaging the rows of the heatmap failed:", e)
+            self.refineNumber += 1
+            self.refinement = None
+            self.updateProgress()
+            return
+        first = (start - refinement["first"]) // refinement["block"]
+        refinement["rows"][first:first + len(means)] = means
+        refinement["done"] = stop
+        self.image.set_data(np.ma.masked_invalid(refinement["rows"]))
+        if stop < refinement["last"]:
+            self.refineNext()
+        else:
+            self.refinement = None
+        self.updateProgress()
+        self.parent.scheduler.invalidate(self.vis)
+
+    def updateProgress(self):
+        if self.refinement is None:
+            self.progress.hide()
+            return
+        self.progress.setRange(0, self.refinement["last"] - self.refinement["first"])
+        self.progress.setValue(self.refinement["done"] - self.refinement["first"])
+        self.progress.show()
+
+    def complete(self):
+        return self.refinement is None
+
+    def memoryUsage(self):
+        # estimate for the view cache: the figure pixels, the rows are read from the dataset
+        width, height = self.vis.get_width_height()
+        return width * height * 4
+
+    def cancel(self):
+        # stops the drawing of the figure if it has not started yet, and the averaging
+        self.refineNumber += 1
+        self.refinement = None
+        self.vis.cancel()
+
+    @traced
+    def updateHighlight(self):
+        cols = self.shape[1]
+        positions = self.selectedPositions.astype(float)
+        boxes = np.empty((len(positions), 4, 2))
+        boxes[:, [0, 1], 0] = -0.5
+        boxes[:, [2, 3], 0] = cols - 0.5
+        boxes[:, [0, 3], 1] = (positions - 0.5)[:, None]
+        boxes[:, [1, 2], 1] = (positions + 0.5)[:, None]
+        self.highlightBoxes.set_verts(boxes)
+
+class CorrelationMatrix(QWidget):
+
+    # blue for negative and red for positive values
+    palette = "vlag"
+    # pairs with fewer rows where both columns are known stay empty
+    minCount = 3
+    # the annotation of the clicked cell
+    annot = None
+
+    @traced
+    def __init__(self, parent, view):
+        super(CorrelationMatrix, self).__init__()
+        self.parent = parent
+        self.view = view
+        self.columns = view.dataset.numericColumns(view.columnNames())
+        # every pair over the rows where both columns are known, the sums are
+        # kept so after a new filter only the rows that changed are summed.
+        # With many columns that takes seconds, it is done in the worker thread
+        # and the matrix stays empty until it is there
+        self.result = None
+        self.watcher = FutureWatcher(self)
+        self.watcher.done.connect(self.correlated)
+        self.future = None
+
+        self.kindLabel = QLabel("Show the correlation or the covariance.")
+
+        self.comboBoxKind = QComboBox()
+        self.comboBoxKind.addItems(["correlation", "covariance"])
+        self.comboBoxKind.currentIndexChanged.connect(self.setKind)
+
+        self.minCountLabel = QLabel("Minimum number of rows with both values.")
+
+        self.spinBoxMinCount = QSpinBox()
+        self.spinBoxMinCount.setMinimum(2)
+        self.spinBoxMinCount.setMaximum(max(2, len(view)))
+        self.spinBoxMinCount.setValue(self.minCount)
+        self.spinBoxMinCount.valueChanged.connect(self.setMinCount)
+
+        self.parent.addOptions([self.kindLabel, self.comboBoxKind,
+                                self.minCountLabel, self.spinBoxMinCount])
+
+        self.fig = Figure(figsize=(5, 4), dpi=100)
+        self.ax = self.fig.add_subplot(1,1,1)
+        self.vis = OffscreenCanvas(self.fig)
+        self.vis.mpl_connect('button_press_event', self.onclick)
+        # the toolbar is used to zoom into the matrix
+        self.toolbar = NavigationToolbar(self.vis, self)
+
+        if len(self.columns) == 0:
+            print("Contains no valid data")
+        else:
+            self.makeImage()
+            self.future = self.watcher.watch(getThreadPool().submit(self.correlate), None)
+
+        self.layout = QVBoxLayout()
+        self.layout.addWidget(self.toolbar)
+        self.layout.addWidget(self.vis)
+        self.setLayout(self.layout)
+
+    def correlate(self):
+        # runs in the worker thread
+        with span("pairwise correlation", rows=len(self.view), columns=len(self.columns)):
+            return correlationCache.get(self.view, self.columns)
+
+    def correlated(self, tag, future):
+        try:
+            self.result = future.result()
+        except Exception as e:
+            # the worker failed, compute it here instead
+            print("Computing the correlation in the worker failed:", e)
+            self.result = self.correlate()
+        self.updateImage()
+
+    def complete(self):
+        return len(self.columns) == 0 or self.result is not None
+
+    @traced
+    def makeImage(self):
+        count = len(self.columns)
+        self.image = self.ax.imshow(np.ma.masked_all((count, count)), cmap=sns.color_palette(self.palette, as_cmap=True),
+                                    interpolation="nearest")
+        self.colorbar = self.fig.colorbar(self.image, ax=self.ax)
+        # with many columns only some of them get a label
+        for axis in (self.ax.xaxis, self.ax.yaxis):
+            axis.set_major_locator(MaxNLocator(nbins="auto", integer=True))
+            axis.set_major_formatter(IndexFormatter(self.columns))
+        # the rotation of the labels came from https://stackabuse.com/rotate-axis-labels-in-matplotlib/
+        self.ax.tick_params(axis="x", labelrotation=90)
+        self.updateImage()
+
+    def setKind(self, state=None):
+        self.updateImage()
+
+    def setMinCount(self, value):
+        self.minCount = value
+        # the spin box changes for every step, the image is made once a frame
+        self.parent.scheduler.invalidate(self.vis, self.updateImage)
+
+    def values(self):
+        if self.comboBoxKind.currentText() == "covariance":
+            return self.result.cov
+        return self.result.corr
+
+    @traced
+    def updateImage(self):
+        if self.result is None:
+            return
+        values = self.values()
+        values = np.ma.masked_where(np.isnan(values) | (self.result.count < self.minCount), values)
+        # zero is always in the middle of the colormap
+        limit = 1
+        if self.comboBoxKind.currentText() == "covariance" and values.count() > 0:
+            limit = max(np.abs(values).max(), np.finfo(float).tiny)
+        self.image.set_data(values)
+        self.image.set_clim(-limit, limit)
+        self.colorbar.set_label(self.comboBoxKind.currentText())
+        self.parent.scheduler.invalidate(self.vis)
+
+    def memoryUsage(self):
+        # estimate for the view cache: the figure pixels and the matrices
+        width, height = self.vis.get_width_height()
+        return width * height * 4 + (0 if self.result is None else 3 * self.result.corr.nbytes)
+
+    def cancel(self):
+        # stops the drawing of the figure and the correlation if they have not started yet
+        if self.future is not None:
+            self.future.cancel()
+        self.vis.cancel()
+
+    @traced
+    def onclick(self, event):
+        # shows the numbers of the clicked pair
+        if event.inaxes is not self.ax or event.xdata is None or self.result is None:
+            return
+        j, i = int(round(event.xdata)), int(round(event.ydata))
+        if not (0 <= i < len(self.columns) and 0 <= j < len(self.columns)):
+            return
+        text = "%s\n%s\nr = %.3g\ncov = %.3g\nrows = %d" % (self.columns[j], self.columns[i], self.result.corr[i, j],
+                                                           self.result.cov[i, j], self.result.count[i, j])
+        if self.annot is not None:
+            self.annot.remove()
+        self.annot = self.ax.annotate(text, xy=(j, i), ha = 'right',
+            xytext = (-20, 20), textcoords = 'offset points', va = 'bottom',
+            bbox = dict(boxstyle = 'round,pad=0.5', fc = 'yellow', alpha = 0.5),
+            arrowprops = dict(arrowstyle = '->', connectionstyle = 'arc3,rad=0')
+            )
+        # only the annotation is redrawn, on top of the matrix
+        self.parent.scheduler.setOverlays(self.vis, [self.annot])
+        self.parent.scheduler.invalidateOverlay(self.vis)
@@ -0,0 +1,96 @@
+import weakref
+
+from PyQt5.QtCore import QObject, QTimer
+
+from tracing import traced
+
+
+class RedrawScheduler(QObject):
+    # all vises ask this for their redraws instead of drawing themselves. Every
+    # redraw asked for during one frame is merged into one draw per canvas.
+    # Overlays (the annotation box, highlight colors) are drawn on top of a
+    # saved background (blitting) so changing them does not redraw the figure
+
+    # milliseconds between two frames
+    frameTime = 16
+
+    def __init__(self, parent=None):
+        super(RedrawScheduler, self).__init__(parent)
+        # canvas -> set of overlay artists to blit, or None for a full redraw
+        self.pending = {}
+        # state updates to run before the next frame, merged by the function
+        self.updates = {}
+        # the overlay artists of a canvas and the background without them
+        self.overlays = weakref.WeakKeyDictionary()
+        self.backgrounds = weakref.WeakKeyDictionary()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def schedule(self):
+        if not self.timer.isActive():
+            self.timer.start(self.frameTime)
+
+    def invalidate(self, canvas, update=None):
+        # redraw the whole canvas in the next frame, update is called first
+        # (once, however often it was asked for during the frame)
+        self.pending[canvas] = None
+        if update is not None:
+            self.updates[update] = update
+        self.schedule()
+
+    def invalidateOverlay(self, canvas):
+        # only the overlays of the canvas changed
+        if canvas not in self.pending:
+            self.pending[canvas] = set()
+        self.schedule()
+
+    def setOverlays(self, canvas, artists):
+        # the artists are left out of the full draws and blitted on top of them
+        if canvas not in self.overlays:
+            canvas.mpl_connect('draw_event', lambda event: self.onDraw(canvas, event))
+        for artist in self.overlays.get(canvas, []):
+            if artist not in artists:
+                artist.set_animated(False)
+        for artist in artists:
+            artist.set_animated(True)
+        self.overlays[canvas] = list(artists)
+
+    def onDraw(self, canvas, event):
+        # after a full draw save the background and put the overlays on it.
+        # When the figure is saved to a file the overlays are drawn with the
+        # rest of the figure already
+        if event.canvas.is_saving():
+            return
+        if event.renderer is getattr(canvas, "renderer", None):
+            self.backgrounds[canvas] = canvas.copy_from_bbox(canvas.figure.bbox)
+        for artist in self.overlays.get(canvas, []):
+            if artist.figure is not None:
+                artist.draw(event.renderer)
+
+    def blit(self, canvas):
+        background = self.backgrounds.get(canvas)
+        if background is None:
+            return False
+        canvas.restore_region(background)
+        for artist in self.overlays.get(canvas, []):
+            if artist.figure is not None:
+                canvas.figure.draw_artist(artist)
+        canvas.blit(canvas.figure.bbox)
+        return True
+
+    @traced
+    def flush(self):
+        # the updates may invalidate more canvases, those are drawn in this frame too
+        while self.updates:
+            updates, self.updates = self.updates, {}
+            for update in updates.values():
+                update()
+        pending, self.pending = self.pending, {}
+        for canvas, overlays in pending.items():
+            try:
+                if overlays is None or not self.blit(canvas):
+                    canvas.draw_idle()
+            except RuntimeError:
+                # the vis of the canvas is already deleted
+                pass
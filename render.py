@@ -0,0 +1,41 @@
+import pickle
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.ticker import Formatter
+
+
+class IndexFormatter(Formatter):
+    # labels the tick at position i with labels[i], ticks between the positions
+    # stay empty. Unlike a FuncFormatter of a vis it can be pickled, so figures
+    # using it can be drawn in a worker process
+
+    def __init__(self, labels=()):
+        self.labels = labels
+
+    def __call__(self, value, pos=None):
+        idx = int(round(value))
+        if 0 <= idx < len(self.labels):
+            return str(self.labels[idx])
+        return ""
+
+
+def renderFigure(data, dpi, name):
+    # runs in a worker process: draws the pickled figure with Agg into the shared
+    # memory block with the given name and returns the size of the image.
+    # Animated artists (the overlays) are left out, the gui draws those itself
+    figure = pickle.loads(data)
+    figure.set_dpi(dpi)
+    canvas = FigureCanvasAgg(figure)
+    canvas.draw()
+    width, height = canvas.get_width_height(physical=True)
+    pixels = np.asarray(canvas.buffer_rgba()).reshape(-1)
+    memory = SharedMemory(name=name)
+    try:
+        if memory.size < pixels.size:
+            raise ValueError("the shared memory block is too small for the figure")
+        np.frombuffer(memory.buf, dtype=np.uint8, count=pixels.size)[:] = pixels
+    finally:
+        memory.close()
+    return width, height
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+# a condition only gives the rows to check the others on when it keeps at
+# most this part of the rows. Taking more rows from an index and sorting
+# them is slower than going through all rows
+candidateShare = 0.25
+# a condition keeping at most this many rows (and at most candidateShare of
+# them) gives the rows right away, the indexes of the others (which may still
+# have to be made) are not asked
+directRows = 4096
+
+
+class RangeCondition:
+    # the rows with a number from low to high (both included) in a column
+
+    def __init__(self, name, low, high):
+        self.name = name
+        self.low = low
+        self.high = high
+
+    def estimate(self, dataset):
+        # how many rows are kept, all rows when the dataset has no sorted index
+        index = dataset.sortedIndex(self.name)
+        if index is None:
+            return dataset.nrows
+        start, stop = index.span(self.low, self.high)
+        return stop - start
+
+    def rows(self, dataset):
+        return dataset.sortedIndex(self.name).rows(self.low, self.high)
+
+    def mask(self, dataset, rows):
+        values = np.asarray(dataset.values(self.name, rows), dtype=float)
+        return (values >= self.low) & (values <= self.high)
+
+
+class ValueCondition:
+    # the rows with one of the values in a column, and the missing ones when missing is true
+
+    def __init__(self, name, values, missing=False):
+        self.name = name
+        self.values = list(values)
+        self.missing = missing
+
+    def codes(self, dataset):
+        index = dataset.valueIndex(self.name)
+        wanted = pd.Index(index.values).isin(self.values)
+        return list(np.flatnonzero(wanted)) + ([-1] if self.missing else [])
+
+    def estimate(self, dataset):
+        index = dataset.valueIndex(self.name)
+        return int(sum(index.counts[code] if code >= 0 else index.missing for code in self.codes(dataset)))
+
+    def rows(self, dataset):
+        return np.flatnonzero(dataset.valueIndex(self.name).mask(self.codes(dataset)))
+
+    def mask(self, dataset, rows):
+        keys = pd.Series(dataset.values(self.name, rows))
+        return (keys.isin(self.values) | (self.missing & keys.isna())).to_numpy()
+
+
+class RowsCondition:
+    # the rows of a view, given as its sorted row ids or None for all rows
+
+    def __init__(self, rows):
+        self.rowIds = rows
+
+    def estimate(self, dataset):
+        return dataset.nrows if self.rowIds is None else len(self.rowIds)
+
+    def rows(self, dataset):
+        return np.arange(dataset.nrows) if self.rowIds is None else self.rowIds
+
+    def mask(self, dataset, rows):
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(dataset.nrows)
+            if step == 1:
+                # the row ids of a block are found with two binary searches
+                mask = np.zeros(max(stop - start, 0), dtype=bool)
+                if self.rowIds is None:
+                    mask[:] = True
+                else:
+                    first, last = np.searchsorted(self.rowIds, [start, stop])
+                    mask[self.rowIds[first:last] - start] = True
+                return mask
+            rows = np.arange(start, stop, step)
+        rows = np.asarray(rows)
+        if self.rowIds is None:
+            return np.ones(len(rows), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.rowIds, rows), max(len(self.rowIds) - 1, 0))
+        return self.rowIds[positions] == rows if len(self.rowIds) > 0 else np.zeros(len(rows), dtype=bool)
+
+
+class CompiledFilter:
+    # conditions of several widgets that must all hold, put in the order they
+    # are cheapest to check. When the most selective condition keeps few rows
+    # its index gives them and the others are only checked on those rows.
+    # Otherwise every condition checks the rows a block at a time, each only
+    # on the rows the ones before kept
+
+    def __init__(self, dataset, conditions):
+        self.dataset = dataset
+        estimates = []
+        for condition in conditions:
+            estimates.append(condition.estimate(dataset))
+            if estimates[-1] <= min(directRows, candidateShare * dataset.nrows):
+                break
+        order = list(np.argsort(estimates, kind="stable")) + list(range(len(estimates), len(conditions)))
+        self.conditions = [conditions[i] for i in order]
+        self.useIndex = len(conditions) > 0 and estimates[order[0]] <= candidateShare * dataset.nrows
+
+    def rows(self):
+        # the sorted row ids for which all conditions hold
+        if self.useIndex:
+            rows = self.conditions[0].rows(self.dataset)
+            for condition in self.conditions[1:]:
+                rows = rows[condition.mask(self.dataset, rows)]
+            return rows
+        size = self.dataset.blockRows or max(self.dataset.nrows, 1)
+        parts = [np.array([], dtype=np.intp)]
+        for start in range(0, self.dataset.nrows, size):
+            rows = np.arange(start, min(start + size, self.dataset.nrows))
+            part = slice(start, start + len(rows))
+            for condition in self.conditions:
+                keep = condition.mask(self.dataset, part)
+                rows = rows[keep]
+                part = rows
+            parts.append(rows)
+        return np.concatenate(parts)
+
+    def mask(self, rows):
+        # for some row ids whether all conditions hold
+        keep = np.ones(len(rows), dtype=bool)
+        for condition in self.conditions:
+            keep[keep] = condition.mask(self.dataset, np.asarray(rows)[keep])
+        return keep
+
+
+def compileFilter(dataset, conditions):
+    return CompiledFilter(dataset, conditions)
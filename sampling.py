@@ -0,0 +1,41 @@
+import numpy as np
+
+# in a stratified sample every value gets at least this many rows (when it has them)
+minStratum = 50
+
+
+def strata(view, column):
+    # the stratum of the rows of the view a block at a time: the code of the
+    # value plus one, 0 for missing values. Without a column all rows are one stratum
+    for part in view.parts():
+        if column is None:
+            size = len(range(view.dataset.nrows)[part]) if isinstance(part, slice) else len(part)
+            yield np.zeros(size, dtype=np.intp)
+        else:
+            yield view.dataset.codes(column, part).astype(np.intp) + 1
+
+
+def stratifiedSample(view, column, size, seed=0):
+    # the sorted positions in the view of a random sample of about size rows.
+    # Every value of the column gets the same share of the sample as it has of
+    # the view, but at least minStratum rows so rare values (like the positive
+    # exam results) are in it too. Every row is drawn with the chance of its
+    # value, one block at a time, so a mapped view is not read at once
+    n = len(view)
+    if size >= n:
+        return np.arange(n)
+    counts = np.zeros(1)
+    for codes in strata(view, column):
+        blockCounts = np.bincount(codes)
+        if len(blockCounts) > len(counts):
+            counts = np.concatenate([counts, np.zeros(len(blockCounts) - len(counts))])
+        counts[:len(blockCounts)] += blockCounts
+    quotas = np.minimum(counts, np.maximum(size * counts / n, minStratum))
+    chances = quotas / np.maximum(counts, 1)
+    rng = np.random.default_rng(seed)
+    positions = []
+    offset = 0
+    for codes in strata(view, column):
+        positions.append(offset + np.flatnonzero(rng.random(len(codes)) < chances[codes]))
+        offset += len(codes)
+    return np.concatenate(positions)
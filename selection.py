@@ -0,0 +1,66 @@
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# the number of set bits of every byte
+bitCounts = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def bitRows(bits):
+    # the row ids of the set bits. Only the bytes that are not zero are
+    # unpacked, so no flag per row is made for a large dataset
+    nonzero = np.flatnonzero(bits)
+    byteIdx, bit = np.nonzero(np.unpackbits(bits[nonzero][:, None], axis=1))
+    return nonzero[byteIdx] * 8 + bit
+
+
+class SelectionModel(QObject):
+    # the highlighted rows, shared by all vises: clicking a bar or a point
+    # selects rows here and every vis shows them. The rows are kept as a bit
+    # per row id of the dataset, so a vis looks up all its rows at once
+
+    # the row ids whose bit changed
+    changed = pyqtSignal(object)
+
+    def __init__(self, nrows=0, parent=None):
+        super(SelectionModel, self).__init__(parent)
+        self.reset(nrows)
+
+    def reset(self, nrows):
+        # a new dataset, nothing is selected and nobody is told
+        self.nrows = nrows
+        self.bits = np.zeros((nrows + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def grow(self, nrows):
+        # rows were added to the dataset, they are not selected
+        bits = np.zeros((nrows + 7) // 8, dtype=np.uint8)
+        bits[:len(self.bits)] = self.bits
+        self.nrows = nrows
+        self.bits = bits
+
+    def isEmpty(self):
+        return self.count == 0
+
+    def contains(self, rows):
+        # for every row id whether it is selected
+        rows = np.asarray(rows, dtype=np.intp)
+        return (self.bits[rows >> 3] >> (7 - (rows & 7)).astype(np.uint8)) & 1 == 1
+
+    def rows(self):
+        return bitRows(self.bits)
+
+    def setRows(self, rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        bits = np.zeros_like(self.bits)
+        np.bitwise_or.at(bits, rows >> 3, (0x80 >> (rows & 7)).astype(np.uint8))
+        self.setBits(bits)
+
+    def clear(self):
+        self.setBits(np.zeros_like(self.bits))
+
+    def setBits(self, bits):
+        changed = bitRows(bits ^ self.bits)
+        self.bits = bits
+        self.count = int(bitCounts[bits].sum())
+        if len(changed) > 0:
+            self.changed.emit(changed)
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+class GridIndex:
+    # nearest point lookups for the points of one panel. The points are scaled
+    # to the unit square (the x and y attributes have different units) and
+    # bucketed in a uniform grid, a lookup only looks at the cells around the
+    # clicked position so it takes the same time however many points there are
+
+    # average number of points per cell
+    cellSize = 4
+
+    def __init__(self, x, y, rows):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.xmin = x.min()
+        self.ymin = y.min()
+        self.xscale = 1.0 / ((x.max() - self.xmin) or 1.0)
+        self.yscale = 1.0 / ((y.max() - self.ymin) or 1.0)
+        self.size = max(1, int(np.sqrt(len(x) / self.cellSize)))
+
+        px = (x - self.xmin) * self.xscale
+        py = (y - self.ymin) * self.yscale
+        cells = self.cell(py) * self.size + self.cell(px)
+        order = np.argsort(cells, kind="stable")
+        # the points of cell c are order[starts[c]:starts[c + 1]]
+        self.starts = np.searchsorted(cells[order], np.arange(self.size * self.size + 1))
+        self.px = px[order]
+        self.py = py[order]
+        self.x = x[order]
+        self.y = y[order]
+        self.rows = np.asarray(rows)[order]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def cell(self, p):
+        return np.clip((p * self.size).astype(int), 0, self.size - 1)
+
+    def nearest(self, x, y):
+        # returns (row id, x, y) of the closest point or None when there are no points
+        if len(self.rows) == 0:
+            return None
+        qx = (x - self.xmin) * self.xscale
+        qy = (y - self.ymin) * self.yscale
+        # a click outside the points is at least this far from all of them
+        outside = (qx - np.clip(qx, 0, 1)) ** 2 + (qy - np.clip(qy, 0, 1)) ** 2
+        cx = int(self.cell(np.array([qx]))[0])
+        cy = int(self.cell(np.array([qy]))[0])
+        width = 1.0 / self.size
+
+        best = np.inf
+        bestIdx = -1
+        for ring in range(self.size):
+            for idx in self.ringPoints(cx, cy, ring):
+                dist = (self.px[idx] - qx) ** 2 + (self.py[idx] - qy) ** 2
+                i = np.argmin(dist)
+                if dist[i] < best:
+                    best = dist[i]
+                    bestIdx = idx[i]
+            # the points in the next rings are at least ring cells away
+            if bestIdx >= 0 and best <= outside + (ring * width) ** 2:
+                break
+        return self.rows[bestIdx], self.x[bestIdx], self.y[bestIdx]
+
+    def ringPoints(self, cx, cy, ring):
+        # the indexes of the points in the cells exactly ring cells away from (cx, cy)
+        lo = max(cy - ring, 0)
+        hi = min(cy + ring, self.size - 1)
+        for gy in range(lo, hi + 1):
+            if abs(gy - cy) == ring:
+                xs = range(max(cx - ring, 0), min(cx + ring, self.size - 1) + 1)
+            else:
+                xs = [gx for gx in (cx - ring, cx + ring) if 0 <= gx < self.size]
+            for gx in xs:
+                c = gy * self.size + gx
+                if self.starts[c] < self.starts[c + 1]:
+                    yield np.arange(self.starts[c], self.starts[c + 1])
+
+
+def binnedPoints(blocks, xrange, yrange, bins):
+    # one point of every bin of a bins x bins grid over the ranges that has
+    # points, the first one the blocks give in it. blocks gives (row ids, x, y)
+    # arrays. A GridIndex of these finds a point in the bin that was clicked
+    # while it holds at most bins * bins points however many points there are.
+    # Returns the row ids, x and y of the points
+    seen = np.zeros(bins * bins, dtype=bool)
+    parts = [(np.array([], dtype=np.intp), np.array([]), np.array([]))]
+    for rows, x, y in blocks:
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        known = ~(np.isnan(x) | np.isnan(y))
+        rows, x, y = np.asarray(rows)[known], x[known], y[known]
+        cx = np.clip(((x - xrange[0]) / (xrange[1] - xrange[0]) * bins).astype(np.intp), 0, bins - 1)
+        cy = np.clip(((y - yrange[0]) / (yrange[1] - yrange[0]) * bins).astype(np.intp), 0, bins - 1)
+        cells, first = np.unique(cx * bins + cy, return_index=True)
+        new = ~seen[cells]
+        seen[cells[new]] = True
+        first = first[new]
+        parts.append((rows[first], x[first], y[first]))
+    return tuple(np.concatenate(values) for values in zip(*parts))
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# the vises are made without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+# the modules of the program are next to each other at the top of the repository
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import loader
+
+datasetPath = os.path.join(root, "dataset.csv")
+
+
+@pytest.fixture(scope="session")
+def frame(tmp_path_factory):
+    # dataset.csv as the program loads it, parsed into a cache of its own
+    cacheDir = loader.cacheDir
+    loader.cacheDir = str(tmp_path_factory.mktemp("cache"))
+    try:
+        yield loader.CsvLoader(datasetPath).load()
+    finally:
+        loader.cacheDir = cacheDir
+
+
+@pytest.fixture(scope="session")
+def text():
+    # the rows of dataset.csv as text, the way a followed file reads the rows written to it
+    return pd.read_csv(datasetPath, sep=loader.sniffSeparator(datasetPath), dtype=object, encoding="utf-8")
+
+
+@pytest.fixture(scope="session")
+def app():
+    # the application the vises need, their computations run in a thread like in batch.py
+    import batch
+    import workers
+    workers.inProcess = True
+    yield batch.application()
+    workers.shutdownPool()
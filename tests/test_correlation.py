@@ -0,0 +1,69 @@
+import numpy as np
+
+import correlation
+from batch import BatchHost, waitFor
+from correlation import PairStats
+from dataset import Dataset
+from plots import CorrelationMatrix
+
+columns = ["Patient age quantile", "Hematocrit", "Hemoglobin", "Platelets", "Leukocytes", "Serum Glucose",
+           "Patient addmited to intensive care unit (1=yes, 0=no)"]
+
+
+def reference(frame, mask):
+    # the one-shot pairwise complete statistics of pandas over the rows of the mask
+    values = frame[columns].astype(float)[mask]
+    known = values.notna().to_numpy(dtype=float)
+    return values.corr(min_periods=2), values.cov(min_periods=2), known.T @ known
+
+
+def check(stats, frame, mask):
+    corr, cov, count = reference(frame, mask)
+    result = stats.result()
+    np.testing.assert_array_equal(result.count, count)
+    np.testing.assert_allclose(result.corr, corr.to_numpy(), rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(result.cov, cov.to_numpy(), rtol=1e-9, atol=1e-12)
+
+
+def test_rows_added_in_chunks_match_pandas(frame, monkeypatch):
+    # small blocks, so the sums are also made over several blocks of a chunk
+    monkeypatch.setattr(correlation, "blockBytes", 32 * len(columns) * 500)
+    stats = PairStats(Dataset(frame), columns)
+    mask = np.zeros(len(frame), dtype=bool)
+    # the first rows only have the age, most lab values are missing in every chunk
+    for stop in (50, 600, 1700, 3100, len(frame)):
+        mask[:stop] = True
+        stats.update(mask)
+        check(stats, frame, mask)
+
+
+def test_rows_removed_and_added_match_pandas(frame):
+    stats = PairStats(Dataset(frame), columns)
+    rng = np.random.default_rng(0)
+    mask = rng.random(len(frame)) < 0.5
+    stats.update(mask)
+    check(stats, frame, mask)
+    # a few rows change, they are added and taken away
+    changed = rng.choice(len(frame), 200, replace=False)
+    mask[changed] = ~mask[changed]
+    stats.update(mask)
+    check(stats, frame, mask)
+    # most rows are taken away, the sums are made again from the rows that are left
+    mask = np.zeros(len(frame), dtype=bool)
+    mask[rng.choice(len(frame), 300, replace=False)] = True
+    stats.update(mask)
+    check(stats, frame, mask)
+
+
+def test_matrix_fills_in_from_the_worker(app, frame):
+    # the vis is shown before the sums are made, they come in through the event loop
+    dataset = Dataset(frame)
+    view = dataset.all().withColumns(columns)
+    correlation.cache.clear()
+    vis = CorrelationMatrix(BatchHost(view), view)
+    assert vis.result is None and not vis.complete()
+    waitFor(app, vis)
+    corr, cov, count = reference(frame, np.ones(len(frame), dtype=bool))
+    np.testing.assert_allclose(vis.result.corr, corr.to_numpy(), rtol=1e-9, atol=1e-9)
+    assert vis.image.get_array().count() == np.count_nonzero(count >= vis.minCount)
+    vis.deleteLater()
@@ -0,0 +1,38 @@
+import numpy as np
+from matplotlib.backend_bases import MouseEvent
+
+from batch import BatchHost, waitFor
+from dataset import Dataset
+from plots import Correlogram
+
+
+def click(vis, panel, x=None, y=None):
+    # at the point (x, y) of the panel, or the middle of it
+    ax = vis.figure.axes[panel[0]][panel[1]]
+    if x is None:
+        px, py = (ax.bbox.x0 + ax.bbox.x1) / 2, (ax.bbox.y0 + ax.bbox.y1) / 2
+    else:
+        px, py = ax.transData.transform((x, y))
+    vis.onclick(MouseEvent("button_press_event", vis.vis, px, py, 1))
+
+
+def test_click_on_a_panel_without_points(app, frame):
+    # both columns have values, but no row of dataset.csv has both
+    columns = ["Hematocrit", "Hemoglobin", "Alanine transaminase", "Fio2 (venous blood gas analysis)"]
+    dataset = Dataset(frame)
+    view = dataset.all().withColumns(columns)
+    vis = Correlogram(BatchHost(view), view)
+    waitFor(app, vis)
+    i, j = (vis.columns.index(name) for name in columns[2:])
+    for panel in ((i, j), (j, i)):
+        click(vis, panel)
+        assert vis.indexes[panel] is None and vis.annot is None
+    # a panel with points still shows the clicked one
+    i, j = (vis.columns.index(name) for name in columns[:2])
+    x = dataset.column(columns[1])
+    y = dataset.column(columns[0])
+    row = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))[0]
+    click(vis, (i, j), x[row], y[row])
+    assert vis.annotRow == row
+    vis.cancel()
+    vis.deleteLater()
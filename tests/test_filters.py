@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from dataset import Dataset
+from main import rangeIds
+from rowfilter import CompiledFilter, RangeCondition, RowsCondition, ValueCondition
+
+# columns of dataset.csv stored as text categories, small integers and sparse floats with many missing values
+columns = ["SARS-Cov-2 exam result", "Patient age quantile", "Hematocrit", "Respiratory Syncytial Virus"]
+
+
+def referenceRows(frame, name, values, missing):
+    # the rows of the condition from a plain pandas mask over the whole column
+    column = frame[name]
+    mask = column.isin(values).to_numpy()
+    if missing:
+        mask = mask | column.isna().to_numpy()
+    return np.flatnonzero(mask)
+
+
+def someValues(frame, name):
+    # the most common value and a rare one
+    counts = frame[name].value_counts()
+    return [counts.index[0], counts.index[-1]]
+
+
+def appendedText(text):
+    # rows written to a followed file: a copy of some rows, then rows with
+    # values the file did not have and missing values in every column
+    more = text.iloc[1000:1400].copy()
+    more["SARS-Cov-2 exam result"] = "inconclusive"
+    more["Patient age quantile"] = "25"
+    more.loc[more.index[::3], "Hematocrit"] = np.nan
+    more.loc[more.index[::5], "Respiratory Syncytial Virus"] = np.nan
+    return [text.iloc[:300], more]
+
+
+def test_range_ids_merge_like_a_mask():
+    rng = np.random.default_rng(0)
+    cases = [([], []), ([4], [4]), ([0, 3], [2, 5]), ([5, 0], [9, 20]), ([2, 2, 8], [6, 3, 8])]
+    for i in range(50):
+        firsts = rng.integers(0, 1000, rng.integers(1, 40))
+        cases.append((firsts, firsts + rng.integers(0, 60, len(firsts))))
+    for firsts, lasts in cases:
+        mask = np.zeros(1100, dtype=bool)
+        for first, last in zip(firsts, lasts):
+            mask[first:last + 1] = True
+        np.testing.assert_array_equal(rangeIds(firsts, lasts), np.flatnonzero(mask))
+
+
+@pytest.mark.parametrize("name", columns)
+@pytest.mark.parametrize("missing", [False, True])
+def test_value_condition_matches_pandas(frame, name, missing):
+    dataset = Dataset(frame)
+    values = someValues(frame, name)
+    condition = ValueCondition(name, values, missing)
+    expected = referenceRows(frame, name, values, missing)
+    np.testing.assert_array_equal(condition.rows(dataset), expected)
+    assert condition.estimate(dataset) == len(expected)
+    # checking given rows or a block of rows gives the same rows
+    rows = np.arange(0, dataset.nrows, 7)
+    np.testing.assert_array_equal(rows[condition.mask(dataset, rows)], np.intersect1d(rows, expected))
+    block = slice(1000, 3000)
+    np.testing.assert_array_equal(np.flatnonzero(condition.mask(dataset, block)) + 1000,
+                                  expected[(expected >= 1000) & (expected < 3000)])
+
+
+def test_value_condition_of_missing_only(frame):
+    dataset = Dataset(frame)
+    condition = ValueCondition("Hematocrit", [], True)
+    np.testing.assert_array_equal(condition.rows(dataset), np.flatnonzero(frame["Hematocrit"].isna().to_numpy()))
+
+
+def test_extended_value_index_matches_pandas(frame, text):
+    dataset = Dataset(frame)
+    nrows = dataset.nrows
+    for name in columns:
+        dataset.valueIndex(name)
+    for part in appendedText(text):
+        dataset.append(part)
+        for name in columns:
+            index = dataset.valueIndexes[name]
+            # the index is extended with the new rows instead of made again
+            assert index.sortedRows == nrows and index.nrows == dataset.nrows
+            counts = dataset.frame[name].value_counts()
+            for code, value in enumerate(index.values):
+                assert index.counts[code] == counts[value]
+            assert index.missing == dataset.frame[name].isna().sum()
+            for missing in (False, True):
+                values = someValues(dataset.frame, name)
+                expected = referenceRows(dataset.frame, name, values, missing)
+                np.testing.assert_array_equal(ValueCondition(name, values, missing).rows(dataset), expected)
+    # the values only the appended rows have are found too
+    expected = referenceRows(dataset.frame, "SARS-Cov-2 exam result", ["inconclusive"], False)
+    assert len(expected) == 400 and expected[0] >= nrows
+    np.testing.assert_array_equal(ValueCondition("SARS-Cov-2 exam result", ["inconclusive"]).rows(dataset),
+                                  expected)
+
+
+@pytest.mark.parametrize("appended", [False, True])
+def test_compiled_filter_starts_from_the_most_selective(frame, text, appended):
+    dataset = Dataset(frame)
+    if appended:
+        dataset.valueIndex("SARS-Cov-2 exam result")
+        for part in appendedText(text):
+            dataset.append(part)
+    data = dataset.frame
+    rows = np.arange(0, dataset.nrows, 2)
+    conditions = [RangeCondition("Patient age quantile", 0, 30),
+                  RowsCondition(rows),
+                  ValueCondition("SARS-Cov-2 exam result", ["positive"]),
+                  ValueCondition("Hematocrit", [], True)]
+    rowFilter = CompiledFilter(dataset, conditions)
+    assert rowFilter.useIndex and rowFilter.conditions[0] is conditions[2]
+    mask = np.zeros(dataset.nrows, dtype=bool)
+    mask[rows] = True
+    mask &= data["Patient age quantile"].between(0, 30).to_numpy()
+    mask &= (data["SARS-Cov-2 exam result"] == "positive").to_numpy()
+    mask &= data["Hematocrit"].isna().to_numpy()
+    np.testing.assert_array_equal(rowFilter.rows(), np.flatnonzero(mask))
+    np.testing.assert_array_equal(rowFilter.mask(np.arange(dataset.nrows)), mask)
+
+
+def test_compiled_filter_of_wide_conditions(frame):
+    # no condition keeps few enough rows, all rows are checked a block at a time
+    dataset = Dataset(frame)
+    dataset.blockRows = 1000
+    low, high = frame["Patient age quantile"].quantile([0.1, 0.9])
+    conditions = [RangeCondition("Patient age quantile", low, high), ValueCondition("Hematocrit", [], True)]
+    rowFilter = CompiledFilter(dataset, conditions)
+    assert not rowFilter.useIndex
+    expected = frame["Patient age quantile"].between(low, high) & frame["Hematocrit"].isna()
+    np.testing.assert_array_equal(rowFilter.rows(), np.flatnonzero(expected.to_numpy()))
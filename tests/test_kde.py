@@ -0,0 +1,26 @@
+import itertools
+
+import numpy as np
+
+from panels import kdePanels, kdeStats, pairValues
+
+# the lab values of dataset.csv, Hematocrit and Hemoglobin are almost on a line
+columns = ["Hematocrit", "Hemoglobin", "Platelets", "Mean platelet volume ", "Lymphocytes", "Leukocytes"]
+# how far the binned kde may be from the exact one, as a part of the peak of
+# the exact one: at most for any pair and the median over the pairs (see the readme)
+maxError = 0.015
+medianError = 0.002
+
+
+def test_binned_kde_is_close_to_the_exact_one(frame):
+    pairs = [(frame[x].to_numpy(dtype=float), frame[y].to_numpy(dtype=float))
+             for x, y in itertools.combinations(columns, 2)]
+    errors = []
+    for (x, y), binned in zip(pairs, kdePanels(pairs)):
+        x, y, _ = pairValues(x, y, np.arange(len(x)))
+        exact = kdeStats(x, y)
+        np.testing.assert_allclose(binned["x"], exact["x"])
+        np.testing.assert_allclose(binned["y"], exact["y"])
+        errors.append(np.abs(binned["density"] - exact["density"]).max() / exact["density"].max())
+    assert max(errors) <= maxError
+    assert np.median(errors) <= medianError
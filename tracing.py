@@ -0,0 +1,134 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+# spans are only recorded while this is true, when it is false a span costs one
+# check of this flag
+enabled = False
+# whether the spans also record the memory allocated during them (with
+# tracemalloc, which makes everything slower while it is on)
+memory = False
+# the finished spans of the session as chrome trace events, the oldest are
+# dropped when there are more than maxEvents
+maxEvents = 200000
+events = deque(maxlen=maxEvents)
+# called on the gui thread with every finished span that is not inside another span
+listener = None
+
+local = threading.local()
+mainThread = threading.main_thread()
+# the trace thread of the spans that wait for the worker processes, they overlap
+# with the spans of the gui thread so they get a row of their own
+waitThread = 0
+
+
+def start(withMemory=False):
+    global enabled, memory
+    memory = withMemory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    enabled = True
+
+
+def stop():
+    global enabled, memory
+    enabled = False
+    if memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    memory = False
+
+
+def clear():
+    events.clear()
+
+
+def now():
+    # microseconds, the unit of chrome traces
+    return time.perf_counter_ns() // 1000
+
+
+class Span:
+    # one timed phase, use it with "with"
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.memoryStart = None
+
+    def __enter__(self):
+        self.depth = getattr(local, "depth", 0)
+        local.depth = self.depth + 1
+        if memory and tracemalloc.is_tracing():
+            if self.depth == 0:
+                tracemalloc.reset_peak()
+            self.memoryStart = tracemalloc.get_traced_memory()[0]
+        self.start = now()
+        return self
+
+    def __exit__(self, *exc):
+        end = now()
+        local.depth = self.depth
+        args = dict(self.args)
+        if self.memoryStart is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            args["allocated bytes"] = current - self.memoryStart
+            if self.depth == 0:
+                args["peak bytes"] = peak - self.memoryStart
+        record(self.name, self.start, end, args)
+        if self.depth == 0 and listener is not None and threading.current_thread() is mainThread:
+            listener(self.name, (end - self.start) / 1e6, args)
+        return False
+
+
+class NoSpan:
+    # what span gives when tracing is off
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+noSpan = NoSpan()
+
+
+def span(name, **args):
+    if not enabled:
+        return noSpan
+    return Span(name, args)
+
+
+def traced(function):
+    # records a span named after the method for every call
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        with Span(name, {}):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def record(name, start, end, args=None, tid=None):
+    # a span that was not timed with "with", like waiting for a worker
+    if enabled:
+        events.append({"name": name, "ph": "X", "ts": start, "dur": end - start, "pid": os.getpid(),
+                       "tid": threading.get_ident() if tid is None else tid, "args": args or {}})
+
+
+def export(path):
+    # a chrome trace, it can be opened in chrome://tracing or ui.perfetto.dev
+    threads = {event["tid"] for event in events}
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    names[waitThread] = "waiting for workers"
+    metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                 "args": {"name": names.get(tid, "thread %d" % tid)}} for tid in threads]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": metadata + list(events), "displayTimeUnit": "ms"}, f)
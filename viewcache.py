@@ -0,0 +1,52 @@
+from collections import OrderedDict
+
+
+class ViewCache:
+    # the built vises that are not shown at the moment, keyed by (vis type,
+    # dataset token, filter fingerprint), so going back to a vis that would look
+    # the same does not build it again. When the vises together use more than
+    # memoryBudget bytes the least recently used ones are deleted
+
+    memoryBudget = 512 * 1024 * 1024
+
+    def __init__(self):
+        # key -> (vis, its option widgets, estimated bytes)
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def take(self, key):
+        # removes the vis from the cache and returns (vis, options) or None
+        if key not in self.entries:
+            return None
+        vis, options, size = self.entries.pop(key)
+        self.size -= size
+        return vis, options
+
+    def put(self, key, vis, options, size):
+        if key in self.entries:
+            self.discard(key)
+        self.entries[key] = (vis, options, size)
+        self.size += size
+        while self.size > self.memoryBudget and len(self.entries) > 1:
+            self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        vis, options, size = self.entries.pop(key)
+        self.size -= size
+        if hasattr(vis, "cancel"):
+            # the vis can still be computing or drawing
+            vis.cancel()
+        vis.deleteLater()
+        for option in options:
+            option.deleteLater()
+
+    def invalidate(self, stale):
+        # deletes the vises whose key stale(key) says are out of date
+        for key in [key for key in self.entries if stale(key)]:
+            self.discard(key)
+
+    def clear(self):
+        self.invalidate(lambda key: True)
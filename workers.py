@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# one pool of worker processes shared by all vises, started the first time it is needed
+pool = None
+# the number of processes of the pool, None for one per cpu
+workerCount = None
+# a thread for the light work that has to stay in this process (like filtering views)
+threadPool = None
+# the batch renderer already runs every job in a process of its own, there the
+# vises do their computations in a thread instead of starting more processes
+inProcess = False
+
+
+def getPool():
+    global pool
+    if inProcess:
+        return getThreadPool()
+    if pool is None:
+        # spawn instead of fork, forking a process that is running Qt is not safe
+        pool = ProcessPoolExecutor(max_workers=workerCount or os.cpu_count() or 1,
+                                   mp_context=multiprocessing.get_context("spawn"))
+    return pool
+
+
+def getThreadPool():
+    global threadPool
+    if threadPool is None:
+        threadPool = ThreadPoolExecutor(max_workers=1)
+    return threadPool
+
+
+def shutdownPool():
+    global pool, threadPool
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        pool = None
+    if threadPool is not None:
+        threadPool.shutdown(wait=False, cancel_futures=True)
+        threadPool = None
+
+
+class FutureWatcher(QObject):
+
+    # emitted on the gui thread with the tag given to watch and the finished future
+    done = pyqtSignal(object, object)
+
+    def watch(self, future, tag):
+        # the callback runs on a thread of the pool, the signal brings it to the gui thread
+        future.add_done_callback(lambda f: self.emitDone(tag, f))
+        return future
+
+    def emitDone(self, tag, future):
+        if future.cancelled():
+            return
+        try:
+            self.done.emit(tag, future)
+        except RuntimeError:
+            # the vis that was waiting for it is already deleted
+            pass